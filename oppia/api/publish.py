@@ -1,16 +1,17 @@
 # This is a workaround since Tastypie doesn't accept file Uploads
-import os
 
 from django.conf import settings
 from django.contrib.auth import authenticate
-from django.http import HttpResponseRedirect, Http404, HttpResponse
+from django.core.urlresolvers import reverse
+from django.http import HttpResponseRedirect, Http404, HttpResponse, JsonResponse
 from django.shortcuts import render,render_to_response
 from django.template import RequestContext
 from django.views.decorators.csrf import csrf_exempt
 
-from oppia.uploader import handle_uploaded_file
-from oppia.models import Tag, CourseTag
-from django.contrib import messages
+from tastypie.authentication import ApiKeyAuthentication
+
+from oppia.models import PublishJob
+from oppia.publishing import add_job
 
 @csrf_exempt
 def publish_view(request):
@@ -41,39 +42,32 @@ def publish_view(request):
     if settings.OPPIA_STAFF_ONLY_UPLOAD is True and not user.is_staff and user.userprofile.can_upload is False:
         return HttpResponse(status=401)
             
-    extract_path = os.path.join(settings.COURSE_UPLOAD_DIR,'temp',str(user.id))
-    course = handle_uploaded_file(request.FILES['course_file'], extract_path, request, user)
+    # the course is imported in the background, the client can then poll
+    # the status URL until the job is done
+    f = request.FILES['course_file']
+    job = add_job(user, f, request.POST['is_draft'] != "False", request.POST['tags'])
 
-    if course is False:
-        return HttpResponse(status=500)
+    response_data = job.to_dict()
+    response_data['status_url'] = reverse('oppia_publish_status', args=[job.id])
+    if job.status == PublishJob.DONE:
+        status = 201
+    elif job.status == PublishJob.FAILED:
+        status = 500
     else:
-        if request.POST['is_draft'] == "False":
-            course.is_draft = False
-        else:
-            course.is_draft = True
-        course.save()
-        
-        # remove any existing tags
-        CourseTag.objects.filter(course=course).delete()
-        
-        # add tags
-        tags = request.POST['tags'].strip().split(",")
-        for t in tags:
-            try: 
-                tag = Tag.objects.get(name__iexact=t.strip())
-            except Tag.DoesNotExist:
-                tag = Tag()
-                tag.name = t.strip()
-                tag.created_by = user
-                tag.save()
-            # add tag to course
-            try:
-                ct = CourseTag.objects.get(course=course,tag=tag)
-            except CourseTag.DoesNotExist:
-                ct = CourseTag()
-                ct.course = course
-                ct.tag = tag
-                ct.save()
-        
-        return HttpResponse(status=201)
-    
\ No newline at end of file
+        status = 202
+    return JsonResponse(response_data, status=status)
+
+
+def publish_status_view(request, job_id):
+    # authenticated with the user's api_key (or an existing login)
+    if not request.user.is_authenticated() and ApiKeyAuthentication().is_authenticated(request) is not True:
+        return HttpResponse(status=401)
+
+    try:
+        job = PublishJob.objects.get(pk=job_id)
+    except PublishJob.DoesNotExist:
+        raise Http404()
+    if job.user != request.user and not request.user.is_staff:
+        return HttpResponse(status=401)
+
+    return JsonResponse(job.to_dict())
@@ -1,9 +1,6 @@
 # oppia/api/resources.py
 import datetime
 import json
-import os
-import shutil
-import zipfile
 
 from django.conf.urls import url
 from django.contrib.auth.models import User
@@ -11,13 +8,12 @@ from django.contrib.auth import authenticate, login
 from django.conf import settings
 from django.core import serializers
 from django.core.mail import send_mail
-from wsgiref.util import FileWrapper
 from django.core.files.base import ContentFile
 from django.utils.six import b
 
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
 from django.db.models import Sum
-from django.http import HttpRequest, HttpResponse ,Http404
+from django.http import HttpRequest, HttpResponse ,Http404, HttpResponseNotModified, StreamingHttpResponse
 from django.utils.translation import ugettext_lazy as _
 
 from tastypie import fields, bundle, http
@@ -32,11 +28,14 @@ from tastypie.utils import trailing_slash
 from tastypie.validation import Validation
 
 from oppia.api.serializers import PrettyJSONSerializer, CourseJSONSerializer, UserJSONSerializer
+from oppia.catalogue import catalogue_etag, get_schedule, get_static_data, with_catalogue_related
+from oppia.digests import get_digest, get_digests
+from oppia.downloads import CoursePackage, course_etag, delta_package, etag_matches, file_response, is_new_download
 from oppia.models import Activity, Section, Tracker, Course, Media, Schedule, ActivitySchedule, Cohort, Tag, CourseTag
 from oppia.models import Points, Award, Badge
 from oppia.profile.forms import RegisterForm
 from oppia.profile.models import UserProfile
-from oppia.signals import course_downloaded
+from oppia.signals import course_downloaded, trackers_created
  
 class UserResource(ModelResource):
     ''' 
@@ -108,11 +107,11 @@ class UserResource(ModelResource):
         return bundle 
     
     def dehydrate_points(self,bundle):
-        points = Points.get_userscore(User.objects.get(username=bundle.request.user.username))
+        points = Points.get_userscore(bundle.obj)
         return points
     
     def dehydrate_badges(self,bundle):
-        badges = Award.get_userawards(User.objects.get(username=bundle.request.user.username))
+        badges = Award.get_userawards(bundle.obj)
         return badges 
     
     def dehydrate_scoring(self,bundle):
@@ -125,8 +124,7 @@ class UserResource(ModelResource):
         return settings.OPPIA_METADATA
     
     def dehydrate_course_points(self,bundle):
-        course_points = list(Points.objects.exclude(course=None).filter(user=bundle.request.user).values('course__shortname').annotate(total_points=Sum('points')))
-        return course_points
+        return Points.get_course_points(bundle.obj)
 
 class RegisterResource(ModelResource):
     ''' 
@@ -213,11 +211,11 @@ class RegisterResource(ModelResource):
         return bundle   
  
     def dehydrate_points(self,bundle):
-        points = Points.get_userscore(User.objects.get(username__exact=bundle.data['username']))
+        points = Points.get_userscore(bundle.obj)
         return points
     
     def dehydrate_badges(self,bundle):
-        badges = Award.get_userawards(User.objects.get(username__exact=bundle.data['username']))
+        badges = Award.get_userawards(bundle.obj)
         return badges 
     
     def dehydrate_scoring(self,bundle):
@@ -332,69 +330,47 @@ class TrackerResource(ModelResource):
             return bundle
 
         # find out the course & activity type from the digest
-        try:
-            if 'course' in bundle.data:
-                activities = Activity.objects.filter(digest=bundle.data['digest'],section__course__shortname=bundle.data['course'])[:1]
-            else:
-                activities = Activity.objects.filter(digest=bundle.data['digest'])[:1]
-            if activities.count() > 0:
-                activity = activities[0]
-                bundle.obj.course = activity.section.course
-                bundle.obj.type = activity.type
-                bundle.obj.activity_title = activity.title
-                bundle.obj.section_title = activity.section.title
-            else:
-                bundle.obj.course = None
-                bundle.obj.type = ''
-                bundle.obj.activity_title = ''
-                bundle.obj.section_title = ''
-        except Activity.DoesNotExist:
+        # (patch_list resolves the digests for the whole batch in advance)
+        digests = getattr(bundle.request, 'digests', {})
+        if bundle.data['digest'] in digests:
+            entry = digests[bundle.data['digest']]
+        else:
+            entry = get_digest(bundle.data['digest'])
+        course_shortname = bundle.data.get('course', None)
+
+        activity = entry.get_activity(course_shortname)
+        if activity is not None:
+            bundle.obj.course_id = activity['course_id']
+            bundle.obj.type = activity['type']
+            bundle.obj.activity_title = activity['title']
+            bundle.obj.section_title = activity['section_title']
+        else:
             bundle.obj.course = None
             bundle.obj.type = ''
             bundle.obj.activity_title = ''
             bundle.obj.section_title = ''
-        
-        try:
-            if 'course' in bundle.data:
-                media_objs = Media.objects.filter(digest=bundle.data['digest'],course__shortname=bundle.data['course'])[:1]
-            else:
-                media_objs = Media.objects.filter(digest=bundle.data['digest'])[:1]
-            if media_objs.count() > 0:
-                media = media_objs[0]
-                bundle.obj.course = media.course
-                bundle.obj.type = 'media'
-        except Media.DoesNotExist:
-            pass
-        
+
+        media = entry.get_media(course_shortname)
+        if media is not None:
+            bundle.obj.course_id = media['course_id']
+            bundle.obj.type = 'media'
+
         # this try/except block is temporary until everyone is using client app v17
         try:
             json_data = json.loads(bundle.data['data'])
-            if json_data['activity'] == "completed":
-                bundle.obj.completed = True
-        except:
-            bundle.obj.completed = False
-        
-        try:
-            json_data = json.loads(bundle.data['data'])
-            if json_data['timetaken']:
-                bundle.obj.time_taken = json_data['timetaken']
         except:
-            pass
-        
-        try:
-            json_data = json.loads(bundle.data['data'])
-            if json_data['uuid']:
-                bundle.obj.uuid = json_data['uuid']
-        except:
-            pass
-        
-        try:
-            json_data = json.loads(bundle.data['data'])
-            if json_data['lang']:
-                bundle.obj.lang = json_data['lang']
-        except:
-            pass
-        
+            json_data = None
+        if not isinstance(json_data, dict):
+            json_data = {}
+
+        bundle.obj.completed = json_data.get('activity', None) == "completed"
+        if json_data.get('timetaken', None):
+            bundle.obj.time_taken = json_data['timetaken']
+        if json_data.get('uuid', None):
+            bundle.obj.uuid = json_data['uuid']
+        if json_data.get('lang', None):
+            bundle.obj.lang = json_data['lang']
+
         return bundle 
     
     def dehydrate_points(self,bundle):
@@ -415,19 +391,37 @@ class TrackerResource(ModelResource):
         return settings.OPPIA_METADATA
     
     def dehydrate_course_points(self,bundle):
-        course_points = list(Points.objects.exclude(course=None).filter(user=bundle.request.user).values('course__shortname').annotate(total_points=Sum('points')))
-        return course_points
+        return Points.get_course_points(bundle.request.user)
     
     def patch_list(self,request,**kwargs):
         request = convert_post_to_patch(request)
         deserialized = self.deserialize(request, request.body, format=request.META.get('CONTENT_TYPE', 'application/json'))
+
+        bundles = []
         for data in deserialized["objects"]:
             data = self.alter_deserialized_detail_data(request, data)
-            bundle = self.build_bundle(data=dict_strip_unicode_keys(data))
-            bundle.request.user = request.user
-            bundle.request.META['REMOTE_ADDR'] = request.META.get('REMOTE_ADDR','0.0.0.0')
-            bundle.request.META['HTTP_USER_AGENT'] = request.META.get('HTTP_USER_AGENT','unknown')
-            self.obj_create(bundle, request=request)
+            bundles.append(self.build_bundle(data=dict_strip_unicode_keys(data), request=request))
+
+        # resolve all the digests in one go, rather than once per tracker
+        request.digests = get_digests([b.data['digest'] for b in bundles if 'digest' in b.data])
+
+        trackers = []
+        for bundle in bundles:
+            bundle.obj = Tracker()
+            bundle = self.full_hydrate(bundle)
+            self.is_valid(bundle)
+            if bundle.errors:
+                raise ImmediateHttpResponse(response=self.error_response(request, bundle.errors))
+            self.authorized_create_detail(self.get_object_list(request), bundle)
+            trackers.append(bundle.obj)
+
+        # insert the whole batch at once, points are calculated for the batch
+        # as bulk_create doesn't send the post_save signal for each tracker
+        with transaction.atomic():
+            Tracker.objects.bulk_create(trackers)
+            trackers_created.send(sender=self, trackers=trackers, user=request.user)
+
+        bundle = self.build_bundle(request=request)
         response_data = {'points': self.dehydrate_points(bundle),
                          'badges':self.dehydrate_badges(bundle),
                          'scoring':self.dehydrate_scoring(bundle),
@@ -453,9 +447,23 @@ class CourseResource(ModelResource):
    
     def get_object_list(self,request):
         if request.user.is_staff:
-            return Course.objects.filter(is_archived=False)
+            courses = Course.objects.filter(is_archived=False)
+        else:
+            courses = Course.objects.filter(is_archived=False,is_draft=False)
+        return with_catalogue_related(courses)
+    
+    def get_list(self, request, **kwargs):
+        # the app requests the course list on every sync, so send a 304 if
+        # nothing in it has changed for this user
+        base_bundle = self.build_bundle(request=request)
+        courses = self.obj_get_list(bundle=base_bundle, **self.remove_api_resource_names(kwargs))
+        etag = catalogue_etag(request, courses)
+        if etag_matches(request, etag):
+            response = HttpResponseNotModified()
         else:
-            return Course.objects.filter(is_archived=False,is_draft=False)
+            response = super(CourseResource, self).get_list(request, **kwargs)
+        response['ETag'] = etag
+        return response
         
     def prepend_urls(self):
         return [
@@ -484,36 +492,47 @@ class CourseResource(ModelResource):
             except Course.DoesNotExist:
                 raise Http404(_(u"Course not found"))
          
-        file_to_download = course.getAbsPath();
-        schedule = course.get_default_schedule()
+        schedule = get_schedule(request, course)
         has_completed_trackers = Tracker.has_completed_trackers(course,request.user)
-        cohort = Cohort.member_now(course,request.user)
-        if cohort:
-            if cohort.schedule:
-                schedule = cohort.schedule
         
-        # add scheduling XML file     
-        if schedule or has_completed_trackers:
-            file_to_download = settings.COURSE_UPLOAD_DIR +"temp/"+ str(request.user.id) + "-" + course.filename
-            shutil.copy2(course.getAbsPath(), file_to_download)
-            zip = zipfile.ZipFile(file_to_download,'a')
-            if schedule:
-                zip.writestr(course.shortname +"/schedule.xml",schedule.to_xml_string())
-            if has_completed_trackers:
-                zip.writestr(course.shortname +"/tracker.xml",Tracker.to_xml_string(course,request.user))
-            zip.close()
-
-        wrapper = FileWrapper(file(file_to_download))
-        response = HttpResponse(wrapper, content_type='application/zip')
-        response['Content-Length'] = os.path.getsize(file_to_download)
-        response['Content-Disposition'] = 'attachment; filename="%s"' %(course.filename)
+        # if the user already has an older version, send just the changes
+        path, filename, from_version = course.getAbsPath(), course.filename, None
+        try:
+            delta = delta_package(course, int(request.GET['from']))
+        except (KeyError, ValueError):
+            delta = None
+        if delta is not None:
+            path, filename = delta
+            from_version = int(request.GET['from'])
+
+        # add scheduling and tracker XML files, these are appended to the
+        # course zip as it's streamed, rather than to a copy of the file
+        entries = []
+        if schedule:
+            entries.append((course.shortname +"/schedule.xml", schedule.to_xml_string()))
+        if has_completed_trackers:
+            entries.append((course.shortname +"/tracker.xml", Tracker.to_xml_string(course,request.user)))
+
+        if entries:
+            package = CoursePackage(path, entries)
+            response = StreamingHttpResponse(package, content_type='application/zip')
+            response['Content-Length'] = len(package)
+            response['Content-Disposition'] = 'attachment; filename="%s"' %(filename)
+        else:
+            # unchanged course package, so can be cached and resumed
+            response = file_response(request, path, filename, course_etag(course, from_version), course.lastupdated_date)
+            if not is_new_download(request, response):
+                return response
         
         # Add to tracker
         tracker = Tracker()
         tracker.user = request.user
         tracker.course = course
         tracker.type = 'download'
-        tracker.data = json.dumps({'version':course.version })
+        if from_version is None:
+            tracker.data = json.dumps({'version':course.version })
+        else:
+            tracker.data = json.dumps({'version':course.version, 'from_version':from_version })
         tracker.ip = request.META.get('REMOTE_ADDR','0.0.0.0')
         tracker.agent = request.META.get('HTTP_USER_AGENT','unknown')
         tracker.save()
@@ -548,29 +567,14 @@ class CourseResource(ModelResource):
     def dehydrate(self, bundle):        
         bundle.data['url'] = bundle.request.build_absolute_uri(bundle.data['resource_uri'] + 'download/')
         
-        # make sure title is shown as json object (not string representation of one)
-        bundle.data['title'] = json.loads(bundle.data['title'])
+        bundle.data.update(get_static_data(bundle.obj))
         
-        try:
-            bundle.data['description'] = json.loads(bundle.data['description'])
-        except: 
-            pass
-        
-        course = Course.objects.get(pk=bundle.obj.pk)
-        schedule = course.get_default_schedule()
-        cohort = Cohort.member_now(course,bundle.request.user)
-        if cohort:
-            if cohort.schedule:
-                schedule = cohort.schedule
+        schedule = get_schedule(bundle.request, bundle.obj)
         if schedule:
             bundle.data['schedule'] = schedule.lastupdated_date.strftime("%Y%m%d%H%M%S")
             sr = ScheduleResource()
             bundle.data['schedule_uri'] = sr.get_resource_uri(schedule)
 
-        if course and course.user:
-            bundle.data['author'] = course.user.first_name + " " + course.user.last_name
-            bundle.data['username'] = course.user.username
-
         return bundle
     
 class CourseTagResource(ModelResource):
@@ -641,12 +645,12 @@ class TagResource(ModelResource):
         
         course_data = []
         cr = CourseResource()
-        for c in courses:
+        for c in with_catalogue_related(courses):
             bundle = cr.build_bundle(obj=c,request=request)
             d = cr.full_dehydrate(bundle)
             course_data.append(bundle.data)
         
-        response = HttpResponse(content=json.dumps({'id':pk,'count':courses.count(),'courses':course_data,'name':tag.name}),content_type="application/json; charset=utf-8")
+        response = HttpResponse(content=json.dumps({'id':pk,'count':len(course_data),'courses':course_data,'name':tag.name}),content_type="application/json; charset=utf-8")
         return response
 
     def dehydrate_count(self,bundle):
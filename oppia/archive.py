@@ -0,0 +1,145 @@
+# Interpreter deliberately excluded here - set it in your cron shell script.
+# /usr/bin/env python
+
+import argparse
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from oppia.models import Tracker, TrackerArchive
+
+# no of trackers to move in each transaction
+ARCHIVE_BATCH_SIZE = 5000
+
+# no of trackers read from each table at a time by all_trackers
+TRACKER_PAGE_SIZE = 2000
+
+
+def archive_cutoff(months):
+    '''
+    The first day of the month, months ago - trackers from before this are
+    archived
+    '''
+    now = timezone.now()
+    year = now.year
+    month = now.month - months
+    while month < 1:
+        month += 12
+        year -= 1
+    return now.replace(year=year, month=month, day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def archive_trackers(months, batch_size=ARCHIVE_BATCH_SIZE):
+    '''
+    Moves the trackers older than the given no of months into the
+    TrackerArchive table. Only trackers already processed by the summary cron
+    are moved, so the summary tables still include them
+    '''
+    from oppia.summary.models import SettingProperties
+
+    cutoff = archive_cutoff(months)
+    last_tracker_pk = SettingProperties.get_property('last_tracker_pk', 0)
+    trackers = Tracker.objects.filter(tracker_date__lt=cutoff, pk__lte=last_tracker_pk).order_by('id')
+
+    total = 0
+    while True:
+        with transaction.atomic():
+            batch = list(trackers[:batch_size])
+            if not batch:
+                break
+            archived = []
+            for t in batch:
+                a = TrackerArchive()
+                for field in Tracker._meta.concrete_fields:
+                    setattr(a, field.attname, getattr(t, field.attname))
+                a.month = t.tracker_date.date().replace(day=1)
+                archived.append(a)
+            TrackerArchive.objects.bulk_create(archived)
+            Tracker.objects.filter(id__in=[t.id for t in batch]).delete()
+        total += len(batch)
+        print ('%d trackers archived' % total)
+    return total
+
+
+def all_trackers(order_by='-tracker_date', values=None, page_size=TRACKER_PAGE_SIZE, **filters):
+    '''
+    The trackers matching the filters from both the Tracker and TrackerArchive
+    tables, in the given order (eg for exports). If a list of values is given,
+    dicts of just those fields are returned rather than model instances.
+
+    Each table is read a page at a time (after the last tracker of the page
+    before, by the order field then id) and the pages merged, so the whole
+    table is never held in memory by the database driver
+    '''
+    field = order_by.lstrip('-')
+    reverse = order_by.startswith('-')
+    if values is None:
+        key = lambda t: (getattr(t, field), t.id)
+    else:
+        values = list(values) + ([] if 'id' in values else ['id'])
+        key = lambda t: (t[field], t['id'])
+
+    querysets = []
+    for model in (Tracker, TrackerArchive):
+        qs = model.objects.filter(**filters).order_by(order_by, '-id' if reverse else 'id')
+        if values is not None:
+            qs = qs.values(*values)
+        querysets.append(_pages(qs, field, reverse, key, page_size))
+    live, archived = querysets
+
+    next_live = next(live, None)
+    next_archived = next(archived, None)
+    while next_live is not None or next_archived is not None:
+        if next_archived is None:
+            use_live = True
+        elif next_live is None:
+            use_live = False
+        elif reverse:
+            use_live = key(next_live) >= key(next_archived)
+        else:
+            use_live = key(next_live) <= key(next_archived)
+
+        if use_live:
+            yield next_live
+            next_live = next(live, None)
+        else:
+            yield next_archived
+            next_archived = next(archived, None)
+
+
+def _pages(qs, field, reverse, key, page_size):
+    last = None
+    while True:
+        page = qs
+        if last is not None:
+            value, last_id = last
+            op = '__lt' if reverse else '__gt'
+            page = page.filter(Q(**{field + op: value}) | Q(**{field: value, 'id' + op: last_id}))
+        page = list(page[:page_size])
+        for t in page:
+            yield t
+        if len(page) < page_size:
+            return
+        last = key(page[-1])
+
+
+def run(months):
+    print 'Starting OppiaMobile tracker archive...'
+    start = time.time()
+    print ('Archiving trackers from before %s' % archive_cutoff(months).strftime('%Y-%m-%d'))
+    total = archive_trackers(months)
+    elapsed_time = time.time() - start
+    print ('archive completed, %d trackers archived, took %.2f seconds' % (total, elapsed_time))
+
+
+if __name__ == "__main__":
+    import django
+    django.setup()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--months", help="archive trackers older than this no of months", type=int,
+                        default=settings.OPPIA_TRACKER_ARCHIVE_MONTHS)
+    args = parser.parse_args()
+    run(args.months)
@@ -0,0 +1,24 @@
+# oppia/bulk.py
+from django.db.models import Case, When, Value
+
+# no of rows to update with each UPDATE statement
+UPDATE_BATCH_SIZE = 50
+
+
+def bulk_update(model, objects, fields, batch_size=UPDATE_BATCH_SIZE):
+    """
+    Saves the given fields of the objects with one UPDATE per batch_size
+    objects
+    """
+    for batch in batches(objects, batch_size):
+        values = {}
+        for field in fields:
+            values[field] = Case(*[When(pk=o.pk, then=Value(getattr(o, field))) for o in batch],
+                                 output_field=model._meta.get_field(field))
+        model.objects.filter(pk__in=[o.pk for o in batch]).update(**values)
+
+
+def batches(items, size):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
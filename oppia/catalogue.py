@@ -0,0 +1,112 @@
+# oppia/catalogue.py
+import hashlib
+import json
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import Prefetch
+from django.db.models.signals import post_save, post_delete
+from django.utils.http import quote_etag
+
+from oppia.models import Course, Cohort, Schedule
+
+# how long (in seconds) the parts of a course's API entry that are the same
+# for every user are cached
+CATALOGUE_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def with_catalogue_related(courses):
+    '''
+    Fetches the course authors and default schedules along with the courses,
+    rather than with a query for each course
+    '''
+    return courses.select_related('user').prefetch_related(
+        Prefetch('schedule_set', queryset=Schedule.objects.filter(default=True), to_attr='default_schedules'))
+
+
+def get_default_schedule(course):
+    if hasattr(course, 'default_schedules'):
+        for schedule in course.default_schedules:
+            return schedule
+        return None
+    return course.get_default_schedule()
+
+
+def get_schedule(request, course):
+    '''
+    The schedule for the user, from their current cohort if it has one,
+    otherwise the course default
+    '''
+    cohort = Cohort.member_now(course, request.user)
+    if cohort and cohort.schedule:
+        return cohort.schedule
+    return get_default_schedule(course)
+
+
+def catalogue_etag(request, courses):
+    '''
+    Fingerprint of the user's course list, this changes whenever any of the
+    courses (or their authors' names) are updated or added/removed, or a
+    schedule or the user's cohort membership changes.
+
+    Only the course and schedule rows are read, so this is much cheaper than
+    serialising the courses
+    '''
+    md5 = hashlib.md5(request.get_full_path().encode('utf-8'))
+    course_ids = []
+    for c in courses.order_by('id').values_list('id', 'version', 'lastupdated_date', 'is_draft', 'shortname',
+                                                       'title', 'description', 'user_id',
+                                                       'user__username', 'user__first_name', 'user__last_name'):
+        course_ids.append(c[0])
+        md5.update(repr(c))
+    for s in Schedule.objects.filter(course_id__in=course_ids, default=True) \
+                             .order_by('id').values_list('id', 'course_id', 'lastupdated_date'):
+        md5.update(repr(s))
+    memberships = Cohort.memberships_now(request.user)
+    for course_id in sorted(memberships):
+        for role, cohort in memberships[course_id]:
+            md5.update(repr((course_id, role, cohort.id, cohort.schedule_id)))
+            if cohort.schedule:
+                md5.update(repr(cohort.schedule.lastupdated_date))
+    return quote_etag(md5.hexdigest())
+
+
+def _static_key(course):
+    return 'oppia_course_catalogue_%d_%d' % (course.id, course.version)
+
+
+def get_static_data(course):
+    '''
+    The parts of the course's API entry that are the same for every user,
+    cached for each version of the course, and removed when the course or its
+    author is saved (eg the title edited in the admin)
+    '''
+    key = _static_key(course)
+    data = cache.get(key)
+    if data is None:
+        # make sure title is shown as json object (not string representation of one)
+        data = {'title': json.loads(course.title)}
+        try:
+            data['description'] = json.loads(course.description)
+        except:
+            pass
+        if course.user:
+            data['author'] = course.user.first_name + " " + course.user.last_name
+            data['username'] = course.user.username
+        cache.set(key, data, CATALOGUE_CACHE_TIMEOUT)
+    return data
+
+
+def remove_static_data(sender, instance, **kwargs):
+    cache.delete(_static_key(instance))
+
+def remove_author_static_data(sender, instance, **kwargs):
+    # eg not when just the last_login is updated
+    update_fields = kwargs.get('update_fields')
+    if update_fields and not set(update_fields) & set(['username', 'first_name', 'last_name']):
+        return
+    cache.delete_many([_static_key(c) for c in Course.objects.filter(user=instance).only('id', 'version')])
+
+post_save.connect(remove_static_data, sender=Course)
+post_delete.connect(remove_static_data, sender=Course)
+post_save.connect(remove_author_static_data, sender=User)
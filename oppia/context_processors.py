@@ -9,11 +9,7 @@ def get_points(request):
         return {'points': 0, 'badges':0 }
     else:
         points = Points.get_userscore(request.user)
-        if points is None:
-            points = 0
         badges = Award.get_userawards(request.user)
-        if badges is None:
-            badges = 0
     return {'points': points, 'badges':badges }
 
 def get_version(request):
@@ -1,62 +1,223 @@
 # oppia/course_xml_reader.py
 import json
-import os
-import xml.dom.minidom
+
+try:
+    import xml.etree.cElementTree as ElementTree
+except ImportError:
+    import xml.etree.ElementTree as ElementTree
+
+
+def parse_course_xml(source):
+    '''
+    Reads a course module.xml file (a path or file object) in a single pass,
+    generating:
+
+    ('meta', dict) - the course details, including any baseline activities
+    ('section', dict) - for each section, with its activities
+    ('structure', int) - the no of sections, at the end of the structure
+    ('media', list) - the media files
+
+    The sections are cleared from the tree once they've been read, so only
+    one section is held in memory at a time. The meta is always generated
+    first, and is None if the file doesn't have a meta element
+    '''
+    path = []
+    root = None
+    last_child = None
+    structures = 0
+    no_sections = 0
+    meta = None
+    waiting = []
+
+    for event, elem in ElementTree.iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            if root is None:
+                root = elem
+            path.append(elem)
+            if elem.tag == 'structure':
+                structures += 1
+            continue
+
+        path.pop()
+        found = None
+        if elem.tag == 'meta' and meta is None:
+            meta = parse_meta(elem)
+            yield ('meta', meta)
+            for w in waiting:
+                yield w
+            waiting = []
+        elif elem.tag == 'section' and structures == 1 and _in_structure(path):
+            found = ('section', parse_section(elem))
+            no_sections += 1
+            elem.clear()
+        elif elem.tag == 'structure' and structures == 1 and not _in_structure(path):
+            found = ('structure', no_sections)
+
+        if found is not None:
+            if meta is None:
+                waiting.append(found)
+            else:
+                yield found
+
+        if len(path) == 1:
+            last_child = elem
+
+    if meta is None:
+        yield ('meta', None)
+        for w in waiting:
+            yield w
+
+    media = []
+    if last_child is not None:
+        for f in last_child:
+            if f.tag == 'file':
+                media.append(parse_media(f))
+    yield ('media', media)
+
+
+def _in_structure(path):
+    for elem in path:
+        if elem.tag == 'structure':
+            return True
+    return False
+
+
+def parse_meta(meta):
+    versionid = 0
+    for v in meta.iter('versionid'):
+        versionid = int(v.text)
+        break
+
+    title = {}
+    description = {}
+    for t in meta:
+        if t.tag == 'title':
+            title[t.get('lang', '')] = t.text
+        elif t.tag == 'description':
+            description[t.get('lang', '')] = t.text
+
+    shortname = ''
+    for sn in meta.iter('shortname'):
+        shortname = sn.text
+        break
+
+    return {
+        'versionid': versionid,
+        'title': json.dumps(title),
+        'description': json.dumps(description),
+        'shortname': shortname,
+        'activities': [parse_activity(a) for a in meta.iter('activity')],
+    }
+
+
+def parse_section(section):
+    title = {}
+    for t in section:
+        if t.tag == 'title':
+            title[t.get('lang', '')] = t.text
+
+    activities = []
+    for a in section.iter('activities'):
+        activities = [parse_activity(act) for act in a.iter('activity')]
+        break
+
+    return {
+        'title': json.dumps(title),
+        'order': section.get('order', ''),
+        'activities': activities,
+    }
+
+
+def parse_activity(act):
+    '''
+    The field values for an Activity from its XML element
+    '''
+    type = act.get('type', '')
+
+    title = {}
+    for t in act.iter('title'):
+        title[t.get('lang', '')] = t.text
+
+    if type in ('page', 'url'):
+        content = json.dumps(_lang_values(act, 'location'))
+    elif type in ('quiz', 'feedback'):
+        content = ""
+        for c in act.iter('content'):
+            content = c.text
+    elif type == 'resource':
+        content = ""
+        for c in act.iter('location'):
+            content = c.text
+    else:
+        content = None
+
+    image = None
+    for i in act.iter('image'):
+        image = i.get('filename', '')
+
+    description = None
+    if act.find('.//description') is not None:
+        description = json.dumps(_lang_values(act, 'description'))
+
+    return {
+        'order': act.get('order', ''),
+        'title': json.dumps(title),
+        'type': type,
+        'digest': act.get('digest', ''),
+        'image': image,
+        'content': content,
+        'description': description,
+        # used for the preview only
+        'location': json.dumps(dict((l.get('lang', ''), l.text) for l in act.iter('location'))),
+    }
+
+
+def parse_media(f):
+    media = {
+        'filename': f.get('filename', ''),
+        'download_url': f.get('download_url', ''),
+        'digest': f.get('digest', ''),
+    }
+    if 'length' in f.attrib:
+        media['media_length'] = f.get('length')
+    if 'filesize' in f.attrib:
+        media['filesize'] = f.get('filesize')
+    return media
+
+
+def _lang_values(elem, tag):
+    values = {}
+    for t in elem.iter(tag):
+        if t.text and t.get('lang'):
+            values[t.get('lang')] = t.text
+    return values
 
 
 class CourseXML():
-    
+
     def __init__(self, course_xml_path):
-        self.doc = xml.dom.minidom.parse(course_xml_path)
         self.sections = []
-        
-        for structure in self.doc.getElementsByTagName("structure")[:1]:
-            for s in structure.getElementsByTagName("section"):
-                 temp_title = {}
-                 for t in s.childNodes:
-                     if t.nodeName == 'title':
-                         temp_title[t.getAttribute('lang')] = t.firstChild.nodeValue
-                 title = json.dumps(temp_title)
-                 section = Section(title)
-                 
-                 for activities in s.getElementsByTagName("activities")[:1]:
-                     for a in activities.getElementsByTagName("activity"):
-                        temp_title = {}
-                        for t in a.getElementsByTagName("title"):
-                            temp_title[t.getAttribute('lang')] = t.firstChild.nodeValue
-                        title = json.dumps(temp_title)
-                        
-                        temp_loc = {}
-                        for t in a.getElementsByTagName("location"):
-                            temp_loc[t.getAttribute('lang')] = t.firstChild.nodeValue
-                        location = json.dumps(temp_loc)
-                        
-                        type = a.getAttribute('type')
-                        activity = Activity(title, location, type)
-                        section.activities.append(activity)
-
-                 self.sections.append(section)
-    
-        for s in self.sections:
-            print s.title
-            for a in s.activities:
-                print a.title
-                print a.location
-    
-    
-    
+        for type, value in parse_course_xml(course_xml_path):
+            if type == 'section':
+                section = Section(value['title'])
+                for a in value['activities']:
+                    section.activities.append(Activity(a['title'], a['location'], a['type']))
+                self.sections.append(section)
+
+
+
 class Section():
-    
+
     def __init__(self, title):
         self.title = title
         self.activities = []
-        
-    
-    
-    
+
+
+
+
 class Activity():
-    
+
     def __init__(self, title, location, type):
         self.title = title
         self.location = location
-        self.type = type
\ No newline at end of file
+        self.type = type
@@ -0,0 +1,211 @@
+# oppia/digests.py
+import hashlib
+import json
+import uuid
+
+from django.core.cache import cache
+from django.db import models
+
+from oppia.models import Course, Activity, Media
+
+# Entries are kept in the default Django cache, so the index is per process
+# unless a shared cache backend (eg memcached) is configured in CACHES
+
+# how long (in seconds) a digest entry is kept in the cache
+DIGEST_CACHE_TIMEOUT = 60 * 60 * 24
+
+DIGEST_KEY = 'oppia_digest_%s'
+COURSE_GENERATION_KEY = 'oppia_digest_course_%d'
+
+
+class DigestEntry(object):
+    '''
+    What a digest refers to: the activities and media (in any course) that have
+    this digest, along with their course, type, titles and section title
+    '''
+    def __init__(self, digest, activities, media):
+        self.digest = digest
+        self.activities = activities
+        self.media = media
+
+    def exists(self):
+        return len(self.activities) > 0 or len(self.media) > 0
+
+    def get_activity(self, course_shortname=None):
+        for a in self.activities:
+            if course_shortname is None or a['course_shortname'] == course_shortname:
+                return a
+        return None
+
+    def get_media(self, course_shortname=None):
+        for m in self.media:
+            if course_shortname is None or m['course_shortname'] == course_shortname:
+                return m
+        return None
+
+    def get_type(self):
+        for a in self.activities:
+            return a['type']
+        for m in self.media:
+            return "media"
+        return None
+
+    def get_title(self, lang='en'):
+        for m in self.media:
+            return m['filename']
+        for a in self.activities:
+            try:
+                titles = json.loads(a['title'])
+                if lang in titles:
+                    return titles[lang]
+                else:
+                    for l in titles:
+                        return titles[l]
+            except:
+                pass
+        return None
+
+    def get_course_user_id(self, course_id):
+        for obj in self.activities + self.media:
+            if obj['course_id'] == course_id:
+                return obj['course_user_id']
+        return None
+
+
+def get_digest(digest):
+    return get_digests([digest])[digest]
+
+
+def get_digests(digests):
+    '''
+    Resolves a set of digests, using the cached entries where they are still
+    valid for the current generation of their courses, and loading the rest
+    with a single query per model
+    '''
+    digests = set(digests)
+    keys = dict((_digest_key(d), d) for d in digests)
+    cached = cache.get_many(keys.keys())
+
+    course_ids = set()
+    for value in cached.values():
+        course_ids.update(value['generations'].keys())
+    generations = get_course_generations(course_ids)
+
+    entries = {}
+    for key, value in cached.items():
+        valid = True
+        for course_id, generation in value['generations'].items():
+            if generations[course_id] != generation:
+                valid = False
+        if valid:
+            entries[keys[key]] = DigestEntry(keys[key], value['activities'], value['media'])
+
+    missing = digests - set(entries.keys())
+    if missing:
+        entries.update(_load_digests(missing))
+    return entries
+
+
+def get_course_generations(course_ids):
+    course_ids = set(course_ids)
+    keys = dict((COURSE_GENERATION_KEY % c, c) for c in course_ids)
+    generations = dict((keys[k], g) for k, g in cache.get_many(keys.keys()).items())
+    for course_id in course_ids - set(generations.keys()):
+        cache.add(COURSE_GENERATION_KEY % course_id, uuid.uuid4().hex, None)
+        generations[course_id] = cache.get(COURSE_GENERATION_KEY % course_id)
+    return generations
+
+
+def invalidate_course(course_id, digests=None):
+    '''
+    Called when a course's sections/activities/media are replaced, this starts
+    a new generation for the course (so any entries pointing to it are reloaded)
+    and removes the entries for the digests the course now contains
+    '''
+    cache.set(COURSE_GENERATION_KEY % course_id, uuid.uuid4().hex, None)
+    if digests:
+        cache.delete_many([_digest_key(d) for d in digests])
+
+
+def _digest_key(digest):
+    return DIGEST_KEY % hashlib.md5((u'%s' % digest).encode('utf-8')).hexdigest()
+
+
+def _load_digests(digests):
+    activities = dict((d, []) for d in digests)
+    media = dict((d, []) for d in digests)
+
+    activity_values = Activity.objects.filter(digest__in=digests) \
+                        .order_by('id') \
+                        .values('digest', 'type', 'title',
+                                'section__title', 'section__course_id',
+                                'section__course__shortname', 'section__course__user_id')
+    for a in activity_values:
+        activities.setdefault(a['digest'], []).append({'course_id': a['section__course_id'],
+                                        'course_shortname': a['section__course__shortname'],
+                                        'course_user_id': a['section__course__user_id'],
+                                        'type': a['type'],
+                                        'title': a['title'],
+                                        'section_title': a['section__title']})
+
+    media_values = Media.objects.filter(digest__in=digests) \
+                        .order_by('id') \
+                        .values('digest', 'filename', 'course_id', 'course__shortname', 'course__user_id')
+    for m in media_values:
+        media.setdefault(m['digest'], []).append({'course_id': m['course_id'],
+                                   'course_shortname': m['course__shortname'],
+                                   'course_user_id': m['course__user_id'],
+                                   'filename': m['filename']})
+
+    course_ids = set()
+    for d in digests:
+        course_ids.update([obj['course_id'] for obj in activities[d] + media[d]])
+    generations = get_course_generations(course_ids)
+
+    entries = {}
+    values = {}
+    for d in digests:
+        entries[d] = DigestEntry(d, activities[d], media[d])
+        entry_generations = dict((obj['course_id'], generations[obj['course_id']]) for obj in activities[d] + media[d])
+        values[_digest_key(d)] = {'activities': activities[d],
+                                  'media': media[d],
+                                  'generations': entry_generations}
+    cache.set_many(values, DIGEST_CACHE_TIMEOUT)
+    return entries
+
+
+# The uploader replaces the activities and media with bulk_create/bulk_update
+# (which don't send signals) and invalidates the course itself, these are for
+# the changes made elsewhere, eg in the admin (not when loading fixtures)
+
+def course_changed_callback(sender, **kwargs):
+    # the entries include the course shortname and owner
+    if kwargs.get('raw'):
+        return
+    course = kwargs.get('instance')
+    invalidate_course(course.id)
+
+def activity_saved_callback(sender, **kwargs):
+    if kwargs.get('raw'):
+        return
+    activity = kwargs.get('instance')
+    invalidate_course(activity.section.course_id, [activity.digest])
+
+def activity_deleted_callback(sender, **kwargs):
+    # only the entry for its own digest includes it, and its section may
+    # already have been deleted along with it
+    activity = kwargs.get('instance')
+    cache.delete(_digest_key(activity.digest))
+
+def media_changed_callback(sender, **kwargs):
+    if kwargs.get('raw'):
+        return
+    media = kwargs.get('instance')
+    invalidate_course(media.course_id, [media.digest])
+
+models.signals.post_save.connect(course_changed_callback, sender=Course)
+models.signals.post_delete.connect(course_changed_callback, sender=Course)
+models.signals.post_save.connect(activity_saved_callback, sender=Activity)
+models.signals.post_delete.connect(activity_deleted_callback, sender=Activity)
+models.signals.post_save.connect(media_changed_callback, sender=Media)
+models.signals.post_delete.connect(media_changed_callback, sender=Media)
@@ -0,0 +1,355 @@
+# oppia/downloads.py
+import calendar
+import hashlib
+import json
+import os
+import re
+import struct
+import tempfile
+import time
+import zipfile
+import zlib
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import http_date, quote_etag
+
+# size of the chunks the course zip file is read and streamed in
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# directory (under COURSE_UPLOAD_DIR) the delta packages are kept in
+DELTA_DIR = 'delta'
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class CoursePackage(object):
+    '''
+    A course zip file with extra (small) entries appended, eg the user's
+    schedule.xml and tracker.xml, that can be streamed without copying the
+    course file.
+
+    The entries of the original zip are passed through byte for byte, followed
+    by the new entries, then the original central directory with records for
+    the new entries added, so the total size is known before streaming
+    '''
+    def __init__(self, path, entries):
+        self.path = path
+        zip = zipfile.ZipFile(path)
+        try:
+            self.data_end = zip.start_dir
+            comment = zip.comment
+        finally:
+            zip.close()
+
+        self.file_size = os.path.getsize(path)
+        # only a plain end of central directory record is supported, zip64
+        # archives (over 4GB or 65535 entries) can't be extended this way
+        self.directory_end = self.file_size - struct.calcsize(zipfile.structEndArchive) - len(comment)
+        with open(path, 'rb') as f:
+            f.seek(self.directory_end)
+            if f.read(4) != zipfile.stringEndArchive:
+                raise zipfile.BadZipfile("Unsupported zip file: %s" % path)
+            f.seek(self.directory_end - struct.calcsize(zipfile.structEndArchive64Locator))
+            if f.read(4) == zipfile.stringEndArchive64Locator:
+                raise zipfile.BadZipfile("Unsupported zip64 file: %s" % path)
+            f.seek(self.directory_end)
+            (signature, disk, disk_directory, disk_entries, self.no_entries,
+             directory_size, directory_offset, comment_size) = struct.unpack(zipfile.structEndArchive,
+                                                                             f.read(struct.calcsize(zipfile.structEndArchive)))
+        if directory_offset != self.data_end or self.file_size > zipfile.ZIP64_LIMIT:
+            raise zipfile.BadZipfile("Unsupported zip file: %s" % path)
+        self.comment = comment
+
+        self.local_entries = []
+        self.directory_entries = []
+        offset = self.data_end
+        for name, data in entries:
+            local, directory = self._entry(name, data, offset)
+            self.local_entries.append(local)
+            self.directory_entries.append(directory)
+            offset += len(local)
+
+    def _entry(self, name, data, offset):
+        if isinstance(name, unicode):
+            name = name.encode('utf-8')
+        if isinstance(data, unicode):
+            data = data.encode('utf-8')
+        zinfo = zipfile.ZipInfo(name, time.localtime(time.time())[:6])
+        zinfo.compress_type = zipfile.ZIP_DEFLATED
+        zinfo.external_attr = 0600 << 16
+        zinfo.file_size = len(data)
+        zinfo.CRC = zlib.crc32(data) & 0xffffffff
+        compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        compressed = compressor.compress(data) + compressor.flush()
+        zinfo.compress_size = len(compressed)
+        zinfo.header_offset = offset
+
+        local = zinfo.FileHeader() + compressed
+        dostime = zinfo.date_time[3] << 11 | zinfo.date_time[4] << 5 | (zinfo.date_time[5] // 2)
+        dosdate = (zinfo.date_time[0] - 1980) << 9 | zinfo.date_time[1] << 5 | zinfo.date_time[2]
+        directory = struct.pack(zipfile.structCentralDir, zipfile.stringCentralDir,
+                                zinfo.create_version, zinfo.create_system,
+                                zinfo.extract_version, zinfo.reserved, zinfo.flag_bits,
+                                zinfo.compress_type, dostime, dosdate, zinfo.CRC,
+                                zinfo.compress_size, zinfo.file_size,
+                                len(name), 0, 0, 0,
+                                zinfo.internal_attr, zinfo.external_attr,
+                                zinfo.header_offset) + name
+        return local, directory
+
+    def _end_record(self):
+        directory_size = (self.directory_end - self.data_end) + sum([len(d) for d in self.directory_entries])
+        directory_offset = self.data_end + sum([len(l) for l in self.local_entries])
+        no_entries = self.no_entries + len(self.directory_entries)
+        return struct.pack(zipfile.structEndArchive, zipfile.stringEndArchive,
+                           0, 0, no_entries, no_entries,
+                           directory_size, directory_offset, len(self.comment)) + self.comment
+
+    def __len__(self):
+        return (self.directory_end
+                + sum([len(l) for l in self.local_entries])
+                + sum([len(d) for d in self.directory_entries])
+                + len(self._end_record()))
+
+    def __iter__(self):
+        with open(self.path, 'rb') as f:
+            for chunk in _read(f, 0, self.data_end):
+                yield chunk
+            for local in self.local_entries:
+                yield local
+            for chunk in _read(f, self.data_end, self.directory_end):
+                yield chunk
+        for directory in self.directory_entries:
+            yield directory
+        yield self._end_record()
+
+
+def _read(f, start, end):
+    f.seek(start)
+    remaining = end - start
+    while remaining > 0:
+        chunk = f.read(min(DOWNLOAD_CHUNK_SIZE, remaining))
+        if not chunk:
+            break
+        remaining -= len(chunk)
+        yield chunk
+
+
+def course_etag(course, from_version=None):
+    '''
+    The ETag of the (unmodified) course package, or the delta package from an
+    older version, this changes whenever a new version of the course is
+    uploaded
+    '''
+    value = '%d-%s' % (course.version, course.filename.encode('utf-8'))
+    if from_version is not None:
+        value += '-%d' % from_version
+    return quote_etag(hashlib.md5(value).hexdigest())
+
+
+def save_manifest(course):
+    '''
+    Records the files and digests of the current version of the course, called
+    when a course is uploaded
+    '''
+    from oppia.models import Activity, Media, CourseManifest
+
+    zip = zipfile.ZipFile(course.getAbsPath())
+    try:
+        files = dict((i.filename, [i.CRC, i.file_size]) for i in zip.infolist() if not i.filename.endswith('/'))
+    finally:
+        zip.close()
+    digests = list(Activity.objects.filter(section__course=course).values_list('digest', flat=True))
+    digests += list(Media.objects.filter(course=course).values_list('digest', flat=True))
+
+    manifest, created = CourseManifest.objects.get_or_create(course=course, version=course.version)
+    manifest.files = json.dumps(files)
+    manifest.digests = json.dumps(digests)
+    manifest.save()
+    return manifest
+
+
+def delta_package(course, from_version):
+    '''
+    The path and filename of a zip with just the files added or changed since
+    from_version, along with a delta.json file listing the files and activity
+    digests removed. None is returned if there's no manifest for either
+    version, in which case the full course should be sent instead.
+
+    The package is built the first time it's requested and kept until the
+    course is next updated
+    '''
+    from oppia.models import CourseManifest
+
+    if from_version >= course.version:
+        return None
+    manifests = dict((m.version, m) for m in CourseManifest.objects.filter(course=course,
+                                                                           version__in=[from_version, course.version]))
+    if from_version not in manifests or course.version not in manifests:
+        return None
+
+    filename = '%s-%d-%d.zip' % (course.shortname, from_version, course.version)
+    path = os.path.join(settings.COURSE_UPLOAD_DIR, DELTA_DIR, '%d-%s' % (course.id, filename))
+    if os.path.isfile(path):
+        return path, filename
+
+    old_files = manifests[from_version].get_files()
+    new_files = manifests[course.version].get_files()
+    delta = {
+        'from': from_version,
+        'to': course.version,
+        'removed': sorted(set(old_files.keys()) - set(new_files.keys())),
+        'removed_digests': sorted(set(manifests[from_version].get_digests()) - set(manifests[course.version].get_digests())),
+    }
+
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    # built under a temporary name, so a partly written package is never sent
+    fd, temp_path = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(path))
+    os.close(fd)
+    source = zipfile.ZipFile(course.getAbsPath())
+    try:
+        with zipfile.ZipFile(temp_path, 'w', zipfile.ZIP_DEFLATED) as zip:
+            for info in source.infolist():
+                if info.filename in new_files and old_files.get(info.filename) != new_files[info.filename]:
+                    zip.writestr(info, source.read(info))
+            zip.writestr(course.shortname + '/delta.json', json.dumps(delta))
+    finally:
+        source.close()
+    os.rename(temp_path, path)
+    return path, filename
+
+
+def remove_delta_packages(course):
+    '''
+    Removes the delta packages to the previous version of the course, called
+    when a new version is uploaded
+    '''
+    path = os.path.join(settings.COURSE_UPLOAD_DIR, DELTA_DIR)
+    if not os.path.isdir(path):
+        return
+    for f in os.listdir(path):
+        if f.startswith('%d-' % course.id):
+            try:
+                os.remove(os.path.join(path, f))
+            except OSError:
+                pass
+
+
+def etag_matches(request, etag):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is None:
+        return False
+    etags = [e.strip() for e in if_none_match.split(',')]
+    return '*' in etags or etag in etags
+
+
+def get_range(request, etag, size):
+    '''
+    The (start, end) bytes requested in the Range header, end inclusive. None
+    is returned when the whole file should be sent: no Range header, one that
+    isn't supported (eg multiple ranges) or an If-Range for another version
+    '''
+    range_header = request.META.get('HTTP_RANGE')
+    if not range_header:
+        return None
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range is not None and if_range != etag:
+        return None
+    match = RANGE_RE.match(range_header.strip())
+    if match is None:
+        return None
+    start, end = match.groups()
+    if start == '' and end == '':
+        return None
+    if start == '':
+        # suffix range - the last n bytes
+        start, end = max(size - int(end), 0), size - 1
+    else:
+        start = int(start)
+        end = min(int(end), size - 1) if end != '' else size - 1
+    return start, end
+
+
+def file_response(request, path, filename, etag, last_modified=None, content_type='application/zip'):
+    '''
+    Sends a file that doesn't change for the given ETag, replying 304 for a
+    matching If-None-Match and supporting (single) Range requests, so that
+    interrupted downloads can be resumed.
+
+    If OPPIA_DOWNLOAD_OFFLOAD is set, the file is sent by the web server
+    (which then handles the ranges) using the X-Sendfile or X-Accel-Redirect
+    header
+    '''
+    if etag_matches(request, etag):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+
+    offload = settings.OPPIA_DOWNLOAD_OFFLOAD
+    if offload == 'X-Sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = path
+    elif offload == 'X-Accel-Redirect':
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = settings.OPPIA_DOWNLOAD_ACCEL_REDIRECT_URL + os.path.relpath(path, settings.COURSE_UPLOAD_DIR)
+    else:
+        size = os.path.getsize(path)
+        byte_range = get_range(request, etag, size)
+        if byte_range is None:
+            response = StreamingHttpResponse(_stream(path, 0, size), content_type=content_type)
+            response['Content-Length'] = size
+        elif byte_range[0] >= size or byte_range[0] > byte_range[1]:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = 'bytes */%d' % size
+            return response
+        else:
+            start, end = byte_range
+            response = StreamingHttpResponse(_stream(path, start, end + 1), status=206, content_type=content_type)
+            response['Content-Length'] = end + 1 - start
+            response['Content-Range'] = 'bytes %d-%d/%d' % (start, end, size)
+        response['Accept-Ranges'] = 'bytes'
+
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(calendar.timegm(last_modified.utctimetuple()))
+    response['Content-Disposition'] = 'attachment; filename="%s"' % filename
+    return response
+
+
+def is_new_download(request, response):
+    '''
+    Whether the response is the start of a download, rather than a resumed
+    download or a 304, so it's only tracked (and given points) once
+    '''
+    if response.status_code == 200:
+        if response.has_header('X-Sendfile') or response.has_header('X-Accel-Redirect'):
+            # the web server handles the range, so it's a resume if the
+            # range it'll send doesn't start at 0
+            return not _is_resumed(request, response['ETag'])
+        return True
+    return response.status_code == 206 and response['Content-Range'].startswith('bytes 0-')
+
+
+def _is_resumed(request, etag):
+    range_header = request.META.get('HTTP_RANGE')
+    if not range_header:
+        return False
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range is not None and if_range != etag:
+        return False
+    match = RANGE_RE.match(range_header.strip())
+    if match is None:
+        return False
+    start, end = match.groups()
+    if start == '':
+        # suffix range - the last n bytes
+        return end != ''
+    return int(start) > 0
+
+
+def _stream(path, start, end):
+    with open(path, 'rb') as f:
+        for chunk in _read(f, start, end):
+            yield chunk
@@ -0,0 +1,95 @@
+# oppia/exports.py
+import csv
+import json
+
+from oppia.archive import all_trackers
+from oppia.digests import get_digests
+from oppia.models import Activity, Media
+
+TRACKER_EXPORT_HEADERS = ('Date', 'UserId', 'Type', 'Activity Title', 'Section Title', 'Time Taken', 'IP Address', 'User Agent', 'Language')
+
+TRACKER_EXPORT_VALUES = ('id', 'tracker_date', 'user_id', 'type', 'digest', 'activity_title', 'section_title', 'time_taken', 'ip', 'agent', 'data')
+
+
+class Echo(object):
+    '''
+    File-like object for the csv writer, that just hands back each line written
+    so it can be streamed rather than kept in memory
+    '''
+    def write(self, value):
+        return value
+
+
+def get_title(value, lang='en'):
+    '''
+    Titles are stored as a JSON dict of lang: title, or as a plain string for
+    older trackers
+    '''
+    try:
+        titles = json.loads(value)
+        if lang in titles:
+            return titles[lang]
+        else:
+            for l in titles:
+                return titles[l]
+    except:
+        pass
+    return value
+
+
+def course_titles(course, lang='en'):
+    '''
+    The titles of all the activities and media in the course, by digest, so
+    they're loaded once for the export rather than for each tracker
+    '''
+    digests = set(Activity.objects.filter(section__course=course).values_list('digest', flat=True))
+    digests.update(Media.objects.filter(course=course).values_list('digest', flat=True))
+    titles = {}
+    for digest, entry in get_digests(digests).items():
+        titles[digest] = entry.get_title(lang)
+    return titles
+
+
+def tracker_rows(course, lang='en'):
+    '''
+    Generates a tuple (in the order of the TRACKER_EXPORT_HEADERS) for each
+    of the course trackers, live and archived, most recent first
+    '''
+    titles = course_titles(course, lang)
+    for t in all_trackers(values=TRACKER_EXPORT_VALUES, course=course):
+        activity_title = titles.get(t['digest'])
+        if activity_title is None:
+            activity_title = get_title(t['activity_title'], lang)
+        try:
+            tracker_lang = json.loads(t['data']).get('lang', "")
+        except (ValueError, AttributeError):
+            tracker_lang = ""
+        yield (t['tracker_date'].strftime('%Y-%m-%d %H:%M:%S'),
+               t['user_id'],
+               t['type'],
+               activity_title,
+               get_title(t['section_title'], lang),
+               t['time_taken'],
+               t['ip'],
+               t['agent'],
+               tracker_lang)
+
+
+def csv_lines(headers, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow([_encode(h) for h in headers])
+    for row in rows:
+        yield writer.writerow([_encode(v) for v in row])
+
+
+def ndjson_lines(headers, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(headers, row))) + '\n'
+
+
+def _encode(value):
+    if value is None:
+        return ''
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return value
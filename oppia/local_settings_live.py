@@ -76,6 +76,11 @@ def modify(settings):
     settings['OPPIA_STAFF_ONLY_UPLOAD'] = True          # prevents anyone without is_staff status being able to upload courses,
                                                         # setting to False allows any registered user to upload a course
 
+    settings['OPPIA_TRACKER_ARCHIVE_MONTHS'] = 12       # trackers older than this no of months are moved to the archive table
+
+    settings['OPPIA_DOWNLOAD_OFFLOAD'] = None            # None, 'X-Sendfile' or 'X-Accel-Redirect' - lets the web server send the course files
+    settings['OPPIA_DOWNLOAD_ACCEL_REDIRECT_URL'] = '/protected/courses/'   # internal location mapped to COURSE_UPLOAD_DIR (X-Accel-Redirect only)
+
     settings['OPPIA_POINTS_ENABLED'] = True            # determines if the points system is enabled
     # if OPPIA POINTS_ENABLED is false, then the next 3 settings are ignored
     settings['OPPIA_STAFF_EARN_POINTS'] = False         # prevent staff from earning points
@@ -96,6 +101,8 @@ def modify(settings):
 
     settings['OPPIA_MAX_UPLOAD_SIZE'] = 5242880         # max course file upload size - in bytes
 
+    settings['OPPIA_PUBLISH_WORKERS'] = 2               # no of courses imported at the same time (per process), 0 to import during the upload request
+
     settings['API_LIMIT_PER_PAGE'] = 0
 
     settings['DEVICE_ADMIN_ENABLED'] = True
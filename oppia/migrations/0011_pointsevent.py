@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+from django.conf import settings
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('oppia', '0010_move_userprofile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PointsEvent',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('type', models.CharField(max_length=20, choices=[(b'signup', b'Sign up'), (b'trackers', b'Trackers submitted'), (b'quizattempt', b'Quiz attempt'), (b'quizcreated', b'Quiz created'), (b'coursedownloaded', b'Course downloaded'), (b'badgeawarded', b'Badge awarded')])),
+                ('object_id', models.IntegerField(default=None, null=True, blank=True)),
+                ('date', models.DateTimeField(default=django.utils.timezone.now, verbose_name=b'date created')),
+                ('data', models.TextField(blank=True)),
+                ('user', models.ForeignKey(to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Points event',
+                'verbose_name_plural': 'Points events',
+            },
+            bases=(models.Model,),
+        ),
+    ]
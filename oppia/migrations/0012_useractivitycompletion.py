@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+from django.conf import settings
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('oppia', '0011_pointsevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserActivityCompletion',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('digest', models.CharField(max_length=100)),
+                ('completed', models.BooleanField(default=False)),
+                ('course', models.ForeignKey(to='oppia.Course')),
+                ('user', models.ForeignKey(to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'User activity completion',
+                'verbose_name_plural': 'User activity completions',
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='useractivitycompletion',
+            unique_together=set([('user', 'course', 'digest')]),
+        ),
+    ]
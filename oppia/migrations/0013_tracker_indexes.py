@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+from django.db.models.functions import Length
+
+# the length of the new uuid column
+UUID_MAX_LENGTH = 100
+
+
+def check_uuid_lengths(apps, schema_editor):
+    '''
+    The uuid column is changed from text to a (indexed) varchar, stop here
+    rather than let the database cut off (or refuse to convert) any longer
+    values, as they link the trackers to their quiz attempts
+    '''
+    Tracker = apps.get_model('oppia', 'Tracker')
+    too_long = Tracker.objects.annotate(uuid_length=Length('uuid')).filter(uuid_length__gt=UUID_MAX_LENGTH)
+    count = too_long.count()
+    if count > 0:
+        raise ValueError('%d trackers have a uuid longer than %d characters (eg tracker %d), these need to be '
+                        'shortened or removed before migrating' % (count, UUID_MAX_LENGTH, too_long.order_by('id')[0].id))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oppia', '0012_useractivitycompletion'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_uuid_lengths, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='tracker',
+            name='digest',
+            field=models.CharField(max_length=100, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='tracker',
+            name='uuid',
+            field=models.CharField(default=None, max_length=UUID_MAX_LENGTH, null=True, db_index=True, blank=True),
+        ),
+        migrations.AlterIndexTogether(
+            name='tracker',
+            index_together=set([('user', 'course', 'completed', 'digest'), ('course', 'tracker_date'), ('user', 'type', 'submitted_date')]),
+        ),
+    ]
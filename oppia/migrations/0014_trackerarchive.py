@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+from django.conf import settings
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('oppia', '0013_tracker_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrackerArchive',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('submitted_date', models.DateTimeField(default=django.utils.timezone.now, verbose_name=b'date submitted')),
+                ('tracker_date', models.DateTimeField(default=django.utils.timezone.now, verbose_name=b'date tracked')),
+                ('ip', models.GenericIPAddressField()),
+                ('agent', models.TextField(blank=True)),
+                ('digest', models.CharField(max_length=100, db_index=True)),
+                ('data', models.TextField(blank=True)),
+                ('type', models.CharField(default=None, max_length=10, null=True, blank=True)),
+                ('completed', models.BooleanField(default=False)),
+                ('time_taken', models.IntegerField(default=0)),
+                ('activity_title', models.TextField(default=None, null=True, blank=True)),
+                ('section_title', models.TextField(default=None, null=True, blank=True)),
+                ('uuid', models.CharField(default=None, max_length=100, null=True, db_index=True, blank=True)),
+                ('lang', models.CharField(default=None, max_length=10, null=True, blank=True)),
+                ('month', models.DateField()),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.SET_NULL, default=None, blank=True, to='oppia.Course', null=True)),
+                ('user', models.ForeignKey(to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Archived tracker',
+                'verbose_name_plural': 'Archived trackers',
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterIndexTogether(
+            name='trackerarchive',
+            index_together=set([('month', 'course'), ('course', 'tracker_date')]),
+        ),
+    ]
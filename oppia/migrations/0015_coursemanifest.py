@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import json
+import os
+import zipfile
+
+from django.conf import settings
+from django.db import models, migrations
+import django.utils.timezone
+
+
+def save_current_manifests(apps, schema_editor):
+    Course = apps.get_model('oppia', 'Course')
+    Activity = apps.get_model('oppia', 'Activity')
+    Media = apps.get_model('oppia', 'Media')
+    CourseManifest = apps.get_model('oppia', 'CourseManifest')
+    for course in Course.objects.all():
+        path = settings.COURSE_UPLOAD_DIR + course.filename
+        if not os.path.isfile(path):
+            continue
+        try:
+            zip = zipfile.ZipFile(path)
+            files = dict((i.filename, [i.CRC, i.file_size]) for i in zip.infolist() if not i.filename.endswith('/'))
+            zip.close()
+        except zipfile.BadZipfile:
+            continue
+        digests = list(Activity.objects.filter(section__course=course).values_list('digest', flat=True))
+        digests += list(Media.objects.filter(course=course).values_list('digest', flat=True))
+        CourseManifest.objects.create(course=course, version=course.version,
+                                      files=json.dumps(files), digests=json.dumps(digests))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oppia', '0014_trackerarchive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseManifest',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('version', models.BigIntegerField()),
+                ('created_date', models.DateTimeField(default=django.utils.timezone.now, verbose_name=b'date created')),
+                ('files', models.TextField(blank=True)),
+                ('digests', models.TextField(blank=True)),
+                ('course', models.ForeignKey(to='oppia.Course')),
+            ],
+            options={
+                'verbose_name': 'Course Manifest',
+                'verbose_name_plural': 'Course Manifests',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='coursemanifest',
+            unique_together=set([('course', 'version')]),
+        ),
+        migrations.RunPython(save_current_manifests, migrations.RunPython.noop),
+    ]
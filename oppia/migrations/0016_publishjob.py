@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.utils.timezone
+import django.db.models.deletion
+from django.conf import settings
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('oppia', '0015_coursemanifest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PublishJob',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('filename', models.CharField(max_length=200)),
+                ('created_date', models.DateTimeField(default=django.utils.timezone.now, verbose_name=b'date created')),
+                ('lastupdated_date', models.DateTimeField(default=django.utils.timezone.now, verbose_name=b'date updated')),
+                ('status', models.CharField(default=b'queued', max_length=10, choices=[(b'queued', b'Queued'), (b'running', b'Running'), (b'done', b'Done'), (b'failed', b'Failed')])),
+                ('stage', models.CharField(default=b'queued', max_length=20)),
+                ('progress', models.IntegerField(default=0)),
+                ('message', models.TextField(default=b'', blank=True)),
+                ('is_draft', models.NullBooleanField(default=None)),
+                ('tags', models.TextField(default=None, null=True, blank=True)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.SET_NULL, default=None, blank=True, to='oppia.Course', null=True)),
+                ('user', models.ForeignKey(to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Publish Job',
+                'verbose_name_plural': 'Publish Jobs',
+            },
+        ),
+    ]
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+from django.db.models import Sum
+import django.db.models.deletion
+from django.conf import settings
+
+
+def add_up_points(apps, schema_editor):
+    Points = apps.get_model('oppia', 'Points')
+    UserCoursePoints = apps.get_model('oppia', 'UserCoursePoints')
+    totals = Points.objects.values_list('user', 'course').annotate(total=Sum('points')).order_by()
+    UserCoursePoints.objects.bulk_create([UserCoursePoints(user_id=user_id, course_id=course_id, points=total)
+                                          for user_id, course_id, total in totals.iterator()],
+                                         batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('oppia', '0016_publishjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserCoursePoints',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('points', models.IntegerField(default=0)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.SET_NULL, default=None, to='oppia.Course', null=True)),
+                ('user', models.ForeignKey(to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'User course points',
+                'verbose_name_plural': 'User course points',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='usercoursepoints',
+            unique_together=set([('user', 'course')]),
+        ),
+        migrations.RunPython(add_up_points, migrations.RunPython.noop),
+    ]
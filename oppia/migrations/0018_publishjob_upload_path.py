@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oppia', '0017_usercoursepoints'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='publishjob',
+            name='upload_path',
+            field=models.CharField(default=b'', max_length=200, blank=True),
+        ),
+    ]
@@ -4,12 +4,13 @@ import json
 
 from django.conf import settings
 from django.contrib.auth.models import User
-from django.db import models
-from django.db.models import Max, Sum, Q, F, Count
+from django.core.cache import cache
+from django.db import models, transaction, IntegrityError
+from django.db.models import Max, Sum, Q, F, Count, Case, When, Value
 from django.utils.translation import ugettext_lazy as _
 from django.utils import timezone
 
-from oppia.quiz.models import Quiz, QuizAttempt
+from oppia.quiz.models import Quiz, QuizAttempt, quizzes_for_digests
 
 from tastypie.models import create_api_key
 
@@ -17,6 +18,9 @@ from xml.dom.minidom import *
 
 
 models.signals.post_save.connect(create_api_key, sender=User)
+
+# how long (in seconds) the schedule XML included in course downloads is cached
+SCHEDULE_XML_CACHE_TIMEOUT = 60 * 60 * 24
     
 class Course(models.Model):
     user = models.ForeignKey(User)
@@ -54,19 +58,23 @@ class Course(models.Model):
         return self.title 
      
     def is_first_download(self,user):
-        no_attempts = Tracker.objects.filter(user=user,course=self, type='download').count()
+        no_attempts = Tracker.objects.filter(user=user,course=self, type='download').count() + \
+                      TrackerArchive.objects.filter(user=user,course=self, type='download').count()
         is_first_download = False
         if no_attempts == 1:
             is_first_download = True
         return is_first_download
     
     def no_downloads(self):
-        no_downloads = Tracker.objects.filter(course=self, type='download').count()
+        no_downloads = Tracker.objects.filter(course=self, type='download').count() + \
+                       TrackerArchive.objects.filter(course=self, type='download').count()
         return no_downloads
     
     def no_distinct_downloads(self):
-        no_distinct_downloads = Tracker.objects.filter(course=self, type='download').values('user_id').distinct().count()
-        return no_distinct_downloads
+        users = set()
+        for model in (Tracker, TrackerArchive):
+            users.update(model.objects.filter(course=self, type='download').values_list('user_id', flat=True).distinct())
+        return len(users)
     
     def get_default_schedule(self):
         try:
@@ -128,9 +136,8 @@ class Course(models.Model):
         except Activity.DoesNotExist:
             return None
         
-        try:
-            quiz = Quiz.objects.get(quizprops__value=baseline.digest, quizprops__name="digest")
-        except Quiz.DoesNotExist:
+        quiz = quizzes_for_digests([baseline.digest]).get(baseline.digest)
+        if quiz is None:
             return None
         
         attempts = QuizAttempt.objects.filter(quiz=quiz, user=user)
@@ -143,12 +150,12 @@ class Course(models.Model):
     @staticmethod
     def get_no_quizzes_completed(course,user):
         acts = Activity.objects.filter(section__course=course,baseline=False, type=Activity.QUIZ).values_list('digest')
-        return Tracker.objects.filter(course=course,user=user,completed=True,digest__in=acts).values_list('digest').distinct().count()
+        return UserActivityCompletion.objects.filter(course=course,user=user,completed=True,digest__in=acts).count()
     
     @staticmethod
     def get_activities_completed(course,user):
         acts = Activity.objects.filter(section__course=course,baseline=False).values_list('digest')
-        return Tracker.objects.filter(course=course,user=user,completed=True,digest__in=acts).values_list('digest').distinct().count()
+        return UserActivityCompletion.objects.filter(course=course,user=user,completed=True,digest__in=acts).count()
     
     @staticmethod
     def get_points(course,user):
@@ -162,7 +169,7 @@ class Course(models.Model):
     @staticmethod
     def get_media_viewed(course,user):
         acts = Media.objects.filter(course=course).values_list('digest')
-        return Tracker.objects.filter(course=course,user=user,digest__in=acts).values_list('digest').distinct().count()
+        return UserActivityCompletion.objects.filter(course=course,user=user,digest__in=acts).count()
 
         
  
@@ -215,6 +222,16 @@ class Schedule(models.Model):
         return self.title
     
     def to_xml_string(self):
+        # cached by the last updated date, which is changed whenever the
+        # activity schedules are edited
+        key = 'oppia_schedule_xml_%d_%s' % (self.id, self.lastupdated_date.strftime('%Y%m%d%H%M%S%f'))
+        xml = cache.get(key)
+        if xml is None:
+            xml = self.build_xml_string()
+            cache.set(key, xml, SCHEDULE_XML_CACHE_TIMEOUT)
+        return xml
+
+    def build_xml_string(self):
         doc = Document();
         schedule = doc.createElement('schedule')
         schedule.setAttribute('version',self.lastupdated_date.strftime('%Y%m%d%H%M%S'))
@@ -355,13 +372,94 @@ class Media(models.Model):
     def __unicode__(self):
         return self.filename
     
-class Tracker(models.Model):
+class CourseManifest(models.Model):
+    '''
+    The files (with their CRC and size) and activity/media digests of each
+    version of a course package, kept after the package itself is replaced so
+    delta updates from older versions can be built
+    '''
+    course = models.ForeignKey(Course)
+    version = models.BigIntegerField()
+    created_date = models.DateTimeField('date created',default=timezone.now)
+    files = models.TextField(blank=True)
+    digests = models.TextField(blank=True)
+
+    class Meta:
+        verbose_name = _('Course Manifest')
+        verbose_name_plural = _('Course Manifests')
+        unique_together = ("course", "version")
+
+    def __unicode__(self):
+        return u"%s %d" % (self.course.shortname, self.version)
+
+    def get_files(self):
+        return json.loads(self.files)
+
+    def get_digests(self):
+        return json.loads(self.digests)
+
+
+class PublishJob(models.Model):
+    '''
+    An uploaded course waiting to be (or being) imported by the publishing
+    workers, see oppia/publishing.py
+    '''
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_TYPES = (
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+
+    user = models.ForeignKey(User)
+    filename = models.CharField(max_length=200)
+    # where (in the COURSE_UPLOAD_DIR) the file waits until it's published
+    # under the filename
+    upload_path = models.CharField(max_length=200, blank=True, default='')
+    created_date = models.DateTimeField('date created',default=timezone.now)
+    lastupdated_date = models.DateTimeField('date updated',default=timezone.now)
+    status = models.CharField(max_length=10, choices=STATUS_TYPES, default=QUEUED)
+    stage = models.CharField(max_length=20, default=QUEUED)
+    progress = models.IntegerField(default=0)
+    message = models.TextField(blank=True, default='')
+    course = models.ForeignKey(Course, null=True, blank=True, default=None, on_delete=models.SET_NULL)
+    # for courses published via the API, None if not given
+    is_draft = models.NullBooleanField(default=None)
+    tags = models.TextField(null=True, blank=True, default=None)
+
+    class Meta:
+        verbose_name = _('Publish Job')
+        verbose_name_plural = _('Publish Jobs')
+
+    def __unicode__(self):
+        return self.filename
+
+    def set_progress(self, stage, progress):
+        self.stage = stage
+        self.progress = progress
+        self.lastupdated_date = timezone.now()
+        self.save()
+
+    def to_dict(self):
+        return {'id': self.id,
+                'status': self.status,
+                'stage': self.stage,
+                'progress': self.progress,
+                'message': self.message,
+                'course_id': self.course_id}
+
+
+class TrackerBase(models.Model):
     user = models.ForeignKey(User)
     submitted_date = models.DateTimeField('date submitted',default=timezone.now)
     tracker_date = models.DateTimeField('date tracked',default=timezone.now)
     ip = models.GenericIPAddressField()
     agent = models.TextField(blank=True)
-    digest = models.CharField(max_length=100)
+    digest = models.CharField(max_length=100, db_index=True)
     data = models.TextField(blank=True)
     course = models.ForeignKey(Course,null=True, blank=True, default=None, on_delete=models.SET_NULL)
     type = models.CharField(max_length=10,null=True, blank=True, default=None)
@@ -369,56 +467,30 @@ class Tracker(models.Model):
     time_taken = models.IntegerField(default=0)
     activity_title = models.TextField(blank=True, null=True, default=None)
     section_title = models.TextField(blank=True, null=True, default=None)
-    uuid = models.TextField(blank=True, null=True, default=None)
+    uuid = models.CharField(max_length=100, blank=True, null=True, default=None, db_index=True)
     lang = models.CharField(max_length=10,null=True, blank=True, default=None)
     
     class Meta:
-        verbose_name = _('Tracker')
-        verbose_name_plural = _('Trackers')
-        
+        abstract = True
+
     def __unicode__(self):
         return self.agent
     
-    def is_first_tracker_today(self):
-        olddate = timezone.now() + datetime.timedelta(hours=-24)
-        no_attempts_today = Tracker.objects.filter(user=self.user,digest=self.digest,completed=True,submitted_date__gte=olddate).count()
-        if no_attempts_today == 1:
-            return True
-        else:
-            return False
-    
     def get_activity_type(self):
-        activities = Activity.objects.filter(digest=self.digest)
-        for a in activities:
-            return a.type
-        media = Media.objects.filter(digest=self.digest)
-        for m in media:
-            return "media"
-        return None
+        from oppia.digests import get_digest
+        return get_digest(self.digest).get_type()
      
     def get_media_title(self):
-        media = Media.objects.filter(digest=self.digest)
-        for m in media:
-            return m.filename
+        from oppia.digests import get_digest
+        for m in get_digest(self.digest).media:
+            return m['filename']
         return None
            
     def get_activity_title(self, lang='en'):
-        media = Media.objects.filter(digest=self.digest)
-        print media
-        for m in media:
-            return m.filename
-        try:
-            activity = Activity.objects.filter(digest=self.digest)
-            for a in activity:
-                print a.title
-                titles = json.loads(a.title)
-                if lang in titles:
-                    return titles[lang]
-                else:
-                    for l in titles:
-                        return titles[l]
-        except:
-            pass
+        from oppia.digests import get_digest
+        title = get_digest(self.digest).get_title(lang)
+        if title is not None:
+            return title
         return self.activity_title
     
     def get_section_title(self, lang='en'):
@@ -434,27 +506,53 @@ class Tracker(models.Model):
         return self.section_title
     
     def activity_exists(self):
-        activities = Activity.objects.filter(digest=self.digest).count()
-        if activities >= 1:
-            return True
-        media = Media.objects.filter(digest=self.digest).count()
-        if media >= 1:
-            return True
-        return False
+        from oppia.digests import get_digest
+        return get_digest(self.digest).exists()
  
+    def get_lang(self):
+        try:
+            json_data = json.loads(self.data)
+        except ValueError:
+            return None
+        
+        if 'lang' in json_data:
+            return json_data['lang']
+
+
+class Tracker(TrackerBase):
+
+    class Meta:
+        verbose_name = _('Tracker')
+        verbose_name_plural = _('Trackers')
+        # see utils/index_advisor.py for the queries these are for
+        index_together = [
+            ["user", "course", "completed", "digest"],
+            ["course", "tracker_date"],
+            ["user", "type", "submitted_date"],
+        ]
+        
+    def is_first_tracker_today(self):
+        olddate = timezone.now() + datetime.timedelta(hours=-24)
+        no_attempts_today = Tracker.objects.filter(user=self.user,digest=self.digest,completed=True,submitted_date__gte=olddate).count()
+        if no_attempts_today == 1:
+            return True
+        else:
+            return False
+    
     @staticmethod
     def has_completed_trackers(course,user):
-        count = Tracker.objects.filter(user=user, course=course,completed=True).count()        
-        if count > 0:
+        if Tracker.objects.filter(user=user, course=course,completed=True).exists():
             return True
-        return False
+        return TrackerArchive.objects.filter(user=user, course=course,completed=True).exists()
      
     @staticmethod
     def to_xml_string(course,user):
         doc = Document();
         trackerXML = doc.createElement('trackers')
         doc.appendChild(trackerXML)
-        trackers = Tracker.objects.filter(user=user, course=course)
+        # including any archived trackers, so the user's progress is complete
+        from oppia.archive import all_trackers
+        trackers = all_trackers(order_by='submitted_date', user=user, course=course)
         for t in trackers:
             track = doc.createElement('tracker')
             track.setAttribute('digest', t.digest)
@@ -503,18 +601,102 @@ class Tracker(models.Model):
         if time['total'] is None:
             return 0
         return time['total']
-    
-    def get_lang(self):
+
+
+class TrackerArchive(TrackerBase):
+    '''
+    Trackers moved out of the Tracker table by the archive script (see
+    oppia/archive.py), they keep the same id they had in the Tracker table
+    '''
+    month = models.DateField()
+
+    class Meta:
+        verbose_name = _('Archived tracker')
+        verbose_name_plural = _('Archived trackers')
+        index_together = [
+            ["month", "course"],
+            ["course", "tracker_date"],
+        ]
+
+
+class UserActivityCompletion(models.Model):
+    '''
+    One row for each activity/media (digest) a user has trackers for in a
+    course, kept up to date as the trackers are submitted
+    '''
+    user = models.ForeignKey(User)
+    course = models.ForeignKey(Course)
+    digest = models.CharField(max_length=100)
+    completed = models.BooleanField(default=False)
+
+    class Meta:
+        verbose_name = _('User activity completion')
+        verbose_name_plural = _('User activity completions')
+        unique_together = ("user", "course", "digest")
+
+    def __unicode__(self):
+        return self.digest
+
+    @staticmethod
+    def update_from_trackers(trackers):
+        completions = {}
+        for t in trackers:
+            if t.course_id is None or not t.digest:
+                continue
+            key = (t.user_id, t.course_id, t.digest)
+            completions[key] = completions.get(key, False) or t.completed
+        if not completions:
+            return
+
+        existing = {}
+        for c in UserActivityCompletion.objects.filter(user__in=set([k[0] for k in completions.keys()]),
+                                                       course__in=set([k[1] for k in completions.keys()]),
+                                                       digest__in=set([k[2] for k in completions.keys()])):
+            existing[(c.user_id, c.course_id, c.digest)] = c
+
+        new = []
+        for key, completed in completions.items():
+            if key not in existing:
+                new.append(UserActivityCompletion(user_id=key[0], course_id=key[1], digest=key[2], completed=completed))
+            elif completed and not existing[key].completed:
+                UserActivityCompletion.objects.filter(pk=existing[key].pk).update(completed=True)
+
         try:
-            json_data = json.loads(self.data)
-        except ValueError:
-            return None
-        
-        if 'lang' in json_data:
-            return json_data['lang']
-        
- 
-class Cohort(models.Model): 
+            with transaction.atomic():
+                UserActivityCompletion.objects.bulk_create(new)
+        except IntegrityError:
+            # another request has added some of them in the meantime
+            for c in new:
+                obj, created = UserActivityCompletion.objects.get_or_create(user_id=c.user_id, course_id=c.course_id, digest=c.digest,
+                                                                            defaults={'completed': c.completed})
+                if c.completed and not obj.completed:
+                    UserActivityCompletion.objects.filter(pk=obj.pk).update(completed=True)
+
+    @staticmethod
+    def rebuild(user_ids):
+        '''
+        Replaces the completions of the users with those from their trackers
+        '''
+        completed = Sum(Case(When(completed=True, then=Value(1)), default=Value(0), output_field=models.IntegerField()))
+        completions = {}
+        for model in (Tracker, TrackerArchive):
+            for c in model.objects.filter(user__in=user_ids) \
+                                  .exclude(course__isnull=True) \
+                                  .exclude(digest='') \
+                                  .values('user', 'course', 'digest') \
+                                  .annotate(completed=completed):
+                key = (c['user'], c['course'], c['digest'])
+                completions[key] = completions.get(key, False) or c['completed'] > 0
+
+        with transaction.atomic():
+            UserActivityCompletion.objects.filter(user__in=user_ids).delete()
+            UserActivityCompletion.objects.bulk_create([UserActivityCompletion(user_id=key[0],
+                                                                               course_id=key[1],
+                                                                               digest=key[2],
+                                                                               completed=completed) for key, completed in completions.items()])
+
+
+class Cohort(models.Model):
     description = models.CharField(max_length=100)
     start_date = models.DateTimeField(default=timezone.now)
     end_date = models.DateTimeField(default=timezone.now)
@@ -535,34 +717,44 @@ class Cohort(models.Model):
     
     
     @staticmethod
-    def student_member_now(course,user):
-        now = timezone.now()
-        cohorts = Cohort.objects.filter(coursecohort__course=course,start_date__lte=now,end_date__gte=now)
-        for c in cohorts:
-            participants = c.participant_set.filter(user=user,role=Participant.STUDENT)
+    def memberships_now(user):
+        '''
+        The cohorts the user is currently in, as a dict of course id: list of
+        (role, cohort), read in one query. This is kept on the user object, so
+        for request.user it's only read once per request
+        '''
+        if not hasattr(user, '_oppia_cohort_memberships'):
+            now = timezone.now()
+            participants = Participant.objects.filter(user=user,
+                                                      cohort__start_date__lte=now,
+                                                      cohort__end_date__gte=now) \
+                                              .annotate(course_id=F('cohort__coursecohort__course_id')) \
+                                              .select_related('cohort__schedule') \
+                                              .order_by('cohort_id', 'id')
+            memberships = {}
             for p in participants:
-                return c
+                memberships.setdefault(p.course_id, []).append((p.role, p.cohort))
+            user._oppia_cohort_memberships = memberships
+        return user._oppia_cohort_memberships
+    
+    @staticmethod
+    def _member_now(course, user, role=None):
+        for r, cohort in Cohort.memberships_now(user).get(course.id, []):
+            if role is None or r == role:
+                return cohort
         return None
     
+    @staticmethod
+    def student_member_now(course,user):
+        return Cohort._member_now(course, user, Participant.STUDENT)
+    
     @staticmethod
     def teacher_member_now(course,user):
-        now = timezone.now()
-        cohorts = Cohort.objects.filter(coursecohort__course=course,start_date__lte=now,end_date__gte=now)
-        for c in cohorts:
-            participants = c.participant_set.filter(user=user,role=Participant.TEACHER)
-            for p in participants:
-                return c
-        return None
+        return Cohort._member_now(course, user, Participant.TEACHER)
     
     @staticmethod
     def member_now(course,user):
-        now = timezone.now()
-        cohorts = Cohort.objects.filter(coursecohort__course=course,start_date__lte=now,end_date__gte=now)
-        for c in cohorts:
-            participants = c.participant_set.filter(user=user)
-            for p in participants:
-                return c
-        return None
+        return Cohort._member_now(course, user)
 
     def get_courses(self):
         courses = Course.objects.filter(coursecohort__cohort = self).order_by('title')
@@ -650,9 +842,13 @@ class Award(models.Model):
 
     @staticmethod
     def get_userawards(user, course=None):
+        if course is None:
+            # kept on the user object, so only counted once per request
+            if not hasattr(user, '_oppia_awards'):
+                user._oppia_awards = Award.objects.filter(user=user).count()
+            return user._oppia_awards
         awards = Award.objects.filter(user=user)
-        if course is not None:
-            awards = awards.filter(awardcourse__course=course) 
+        awards = awards.filter(awardcourse__course=course) 
         return awards.count()
     
     def _get_badge(self):
@@ -727,10 +923,19 @@ class Points(models.Model):
     
     @staticmethod
     def get_userscore(user):
-        score = Points.objects.filter(user=user).aggregate(total=Sum('points'))
-        if score['total'] is None:
-            return 0
-        return score['total']
+        return sum(points for shortname, points in UserCoursePoints.get_user_points(user))
+    
+    @staticmethod
+    def get_course_points(user):
+        '''
+        The user's total points for each course, as a list of dicts with
+        course__shortname and total_points
+        '''
+        totals = {}
+        for shortname, points in UserCoursePoints.get_user_points(user):
+            if shortname is not None:
+                totals[shortname] = totals.get(shortname, 0) + points
+        return [{'course__shortname': shortname, 'total_points': total} for shortname, total in sorted(totals.items())]
     
     @staticmethod
     def media_points(user,start_date=None,end_date=None,course=None):
@@ -773,7 +978,117 @@ class Points(models.Model):
         if score['total'] is None:
             return 0
         return score['total']
-    
 
-    
-    
+
+class UserCoursePoints(models.Model):
+    '''
+    Running total of each user's points for each course (and for the points
+    not for any course), updated whenever points are given, so the user's
+    points don't have to be added up from all their Points
+    '''
+    user = models.ForeignKey(User)
+    course = models.ForeignKey(Course, null=True, default=None, on_delete=models.SET_NULL)
+    points = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name = _('User course points')
+        verbose_name_plural = _('User course points')
+        unique_together = ("user", "course")
+
+    @staticmethod
+    def get_user_points(user):
+        '''
+        The user's points as a list of (course shortname, points), this is
+        kept on the user object, so for request.user it's only read once per
+        request
+        '''
+        if not hasattr(user, '_oppia_course_points'):
+            user._oppia_course_points = list(UserCoursePoints.objects.filter(user=user) \
+                                                                     .values_list('course__shortname', 'points'))
+        return user._oppia_course_points
+
+    @staticmethod
+    def add_points(points):
+        '''
+        Adds the (newly saved) Points to the running totals
+        '''
+        totals = {}
+        for p in points:
+            key = (p.user_id, p.course_id)
+            totals[key] = totals.get(key, 0) + p.points
+        with transaction.atomic():
+            UserCoursePoints.lock_users(set([user_id for user_id, course_id in totals]))
+            for (user_id, course_id), total in totals.items():
+                # there may be more than one row without a course, if courses
+                # have been deleted
+                pks = UserCoursePoints.objects.filter(user_id=user_id, course_id=course_id).values_list('pk', flat=True)[:1]
+                if pks:
+                    UserCoursePoints.objects.filter(pk=pks[0]).update(points=F('points') + total)
+                else:
+                    UserCoursePoints.objects.create(user_id=user_id, course_id=course_id, points=total)
+
+    @staticmethod
+    def update_user(user_id):
+        '''
+        Recalculates the user's totals from all their Points, eg after points
+        are edited or deleted
+        '''
+        with transaction.atomic():
+            UserCoursePoints.lock_users([user_id])
+            UserCoursePoints.objects.filter(user_id=user_id).delete()
+            UserCoursePoints.objects.bulk_create([UserCoursePoints(user_id=user_id, course_id=course_id, points=total)
+                                                  for course_id, total in Points.objects.filter(user_id=user_id) \
+                                                                                        .values_list('course') \
+                                                                                        .annotate(total=Sum('points'))])
+
+    @staticmethod
+    def lock_users(user_ids):
+        '''
+        Locks the users' rows until the end of the transaction, so their
+        totals are only updated by one worker at a time. The user is locked
+        rather than the totals, as the course total may not exist yet (and
+        the unique constraint doesn't stop duplicate rows without a course)
+        '''
+        list(User.objects.select_for_update().filter(pk__in=user_ids).order_by('pk').values_list('pk', flat=True))
+
+
+def points_saved(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        UserCoursePoints.add_points([instance])
+    else:
+        UserCoursePoints.update_user(instance.user_id)
+
+def points_deleted(sender, instance, **kwargs):
+    UserCoursePoints.update_user(instance.user_id)
+
+models.signals.post_save.connect(points_saved, sender=Points)
+models.signals.post_delete.connect(points_deleted, sender=Points)
+
+
+class PointsEvent(models.Model):
+    '''
+    Queue of events waiting for points to be given (or not) by the scoring
+    worker - see oppia/scoring.py
+    '''
+    EVENT_TYPES = (
+        ('signup', 'Sign up'),
+        ('trackers', 'Trackers submitted'),
+        ('quizattempt', 'Quiz attempt'),
+        ('quizcreated', 'Quiz created'),
+        ('coursedownloaded', 'Course downloaded'),
+        ('badgeawarded', 'Badge awarded'),
+    )
+    user = models.ForeignKey(User)
+    type = models.CharField(max_length=20,choices=EVENT_TYPES)
+    object_id = models.IntegerField(blank=True, null=True, default=None)
+    date = models.DateTimeField('date created',default=timezone.now)
+    data = models.TextField(blank=True)
+
+    class Meta:
+        verbose_name = _('Points event')
+        verbose_name_plural = _('Points events')
+
+    def __unicode__(self):
+        return self.type
+
+
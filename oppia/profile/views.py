@@ -26,7 +26,7 @@ from oppia.permissions import get_user, get_user_courses, can_view_course, can_e
 from oppia.profile.forms import LoginForm, RegisterForm, ResetForm, ProfileForm, UploadProfileForm, \
     UserSearchForm
 from oppia.profile.models import UserProfile
-from oppia.quiz.models import Quiz, QuizAttempt
+from oppia.quiz.models import QuizAttempt, quizzes_for_digests
 from oppia.reports.signals import dashboard_accessed
 from oppia.summary.models import UserCourseSummary
 
@@ -307,7 +307,8 @@ def user_course_activity_view(request, user_id, course_id):
     dashboard_accessed.send(sender=None, request=request, data=None)
     course = can_view_course(request, course_id)
 
-    act_quizzes = Activity.objects.filter(section__course=course,type=Activity.QUIZ).order_by('section__order','order')
+    act_quizzes = Activity.objects.filter(section__course=course,type=Activity.QUIZ).select_related('section').order_by('section__order','order')
+    digest_quizzes = quizzes_for_digests([aq.digest for aq in act_quizzes])
 
     quizzes_attempted = 0
     quizzes_passed = 0
@@ -315,10 +316,7 @@ def user_course_activity_view(request, user_id, course_id):
 
     quizzes = []
     for aq in act_quizzes:
-        try:
-            quiz = Quiz.objects.get(quizprops__value=aq.digest, quizprops__name="digest")
-        except Quiz.DoesNotExist:
-            quiz = None
+        quiz = digest_quizzes.get(aq.digest)
 
 
         attempts = QuizAttempt.objects.filter(quiz=quiz, user=view_user)
@@ -0,0 +1,212 @@
+# Interpreter deliberately excluded here - set it in your cron shell script.
+# /usr/bin/env python
+
+import argparse
+import datetime
+import logging
+import os
+import threading
+import time
+import uuid
+from multiprocessing.pool import ThreadPool
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.translation import ugettext_lazy as _
+
+from oppia.models import PublishJob, Tag, CourseTag
+from oppia.uploader import import_course, save_uploaded_file, UploadError, PENDING_DIR
+
+# Jobs are run by a pool of OPPIA_PUBLISH_WORKERS threads in the web server
+# process, so at most that many courses are imported at once (per process).
+# With OPPIA_PUBLISH_WORKERS set to 0, jobs are run as soon as they're added.
+#
+# Jobs are claimed from the PublishJob table before they're run, so this file
+# can also be run as a cron script to pick up any jobs left queued (eg when
+# the web server process was restarted), and to fail jobs left running
+#
+# Each upload is saved under a unique name in the PENDING_DIR, and only moved
+# to its own name once it's been published, so it can't replace the file of a
+# course (or another upload) before then
+
+logger = logging.getLogger(__name__)
+
+# running jobs not updated for this long (in minutes) are marked as failed
+STALE_JOB_MINUTES = 60
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def add_job(user, f, is_draft=None, tags=None):
+    '''
+    Saves the uploaded course file and queues it to be imported
+    '''
+    job = PublishJob()
+    job.user = user
+    job.filename = f.name
+    job.upload_path = '%s/%s.zip' % (PENDING_DIR, uuid.uuid4().hex)
+    save_uploaded_file(f, job.upload_path)
+    job.is_draft = is_draft
+    job.tags = tags
+    job.save()
+
+    if settings.OPPIA_PUBLISH_WORKERS == 0:
+        run_job(job.id)
+        job = PublishJob.objects.get(pk=job.id)
+    else:
+        get_pool().apply_async(_run_pool_job, (job.id,))
+    return job
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPool(settings.OPPIA_PUBLISH_WORKERS)
+        return _pool
+
+
+def claim_job(job_id=None):
+    '''
+    Marks the (given, or oldest) queued job as running, so it's only run
+    once. Returns None if there's no job to claim
+    '''
+    with transaction.atomic():
+        jobs = PublishJob.objects.select_for_update().filter(status=PublishJob.QUEUED).order_by('id')
+        if job_id is not None:
+            jobs = jobs.filter(pk=job_id)
+        job = jobs.first()
+        if job is None:
+            return None
+        job.status = PublishJob.RUNNING
+        job.set_progress('starting', 0)
+    return job
+
+
+def run_job(job_id):
+    job = claim_job(job_id)
+    if job is None:
+        # already claimed by another worker
+        return PublishJob.objects.get(pk=job_id)
+    return _import_job(job)
+
+
+def _import_job(job):
+    # jobs queued before the uploads were kept in the PENDING_DIR have no
+    # upload_path
+    zipfilepath = settings.COURSE_UPLOAD_DIR + (job.upload_path or job.filename)
+    try:
+        course = import_course(zipfilepath, job.filename, job.user, job.set_progress)
+        if job.is_draft is not None:
+            course.is_draft = job.is_draft
+            course.save()
+        if job.tags is not None:
+            set_course_tags(course, job.tags, job.user)
+    except UploadError as e:
+        job.status = PublishJob.FAILED
+        job.message = unicode(e.args[0])
+        job.set_progress('failed', job.progress)
+        _remove_upload(job)
+        return job
+    except Exception:
+        logger.exception('Error publishing %s (job %d)', job.filename, job.id)
+        job.status = PublishJob.FAILED
+        job.message = unicode(_(u"Sorry, there was an error publishing this course"))
+        job.set_progress('failed', job.progress)
+        _remove_upload(job)
+        return job
+
+    job.status = PublishJob.DONE
+    job.course = course
+    job.set_progress('done', 100)
+    return job
+
+
+def _remove_upload(job):
+    # the file of a failed job, unless it's already been moved to the filename
+    if job.upload_path:
+        try:
+            os.remove(settings.COURSE_UPLOAD_DIR + job.upload_path)
+        except OSError:
+            pass
+
+
+def _run_pool_job(job_id):
+    try:
+        run_job(job_id)
+    finally:
+        # each pool thread has its own database connection
+        connection.close()
+
+
+def set_course_tags(course, tags, user):
+    '''
+    Replaces the course tags with the (comma separated) tags, adding any new
+    tags
+    '''
+    # remove any existing tags
+    CourseTag.objects.filter(course=course).delete()
+
+    # add tags
+    for t in tags.strip().split(","):
+        try:
+            tag = Tag.objects.get(name__iexact=t.strip())
+        except Tag.DoesNotExist:
+            tag = Tag()
+            tag.name = t.strip()
+            tag.created_by = user
+            tag.save()
+        # add tag to course
+        try:
+            ct = CourseTag.objects.get(course=course,tag=tag)
+        except CourseTag.DoesNotExist:
+            ct = CourseTag()
+            ct.course = course
+            ct.tag = tag
+            ct.save()
+
+
+def fail_stale_jobs(minutes=STALE_JOB_MINUTES):
+    '''
+    Marks running jobs that haven't been updated for the given no of minutes
+    as failed, their worker having been stopped part way through
+    '''
+    cutoff = timezone.now() - datetime.timedelta(minutes=minutes)
+    return PublishJob.objects.filter(status=PublishJob.RUNNING, lastupdated_date__lt=cutoff) \
+                             .update(status=PublishJob.FAILED, stage='failed', lastupdated_date=timezone.now(),
+                                     message=unicode(_(u"Sorry, publishing this course was interrupted, please upload it again")))
+
+
+def run(wait=0):
+    print 'Starting OppiaMobile publishing worker...'
+    start = time.time()
+
+    failed = fail_stale_jobs()
+    if failed > 0:
+        print ('%d stale jobs marked as failed' % failed)
+
+    total = 0
+    while True:
+        job = claim_job()
+        if job is not None:
+            job = _import_job(job)
+            total += 1
+            print ('%s: %s' % (job.filename, job.status))
+        elif wait > 0:
+            time.sleep(wait)
+        else:
+            break
+
+    elapsed_time = time.time() - start
+    print ('publishing completed, %d jobs took %.2f seconds' % (total, elapsed_time))
+
+
+if __name__ == "__main__":
+    import django
+    django.setup()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--wait", help="keep running, checking for queued jobs every WAIT seconds", type=int, default=0)
+    args = parser.parse_args()
+    run(args.wait)
@@ -1,19 +1,27 @@
 # oppia/quiz/api/resources.py
+import json
+from decimal import InvalidOperation
+
 from django.conf.urls import url
 from django.contrib.auth import authenticate, login
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ObjectDoesNotExist, MultipleObjectsReturned, ValidationError
 from django.core.paginator import Paginator, InvalidPage
-from django.db import IntegrityError
-from django.db.models import Q
+from django.db import DataError, IntegrityError, transaction
+from django.db.models import Prefetch, Q
+from django.http import HttpResponse
 from django.http.response import Http404
 from django.utils.translation import ugettext as _
 
 from tastypie import fields, bundle, http
 from tastypie.authentication import Authentication, ApiKeyAuthentication
 from tastypie.authorization import Authorization
-from tastypie.exceptions import NotFound, BadRequest, InvalidFilterError, HydrationError, InvalidSortError, ImmediateHttpResponse
+from tastypie.exceptions import ApiFieldError, NotFound, BadRequest, InvalidFilterError, HydrationError, InvalidSortError, ImmediateHttpResponse
 from tastypie.models import ApiKey
-from tastypie.resources import ModelResource
+from tastypie.resources import ModelResource, dict_strip_unicode_keys
+from tastypie.utils import trailing_slash
+from tastypie.utils.mime import build_content_type
 
 from oppia.models import Points, Award
 from oppia.api.resources import UserResource
@@ -23,6 +31,7 @@ from oppia.quiz.api.validation import QuizOwnerValidation, QuestionOwnerValidati
 from oppia.quiz.api.validation import ResponseOwnerValidation, QuizAttemptValidation
 from oppia.quiz.models import Quiz, Question, QuizQuestion, Response, QuestionProps
 from oppia.quiz.models import QuizProps, ResponseProps, QuizAttempt, QuizAttemptResponse
+from oppia.quiz.models import QUIZ_JSON_CACHE_TIMEOUT, quiz_json_key
    
           
 class QuizResource(ModelResource):
@@ -48,6 +57,65 @@ class QuizResource(ModelResource):
         return [
             url(r"^(?P<resource_name>%s)/search/$" % self._meta.resource_name, self.wrap_view('get_search'), name="api_get_search"),
         ]
+    
+    def get_detail(self, request, **kwargs):
+        # quizzes hardly ever change once published, so the JSON sent to the
+        # app is cached, rather than dehydrating every question, response and
+        # prop for each request
+        if self.determine_format(request) != 'application/json':
+            return super(QuizResource, self).get_detail(request, **kwargs)
+        
+        basic_bundle = self.build_bundle(request=request)
+        try:
+            quiz = self.cached_obj_get(bundle=basic_bundle, **self.remove_api_resource_names(kwargs))
+        except ObjectDoesNotExist:
+            return http.HttpNotFound()
+        except MultipleObjectsReturned:
+            return http.HttpMultipleChoices("More than one resource is found at this URI.")
+        
+        key = quiz_json_key(quiz)
+        content = cache.get(key)
+        if content is None:
+            content = self.build_quiz_json(quiz)
+            cache.set(key, content, QUIZ_JSON_CACHE_TIMEOUT)
+        return HttpResponse(content, content_type=build_content_type('application/json'))
+    
+    def build_quiz_json(self, quiz):
+        '''
+        The same JSON as the dehydrated quiz, but with the questions, responses
+        and props all read in a few queries
+        '''
+        quiz = Quiz.objects.select_related('owner').prefetch_related(
+            Prefetch('quizprops_set', queryset=QuizProps.objects.order_by('id')),
+            Prefetch('quizquestion_set', queryset=QuizQuestion.objects.select_related('question').order_by('id')),
+            Prefetch('quizquestion_set__question__questionprops_set', queryset=QuestionProps.objects.order_by('id')),
+            Prefetch('quizquestion_set__question__response_set', queryset=Response.objects.order_by('id')),
+            Prefetch('quizquestion_set__question__response_set__responseprops_set', queryset=ResponseProps.objects.order_by('id')),
+        ).get(pk=quiz.pk)
+        
+        questions = []
+        for qq in quiz.quizquestion_set.all():
+            question = qq.question
+            responses = []
+            for r in question.response_set.all():
+                responses.append({'id': r.id, 'order': r.order, 'title': r.title, 'score': r.score,
+                                  'question': None, 'resource_uri': None,
+                                  'props': [{'name': p.name, 'value': p.value} for p in r.responseprops_set.all()]})
+            questions.append({'id': qq.id, 'order': qq.order,
+                              'question': {'id': question.id, 'title': question.title, 'type': question.type,
+                                           'owner': None, 'resource_uri': None,
+                                           'props': [{'name': p.name, 'value': p.value} for p in question.questionprops_set.all()],
+                                           'responses': responses}})
+        
+        data = {'id': quiz.id,
+                'title': quiz.title,
+                'description': quiz.description,
+                'lastupdated_date': quiz.lastupdated_date,
+                'owner': UserResource().get_resource_uri(quiz.owner),
+                'resource_uri': self.get_resource_uri(quiz),
+                'props': [{'name': p.name, 'value': p.value} for p in quiz.quizprops_set.all()],
+                'questions': questions}
+        return self._meta.serializer.to_json(data)
         
     def get_search(self, request, **kwargs):
         self.method_check(request, allowed=['get'])
@@ -182,7 +250,7 @@ class QuizPropsResource(ModelResource):
         
     # add the quiz_id into the bundle
     def dehydrate(self, bundle, request=None):
-        bundle.data['quiz_id'] = QuizResource().get_via_uri(bundle.data['quiz']).id 
+        bundle.data['quiz_id'] = bundle.obj.quiz_id
         return bundle
     
     # use this for filtering on the digest prop of a quiz to determine if it already exists
@@ -199,7 +267,8 @@ class QuizPropsResource(ModelResource):
         self.throttle_check(request)
         
         digest = kwargs.pop('digest', None)
-        quizprop = self._meta.queryset.filter(name = 'digest',quiz__deleted=0,quiz__draft=0).filter(value=digest)
+        # found through the (indexed) QuizDigest, rather than by the prop value
+        quizprop = self._meta.queryset.filter(name = 'digest',quiz__deleted=0,quiz__draft=0,quiz__quizdigest__digest=digest).filter(value=digest)
         paginator = Paginator(quizprop, 20)
 
         try:
@@ -235,7 +304,6 @@ class QuizAttemptResponseResource(ModelResource):
 class QuizAttemptResource(ModelResource):
     quiz = fields.ForeignKey(QuizResource, 'quiz')
     user = fields.ForeignKey(UserResource, 'user')
-    responses = fields.ToManyField('oppia.quiz.api.resources.QuizAttemptResponseResource', 'quizattemptresponse_set', related_name='quizattempt', full=True, null=True)
     points = fields.IntegerField(readonly=True)
     badges = fields.IntegerField(readonly=True)
     
@@ -247,39 +315,148 @@ class QuizAttemptResource(ModelResource):
         authorization = Authorization() 
         always_return_data = True 
         serializer = QuizAttemptJSONSerializer()
+    
+    def prepend_urls(self):
+        return [
+            url(r"^(?P<resource_name>%s)/batch%s$" % (self._meta.resource_name, trailing_slash()), self.wrap_view('post_batch'), name="api_quizattempt_batch"),
+        ]
         
     def hydrate(self, bundle, request=None):
-        bundle.obj.user = User.objects.get(pk = bundle.request.user.id)
+        bundle.obj.user = bundle.request.user
         bundle.obj.ip = bundle.request.META.get('REMOTE_ADDR','0.0.0.0')
         bundle.obj.agent = bundle.request.META.get('HTTP_USER_AGENT','unknown')
         
+        # post_batch looks up the quizzes, questions and submitted instance
+        # ids for the whole batch in advance
+        quizzes = getattr(bundle.request, 'quizzes', None)
+        quiz_questions = getattr(bundle.request, 'quiz_questions', {})
+        submitted = getattr(bundle.request, 'submitted_instance_ids', None)
+        
         # check the quiz exists
         try:
-            bundle.obj.quiz = Quiz.objects.get(pk = bundle.data['quiz_id'])
-        except Quiz.DoesNotExist:
+            if quizzes is not None:
+                bundle.obj.quiz = quizzes[int(bundle.data['quiz_id'])]
+            else:
+                bundle.obj.quiz = Quiz.objects.get(pk = bundle.data['quiz_id'])
+        except (Quiz.DoesNotExist, KeyError, TypeError, ValueError):
             raise BadRequest(_(u'Quiz does not exist'))    
         
         # see if instance id already submitted
-        attempts = QuizAttempt.objects.filter(instance_id = bundle.data['instance_id']).count()
-        
-        if attempts > 0:
-            raise BadRequest(_(u'QuizAttempt already submitted')) 
+        instance_id = bundle.data.get('instance_id', None)
+        if instance_id:
+            if submitted is not None:
+                already_submitted = instance_id in submitted
+            else:
+                already_submitted = QuizAttempt.objects.filter(instance_id = instance_id).exists()
+            if already_submitted:
+                raise BadRequest(_(u'QuizAttempt already submitted')) 
         
         #check that all the questions exist and are part of this quiz
-        for response in bundle.data['responses']:
-            if 'question_id' in response:
-                try:
-                    response['question'] = Question.objects.get(pk = response['question_id'])
-                except Question.DoesNotExist:
-                    raise BadRequest(_(u'Question does not exist'))
-                #check part of this quiz
-                try:
-                    QuizQuestion.objects.get(quiz=bundle.obj.quiz,question=response['question'])
-                except QuizQuestion.DoesNotExist:
-                    raise BadRequest(_(u'This question is not part of this quiz'))
-            
+        if bundle.obj.quiz.id not in quiz_questions:
+            quiz_questions[bundle.obj.quiz.id] = set(QuizQuestion.objects.filter(quiz=bundle.obj.quiz) \
+                                                                         .values_list('question_id', flat=True))
+        bundle.responses = self.get_responses(bundle, quiz_questions[bundle.obj.quiz.id])
         return bundle
     
+    def get_responses(self, bundle, quiz_question_ids):
+        '''
+        The (unsaved) QuizAttemptResponses for the attempt, checking all the
+        questions are part of the quiz
+        '''
+        question_ids = []
+        for response in bundle.data.get('responses', []):
+            try:
+                if 'question_id' in response:
+                    question_ids.append(int(response['question_id']))
+                else:
+                    question_ids.append(QuestionResource().get_via_uri(response['question'], bundle.request).id)
+            except (KeyError, TypeError, ValueError, NotFound, Question.DoesNotExist):
+                raise BadRequest(_(u'Question does not exist'))
+        
+        not_in_quiz = [id for id in question_ids if id not in quiz_question_ids]
+        if not_in_quiz:
+            if not Question.objects.filter(pk=not_in_quiz[0]).exists():
+                raise BadRequest(_(u'Question does not exist'))
+            raise BadRequest(_(u'This question is not part of this quiz'))
+        
+        responses = []
+        for question_id, response in zip(question_ids, bundle.data.get('responses', [])):
+            qar = QuizAttemptResponse()
+            qar.question_id = question_id
+            qar.score = response.get('score', 0)
+            qar.text = response.get('text', '') or ''
+            responses.append(qar)
+        return responses
+    
+    def obj_create(self, bundle, **kwargs):
+        # save the attempt and insert all its responses at once
+        with transaction.atomic():
+            bundle = super(QuizAttemptResource, self).obj_create(bundle, **kwargs)
+            for response in bundle.responses:
+                response.quizattempt = bundle.obj
+            QuizAttemptResponse.objects.bulk_create(bundle.responses)
+        return bundle
+    
+    def post_batch(self, request, **kwargs):
+        '''
+        Saves all the quiz attempts queued on the phone, the results list the
+        new attempt id, or the error, for each attempt in the same order
+        '''
+        self.method_check(request, allowed=['post'])
+        self.is_authenticated(request)
+        self.throttle_check(request)
+        
+        deserialized = self.deserialize(request, request.body, format=request.META.get('CONTENT_TYPE', 'application/json'))
+        if not isinstance(deserialized, dict) or not isinstance(deserialized.get('objects', None), list):
+            raise BadRequest(_(u'No quiz attempts submitted'))
+        attempts = [a for a in deserialized['objects'] if isinstance(a, dict)]
+        
+        # look up the quizzes, questions and submitted attempts for the whole
+        # batch in one go, rather than for each attempt
+        quiz_ids = set()
+        for a in attempts:
+            try:
+                quiz_ids.add(int(a.get('quiz_id')))
+            except (TypeError, ValueError):
+                pass
+        request.quizzes = Quiz.objects.in_bulk(list(quiz_ids))
+        request.quiz_questions = {}
+        for quiz_id, question_id in QuizQuestion.objects.filter(quiz_id__in=quiz_ids).values_list('quiz_id', 'question_id'):
+            request.quiz_questions.setdefault(quiz_id, set()).add(question_id)
+        for quiz_id in request.quizzes:
+            request.quiz_questions.setdefault(quiz_id, set())
+        instance_ids = [a['instance_id'] for a in attempts if a.get('instance_id', None)]
+        request.submitted_instance_ids = set(QuizAttempt.objects.filter(instance_id__in=instance_ids) \
+                                                                .values_list('instance_id', flat=True))
+        
+        # each attempt is saved (or rolled back) on its own, so one invalid
+        # attempt doesn't stop the rest of the batch being saved
+        results = []
+        for data in deserialized['objects']:
+            if not isinstance(data, dict):
+                results.append({'error': _(u'Invalid quiz attempt')})
+                continue
+            data = self.alter_deserialized_detail_data(request, data)
+            bundle = self.build_bundle(data=dict_strip_unicode_keys(data), request=request)
+            try:
+                with transaction.atomic():
+                    bundle = self.obj_create(bundle)
+            except (BadRequest, ApiFieldError) as e:
+                results.append({'error': e.args[0]})
+                continue
+            except (ValueError, InvalidOperation, ValidationError, IntegrityError, DataError):
+                results.append({'error': _(u'Invalid quiz attempt')})
+                continue
+            request.submitted_instance_ids.add(bundle.obj.instance_id)
+            results.append({'id': bundle.obj.id})
+        
+        bundle = self.build_bundle(request=request)
+        response_data = {'attempts': results,
+                         'points': self.dehydrate_points(bundle),
+                         'badges': self.dehydrate_badges(bundle)}
+        self.log_throttled_access(request)
+        return HttpResponse(content=json.dumps(response_data), content_type="application/json; charset=utf-8", status=201)
+    
     def dehydrate_points(self,bundle):
         points = Points.get_userscore(bundle.request.user)
         return points
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def copy_digest_props(apps, schema_editor):
+    QuizProps = apps.get_model('quiz', 'QuizProps')
+    QuizDigest = apps.get_model('quiz', 'QuizDigest')
+    digests = set(QuizProps.objects.filter(name='digest').values_list('quiz_id', 'value').iterator())
+    QuizDigest.objects.bulk_create([QuizDigest(quiz_id=quiz_id, digest=digest)
+                                    for quiz_id, digest in digests if len(digest) <= 100],
+                                   batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0004_quizattempt_uuid'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuizDigest',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('digest', models.CharField(max_length=100, db_index=True)),
+                ('quiz', models.ForeignKey(to='quiz.Quiz')),
+            ],
+            options={
+                'verbose_name': 'QuizDigest',
+                'verbose_name_plural': 'QuizDigests',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='quizdigest',
+            unique_together=set([('quiz', 'digest')]),
+        ),
+        migrations.RunPython(copy_digest_props, migrations.RunPython.noop),
+    ]
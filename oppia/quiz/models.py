@@ -2,12 +2,21 @@
 from django.apps import apps
 from django.contrib.auth.models import User
 from django.core import serializers
+from django.core.cache import cache
 from django.db import models
 from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 
 import datetime
 
+from oppia.bulk import batches
+
+# how long (in seconds) the JSON of each quiz, as sent to the app, is cached
+QUIZ_JSON_CACHE_TIMEOUT = 60 * 60 * 24
+
+# no of digests looked up in each query
+DIGEST_BATCH_SIZE = 400
+
 class Question(models.Model):
     QUESTION_TYPES = (
         ('multichoice', 'Multiple choice'),
@@ -32,8 +41,11 @@ class Question(models.Model):
         return self.title
     
     def get_maxscore(self):
-        props = QuestionProps.objects.get(question=self,name='maxscore')
-        return float(props.value);
+        # may have been read along with other questions' by preload_maxscores
+        if not hasattr(self, '_oppia_maxscore'):
+            props = QuestionProps.objects.get(question=self,name='maxscore')
+            self._oppia_maxscore = float(props.value)
+        return self._oppia_maxscore
 
 class Response(models.Model):
     owner = models.ForeignKey(User)
@@ -73,16 +85,8 @@ class Quiz(models.Model):
         return no_attempts
     
     def avg_score(self):
-        # TODO - sure this could be tidied up
-        attempts = QuizAttempt.objects.filter(quiz=self)
-        total = 0
-        for a in attempts:
-            total = total + a.get_score_percent()
-        if self.no_attempts > 0:
-            avg_score = int(total/self.no_attempts())
-        else:
-            avg_score = 0
-        return avg_score
+        from oppia.quiz.stats import get_quiz_stats
+        return get_quiz_stats(self).avg_score
     
 class QuizQuestion(models.Model):
     quiz = models.ForeignKey(Quiz)
@@ -105,6 +109,31 @@ class QuizProps(models.Model):
     def __unicode__(self):
         return self.name
     
+class QuizDigest(models.Model):
+    '''
+    The activity digest(s) of each quiz, copied from its 'digest' QuizProps
+    so quizzes can be found by digest with an indexed lookup
+    '''
+    quiz = models.ForeignKey(Quiz)
+    digest = models.CharField(max_length=100, db_index=True)
+    
+    class Meta:
+        verbose_name = _('QuizDigest')
+        verbose_name_plural = _('QuizDigests')
+        unique_together = ("quiz", "digest")
+        
+    def __unicode__(self):
+        return self.digest
+    
+    @staticmethod
+    def update_quiz(quiz_id):
+        '''
+        Copies the quiz's digest props
+        '''
+        digests = set(QuizProps.objects.filter(quiz_id=quiz_id, name='digest').values_list('value', flat=True))
+        QuizDigest.objects.filter(quiz_id=quiz_id).delete()
+        QuizDigest.objects.bulk_create([QuizDigest(quiz_id=quiz_id, digest=d) for d in digests if len(d) <= 100])
+    
 class QuestionProps(models.Model):
     question = models.ForeignKey(Question)
     name = models.CharField(max_length=200)
@@ -168,9 +197,9 @@ class QuizAttempt(models.Model):
             return False
         
     def get_quiz_digest(self):
-        qp = QuizProps.objects.filter(quiz=self.quiz,name='digest')
-        if qp.count() == 1:
-            return qp[0].value
+        digests = list(QuizDigest.objects.filter(quiz_id=self.quiz_id).values_list('digest', flat=True)[:2])
+        if len(digests) == 1:
+            return digests[0]
         else:
             return None
 
@@ -197,9 +226,100 @@ class QuizAttemptResponse(models.Model):
         verbose_name_plural = _('QuizAttemptResponses')
        
     def get_score_percent(self):
-        if self.question.get_maxscore() > 0:
-            percent = int(round(float(self.score) * 100 / self.question.get_maxscore()))
+        maxscore = self.question.get_maxscore()
+        if maxscore > 0:
+            percent = int(round(float(self.score) * 100 / maxscore))
         else:
             percent = 0
         return percent
   
+
+
+def get_maxscores(questions):
+    '''
+    The maxscores of the questions (a queryset or list of ids), as a dict of
+    question id: maxscore, read in one query
+    '''
+    maxscores = {}
+    for question_id, value in QuestionProps.objects.filter(question__in=questions, name='maxscore') \
+                                                   .values_list('question_id', 'value'):
+        try:
+            maxscores[question_id] = float(value)
+        except ValueError:
+            pass
+    return maxscores
+
+def preload_maxscores(responses):
+    '''
+    Reads the maxscores of all the responses' questions in one query, rather
+    than one (or more) for each response when get_score_percent is called
+    '''
+    responses = list(responses)
+    maxscores = get_maxscores(set(r.question_id for r in responses))
+    for r in responses:
+        if r.question_id in maxscores:
+            r.question._oppia_maxscore = maxscores[r.question_id]
+    return responses
+
+def quizzes_for_digests(digests):
+    '''
+    The quizzes for the activity digests, as a dict of digest: Quiz, read in
+    one query. Digests that don't have exactly one quiz are left out
+    '''
+    quizzes = {}
+    for batch in batches(set(digests), DIGEST_BATCH_SIZE):
+        for qd in QuizDigest.objects.filter(digest__in=batch).select_related('quiz'):
+            quizzes.setdefault(qd.digest, []).append(qd.quiz)
+    return dict((d, q[0]) for d, q in quizzes.items() if len(q) == 1)
+
+def quiz_digest_saved(sender, instance, **kwargs):
+    if instance.name == 'digest':
+        QuizDigest.update_quiz(instance.quiz_id)
+
+models.signals.post_save.connect(quiz_digest_saved, sender=QuizProps)
+models.signals.post_delete.connect(quiz_digest_saved, sender=QuizProps)
+
+
+def quiz_json_key(quiz):
+    return 'oppia_quiz_json_%d_%s' % (quiz.id, quiz.lastupdated_date.strftime('%Y%m%d%H%M%S%f'))
+
+def remove_quiz_json(quizzes):
+    '''
+    Removes the cached JSON of the quizzes, as one of their questions,
+    responses or props has changed
+    '''
+    cache.delete_many([quiz_json_key(q) for q in quizzes.only('id', 'lastupdated_date')])
+
+def quiz_saved(sender, instance, **kwargs):
+    cache.delete(quiz_json_key(instance))
+
+def quiz_part_saved(sender, instance, **kwargs):
+    if kwargs.get('raw'):
+        # loading fixtures, which are only loaded into new databases
+        return
+    if sender in (QuizQuestion, QuizProps):
+        quizzes = Quiz.objects.filter(pk=instance.quiz_id)
+    elif sender is Question:
+        quizzes = Quiz.objects.filter(quizquestion__question_id=instance.id)
+    elif sender in (QuestionProps, Response):
+        quizzes = Quiz.objects.filter(quizquestion__question_id=instance.question_id)
+    else:
+        quizzes = Quiz.objects.filter(quizquestion__question__response__id=instance.response_id)
+    remove_quiz_json(quizzes)
+
+def quiz_stats_key(quiz_id):
+    return 'oppia_quiz_stats_%d' % quiz_id
+
+def quiz_attempt_changed(sender, instance, **kwargs):
+    # new attempts are added to the cached statistics when they're next read
+    if not kwargs.get('created'):
+        cache.delete(quiz_stats_key(instance.quiz_id))
+
+models.signals.post_save.connect(quiz_attempt_changed, sender=QuizAttempt)
+models.signals.post_delete.connect(quiz_attempt_changed, sender=QuizAttempt)
+
+models.signals.post_save.connect(quiz_saved, sender=Quiz)
+models.signals.post_delete.connect(quiz_saved, sender=Quiz)
+for model in (QuizQuestion, QuizProps, Question, QuestionProps, Response, ResponseProps):
+    models.signals.post_save.connect(quiz_part_saved, sender=model)
+    models.signals.post_delete.connect(quiz_part_saved, sender=model)
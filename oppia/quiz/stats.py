@@ -0,0 +1,145 @@
+# oppia/quiz/stats.py
+import math
+
+from django.core.cache import cache
+from django.db.models import Case, Count, ExpressionWrapper, F, FloatField, IntegerField, Max, Q, Sum, Value, When
+
+from oppia.quiz.models import Question, QuizAttempt, QuizAttemptResponse, get_maxscores, quiz_stats_key
+
+# The statistics are kept in the cache as running sums, so when attempts are
+# added only the new attempts (those with a higher id than the last one
+# counted) are read and added to them. If any attempts are changed or
+# removed the sums are worked out again from all the attempts
+
+# how long (in seconds) the statistics of each quiz are cached
+QUIZ_STATS_CACHE_TIMEOUT = 60 * 60 * 24
+
+# no of (10% wide) bins in the score histogram, 100% is in the last bin
+HISTOGRAM_BINS = 10
+
+
+class QuizStats(object):
+    '''
+    The attempt counts, average score, score histogram and question
+    facility and discrimination indices of a quiz
+    '''
+    def __init__(self, quiz, data):
+        self.quiz = quiz
+        self.data = data
+        self.maxscores = None
+
+    @property
+    def no_attempts(self):
+        return self.data['no_attempts']
+
+    @property
+    def avg_score(self):
+        if self.data['no_attempts'] > 0:
+            return int(self.data['total_score'] * 100 / self.data['no_attempts'])
+        return 0
+
+    def get_histogram(self):
+        '''
+        List of (lowest percent, no attempts) for each bin
+        '''
+        return [(i * 100 / HISTOGRAM_BINS, n) for i, n in enumerate(self.data['histogram'])]
+
+    def get_question(self, question_id):
+        '''
+        The no of responses to the question, along with:
+
+        facility - the average score, as a percent of the question maxscore
+        discrimination - the correlation (from -1 to 1) of the question
+            score with the attempt score, how well the question picks out
+            the students who did well on the quiz as a whole
+        '''
+        if self.maxscores is None:
+            # only read when needed, not when just the attempt totals are used
+            self.maxscores = get_maxscores(Question.objects.filter(quizquestion__quiz_id=self.quiz.id))
+        n, sx, sxx, sy, syy, sxy = self.data['questions'].get(question_id, (0, 0, 0, 0, 0, 0))
+        facility = None
+        discrimination = None
+        if n > 0 and self.maxscores.get(question_id, 0) > 0:
+            facility = int(round(sx * 100 / (n * self.maxscores[question_id])))
+        variance = (n * sxx - sx * sx) * (n * syy - sy * sy)
+        if n > 1 and variance > 0:
+            discrimination = round((n * sxy - sx * sy) / math.sqrt(variance), 2)
+        return {
+            'no_responses': n,
+            'facility': facility,
+            'discrimination': discrimination,
+        }
+
+
+def get_quiz_stats(quiz):
+    data = cache.get(quiz_stats_key(quiz.id))
+    attempts = QuizAttempt.objects.filter(quiz_id=quiz.id)
+    if data is None or attempts.filter(id__lte=data['last_attempt_id']).count() != data['no_attempts']:
+        # first time, or an attempt counted has since been removed
+        data = {
+            'last_attempt_id': 0,
+            'no_attempts': 0,
+            'total_score': 0.0,
+            'histogram': [0] * HISTOGRAM_BINS,
+            'questions': {},
+        }
+    if add_new_attempts(quiz, data):
+        cache.set(quiz_stats_key(quiz.id), data, QUIZ_STATS_CACHE_TIMEOUT)
+    return QuizStats(quiz, data)
+
+
+def _score_fraction(prefix=''):
+    # the attempt score as a fraction of the maxscore, the same as
+    # QuizAttempt.get_score_percent (without the rounding)
+    return Case(When(**{prefix + 'maxscore__gt': 0, 'then': ExpressionWrapper(F(prefix + 'score') * Value(1.0) / F(prefix + 'maxscore'),
+                                                                               output_field=FloatField())}),
+                default=Value(0.0), output_field=FloatField())
+
+
+def add_new_attempts(quiz, data):
+    '''
+    Adds the attempts after the last one counted in data, returns whether
+    there were any
+    '''
+    last_id = data['last_attempt_id']
+    bins = {}
+    for i in range(HISTOGRAM_BINS):
+        # binned by the rounded percent, as shown on the attempt (those
+        # with no maxscore are 0%)
+        when = Q(maxscore__gt=0)
+        if i > 0:
+            when &= Q(score__gte=F('maxscore') * Value((i * 100.0 / HISTOGRAM_BINS - 0.5) / 100))
+        if i < HISTOGRAM_BINS - 1:
+            when &= Q(score__lt=F('maxscore') * Value(((i + 1) * 100.0 / HISTOGRAM_BINS - 0.5) / 100))
+        if i == 0:
+            when |= Q(maxscore__lte=0)
+        bins['bin_%d' % i] = Sum(Case(When(when, then=Value(1)), default=Value(0), output_field=IntegerField()))
+    totals = QuizAttempt.objects.filter(quiz_id=quiz.id, id__gt=last_id) \
+                                .aggregate(no_attempts=Count('id'), last_attempt_id=Max('id'),
+                                           total_score=Sum(_score_fraction()), **bins)
+    if totals['no_attempts'] == 0:
+        return False
+
+    data['last_attempt_id'] = totals['last_attempt_id']
+    data['no_attempts'] += totals['no_attempts']
+    data['total_score'] += totals['total_score']
+    for i in range(HISTOGRAM_BINS):
+        data['histogram'][i] += totals['bin_%d' % i]
+
+    # the sums needed for each question's facility and discrimination
+    fraction = _score_fraction('quizattempt__')
+    responses = QuizAttemptResponse.objects.filter(quizattempt__quiz_id=quiz.id, quizattempt__id__gt=last_id,
+                                                   quizattempt__id__lte=data['last_attempt_id']) \
+                                           .values('question_id') \
+                                           .annotate(n=Count('id'),
+                                                     sx=Sum('score', output_field=FloatField()),
+                                                     sxx=Sum(F('score') * F('score'), output_field=FloatField()),
+                                                     sy=Sum(fraction),
+                                                     syy=Sum(ExpressionWrapper(fraction * fraction, output_field=FloatField())),
+                                                     sxy=Sum(ExpressionWrapper(F('score') * fraction, output_field=FloatField())))
+    for r in responses:
+        new = (r['n'], r['sx'], r['sxx'], r['sy'], r['syy'], r['sxy'])
+        old = data['questions'].get(r['question_id'], (0, 0, 0, 0, 0, 0))
+        data['questions'][r['question_id']] = (old[0] + r['n'],) + \
+            tuple(float(o) + float(v or 0) for o, v in zip(old[1:], new[1:]))
+    return True
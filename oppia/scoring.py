@@ -0,0 +1,304 @@
+# Interpreter deliberately excluded here - set it in your cron shell script.
+# /usr/bin/env python
+
+import argparse
+import bisect
+import datetime
+import json
+import math
+import time
+
+from django.conf import settings
+from django.db import transaction
+
+from oppia.digests import get_digests
+from oppia.models import Points, PointsEvent, Tracker, TrackerArchive, Course, Award, UserCoursePoints
+from oppia.quiz.models import Quiz, QuizAttempt, QuizDigest
+from oppia.signals import apply_points
+
+DEFAULT_BATCH_SIZE = 500
+
+
+def process_events(batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Gives the points for the next batch of queued events (in the order they
+    were queued) and removes them from the queue. Returns the number of events
+    processed
+    """
+    with transaction.atomic():
+        events = list(PointsEvent.objects.select_for_update() \
+                                         .select_related('user') \
+                                         .order_by('id')[:batch_size])
+        if not events:
+            return 0
+
+        points = []
+        for type, rule in RULES:
+            type_events = [e for e in events if e.type == type]
+            if type_events:
+                points += rule(type_events)
+
+        # points are dated when the event happened, not when they're given
+        points.sort(key=lambda p: p.date)
+        Points.objects.bulk_create(points)
+        UserCoursePoints.add_points(points)
+        PointsEvent.objects.filter(id__in=[e.id for e in events]).delete()
+    return len(events)
+
+
+def new_points(event, type, points, description, course_id=None):
+    p = Points()
+    p.user = event.user
+    p.type = type
+    p.points = points
+    p.description = description
+    p.course_id = course_id
+    p.date = event.date
+    return p
+
+
+def signup_points(events):
+    points = []
+    for e in events:
+        if not apply_points(e.user):
+            continue
+        points.append(new_points(e, 'signup', settings.OPPIA_POINTS['REGISTER'], "Initial registration"))
+    return points
+
+
+def quizcreated_points(events):
+    quizzes = Quiz.objects.in_bulk([e.object_id for e in events])
+    points = []
+    for e in events:
+        quiz = quizzes.get(e.object_id)
+        if quiz is None or not apply_points(e.user):
+            continue
+        points.append(new_points(e, 'quizcreated', settings.OPPIA_POINTS['QUIZ_CREATED'], "Quiz created: " + quiz.title))
+    return points
+
+
+def badgeawarded_points(events):
+    awards = Award.objects.select_related('badge').in_bulk([e.object_id for e in events])
+    points = []
+    for e in events:
+        award = awards.get(e.object_id)
+        if award is None or not apply_points(e.user):
+            continue
+        points.append(new_points(e, 'badgeawarded', award.badge.points, award.description))
+    return points
+
+
+def coursedownloaded_points(events):
+    courses = Course.objects.in_bulk([e.object_id for e in events])
+
+    # including archived downloads, so they aren't counted as first downloads again
+    downloads = {}
+    for model in (Tracker, TrackerArchive):
+        for user_id, course_id, submitted_date in model.objects.filter(type='download',
+                                                                       user_id__in=set([e.user_id for e in events]),
+                                                                       course_id__in=courses.keys()) \
+                                                               .values_list('user_id', 'course_id', 'submitted_date'):
+            downloads.setdefault((user_id, course_id), []).append(submitted_date)
+
+    points = []
+    for e in events:
+        course = courses.get(e.object_id)
+        if course is None or not apply_points(e.user):
+            continue
+
+        if course.user_id == e.user_id and settings.OPPIA_COURSE_OWNERS_EARN_POINTS is False:
+            continue
+
+        # only the first download of the course gets points
+        no_downloads = len([d for d in downloads.get((e.user_id, course.id), []) if d <= e.date])
+        if no_downloads != 1:
+            continue
+
+        points.append(new_points(e, 'coursedownloaded', settings.OPPIA_POINTS['COURSE_DOWNLOADED'],
+                                 "Course downloaded: " + course.get_title(), course_id=course.id))
+    return points
+
+
+def quizattempt_points(events):
+    attempts = QuizAttempt.objects.select_related('quiz').in_bulk([e.object_id for e in events])
+    quiz_ids = set([a.quiz_id for a in attempts.values()])
+
+    # find out if the quizzes are part of a course (if they have a single digest)
+    quiz_digests = {}
+    for quiz_id, digest in QuizDigest.objects.filter(quiz_id__in=quiz_ids).values_list('quiz_id', 'digest'):
+        quiz_digests.setdefault(quiz_id, []).append(digest)
+    quiz_digests = dict((q, d[0]) for q, d in quiz_digests.items() if len(d) == 1)
+    entries = get_digests(quiz_digests.values())
+
+    history = {}
+    for id, user_id, quiz_id, submitted_date in QuizAttempt.objects.filter(quiz_id__in=quiz_ids,
+                                                                           user_id__in=set([e.user_id for e in events])) \
+                                                                   .values_list('id', 'user_id', 'quiz_id', 'submitted_date'):
+        history.setdefault((user_id, quiz_id), []).append((id, submitted_date))
+
+    points = []
+    for e in events:
+        quiz_attempt = attempts.get(e.object_id)
+        if quiz_attempt is None:
+            continue
+
+        # Check user doesn't own the quiz
+        quiz = quiz_attempt.quiz
+        if quiz.owner_id == quiz_attempt.user_id:
+            continue
+
+        if not apply_points(e.user):
+            continue
+
+        # TODO - what are chances of 2 courses having the exact same activity? and what to do if they do?
+        course_id = None
+        course_user_id = None
+        if quiz.id in quiz_digests:
+            for a in entries[quiz_digests[quiz.id]].activities:
+                course_id = a['course_id']
+                course_user_id = a['course_user_id']
+
+        if course_id is not None:
+            if course_user_id == quiz_attempt.user_id and settings.OPPIA_COURSE_OWNERS_EARN_POINTS is False:
+                continue
+
+        # the attempts there were when this one was saved
+        previous = [d for id, d in history.get((quiz_attempt.user_id, quiz.id), []) if id <= quiz_attempt.id]
+        olddate = e.date + datetime.timedelta(hours=-24)
+        score_percent = quiz_attempt.get_score_percent()
+
+        if len(previous) == 1:
+            # If it's the first time they've attempted this quiz award points
+            points.append(new_points(e, 'firstattempt', settings.OPPIA_POINTS['QUIZ_FIRST_ATTEMPT'],
+                                     "Bonus points for your first attempt at: " + quiz.title, course_id=course_id))
+
+            # add percentage points for their first attempt
+            if score_percent > 0:
+                points.append(new_points(e, 'firstattemptscore', score_percent,
+                                         "Score for first attempt at quiz: " + quiz.title, course_id=course_id))
+
+            # if you get 100% on first attempt get bonus of 50 points
+            if score_percent >= settings.OPPIA_POINTS['QUIZ_FIRST_ATTEMPT_THRESHOLD']:
+                points.append(new_points(e, 'firstattemptbonus', settings.OPPIA_POINTS['QUIZ_FIRST_ATTEMPT_BONUS'],
+                                         "Bonus points for getting 100% in first attempt at quiz: " + quiz.title, course_id=course_id))
+
+        elif len([d for d in previous if d >= olddate]) == 1:
+            # If it's the first time today they've attempted this quiz award 10 points
+            points.append(new_points(e, 'quizattempt', settings.OPPIA_POINTS['QUIZ_ATTEMPT'],
+                                     "Quiz attempt at: " + quiz.title, course_id=course_id))
+    return points
+
+
+def trackers_points(events):
+    event_trackers = dict((e.id, json.loads(e.data)) for e in events)
+    digests = set()
+    for trackers in event_trackers.values():
+        digests.update([t['digest'] for t in trackers])
+    entries = get_digests(digests)
+
+    # completed trackers in the 24 hours before each event
+    olddate = min([e.date for e in events]) + datetime.timedelta(hours=-24)
+    completed = {}
+    for model in (Tracker, TrackerArchive):
+        for user_id, digest, submitted_date in model.objects.filter(user_id__in=set([e.user_id for e in events]),
+                                                                    digest__in=digests,
+                                                                    completed=True,
+                                                                    submitted_date__gte=olddate,
+                                                                    submitted_date__lte=max([e.date for e in events])) \
+                                                            .values_list('user_id', 'digest', 'submitted_date'):
+            completed.setdefault((user_id, digest), []).append(submitted_date)
+    for dates in completed.values():
+        dates.sort()
+
+    points = []
+    for e in events:
+        trackers = event_trackers[e.id]
+        if not apply_points(e.user):
+            continue
+
+        # no of completed trackers in the last 24 hours, before these trackers were added
+        olddate = e.date + datetime.timedelta(hours=-24)
+        completed_today = {}
+        for t in trackers:
+            if t['digest'] not in completed_today:
+                dates = completed.get((e.user_id, t['digest']), [])
+                completed_today[t['digest']] = bisect.bisect_right(dates, e.date) - bisect.bisect_left(dates, olddate)
+            if t['completed']:
+                completed_today[t['digest']] -= 1
+
+        for t in trackers:
+            # keep a running count, so each tracker is treated as if saved in turn
+            if t['completed']:
+                completed_today[t['digest']] += 1
+            is_first_tracker_today = (completed_today[t['digest']] == 1)
+
+            entry = entries[t['digest']]
+            if not entry.exists():
+                continue
+
+            if t['course_id'] is not None and entry.get_course_user_id(t['course_id']) == e.user_id and settings.OPPIA_COURSE_OWNERS_EARN_POINTS is False:
+                continue
+
+            is_media = (entry.get_type() == "media")
+            if not is_media:
+                if not is_first_tracker_today:
+                    continue
+                if not t['completed']:
+                    continue
+
+            title = entry.get_title()
+            if title is None:
+                title = t['activity_title']
+
+            if is_media:
+                if is_first_tracker_today:
+                    media_points = settings.OPPIA_POINTS['MEDIA_STARTED']
+                else:
+                    media_points = 0
+                media_points += (settings.OPPIA_POINTS['MEDIA_PLAYING_POINTS_PER_INTERVAL'] * math.floor(t['time_taken']/settings.OPPIA_POINTS['MEDIA_PLAYING_INTERVAL']))
+                if media_points > settings.OPPIA_POINTS['MEDIA_MAX_POINTS']:
+                    media_points = settings.OPPIA_POINTS['MEDIA_MAX_POINTS']
+                points.append(new_points(e, 'mediaplayed', media_points, "Media played: " + title, course_id=t['course_id']))
+            else:
+                points.append(new_points(e, 'activitycompleted', settings.OPPIA_POINTS['ACTIVITY_COMPLETED'],
+                                         "Activity completed: " + title, course_id=t['course_id']))
+    return points
+
+
+RULES = (
+    ('signup', signup_points),
+    ('trackers', trackers_points),
+    ('quizattempt', quizattempt_points),
+    ('quizcreated', quizcreated_points),
+    ('coursedownloaded', coursedownloaded_points),
+    ('badgeawarded', badgeawarded_points),
+)
+
+
+def run(batch_size=DEFAULT_BATCH_SIZE, wait=0):
+    print 'Starting OppiaMobile scoring worker...'
+    start = time.time()
+
+    total = 0
+    while True:
+        processed = process_events(batch_size)
+        total += processed
+        if processed > 0:
+            print ('%d events processed' % processed)
+        elif wait > 0:
+            time.sleep(wait)
+        else:
+            break
+
+    elapsed_time = time.time() - start
+    print ('scoring completed, %d events took %.2f seconds' % (total, elapsed_time))
+
+
+if __name__ == "__main__":
+    import django
+    django.setup()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch-size", help="no of queued events to process at a time", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--wait", help="keep running, checking the queue every WAIT seconds", type=int, default=0)
+    args = parser.parse_args()
+    run(args.batch_size, args.wait)
@@ -4,12 +4,13 @@ from django.contrib.auth.models import User
 from django.db import models
 from django.dispatch import Signal
 
-from oppia.models import Points, Award, Tracker, Activity, Section, Course, Cohort
+from oppia.models import PointsEvent, Tracker, UserActivityCompletion
 from oppia.quiz.models import Quiz, QuizAttempt
 
-import math
+import json
 
 course_downloaded = Signal(providing_args=["course", "user"])
+trackers_created = Signal(providing_args=["trackers", "user"])
 
 # rules for applying points (or not)
 def apply_points(user):
@@ -20,6 +21,28 @@ def apply_points(user):
     return True
     
         
+
+def enqueue_event(user, type, object_id=None, data=None):
+    """
+    Points are given by the scoring worker (oppia/scoring.py), so the callbacks
+    below only add the event to the queue
+    """
+    e = PointsEvent()
+    e.user = user
+    e.type = type
+    e.object_id = object_id
+    if data is not None:
+        e.data = json.dumps(data)
+    e.save()
+    return e
+
+def tracker_data(tracker):
+    return {'digest': tracker.digest,
+            'course_id': tracker.course_id,
+            'completed': tracker.completed,
+            'time_taken': tracker.time_taken,
+            'activity_title': tracker.activity_title }
+
 def signup_callback(sender, **kwargs):
     user = kwargs.get('instance')
     created = kwargs.get('created')
@@ -27,79 +50,14 @@ def signup_callback(sender, **kwargs):
         return
 
     if created:
-        p = Points()
-        p.points = settings.OPPIA_POINTS['REGISTER']
-        p.type = 'signup'
-        p.description = "Initial registration"
-        p.user = user
-        p.save()
+        enqueue_event(user, 'signup')
     return
 
 def quizattempt_callback(sender, **kwargs):
     quiz_attempt = kwargs.get('instance')
-    
-    # Check user doesn't own the quiz
-    quiz = quiz_attempt.quiz
-    if quiz.owner == quiz_attempt.user:
-        return
-    
     if not apply_points(quiz_attempt.user):
         return 
-    
-    # find out if this quiz is part of a course
-    course = None
-    digest = quiz_attempt.get_quiz_digest()
-    if digest is not None:
-        # TODO - what are chances of 2 courses having the exact same activity? and what to do if they do?
-        acts = Activity.objects.filter(digest=digest)
-        for a in acts:
-            course = a.section.course
-        
-    # find out is user is part of the cohort for this course
-    if course is not None:
-        if course.user == quiz_attempt.user and settings.OPPIA_COURSE_OWNERS_EARN_POINTS is False:
-            return
-              
-    if quiz_attempt.is_first_attempt():
-        # If it's the first time they've attempted this quiz award points
-        p = Points()
-        p.points = settings.OPPIA_POINTS['QUIZ_FIRST_ATTEMPT']
-        p.type = 'firstattempt'
-        p.user = quiz_attempt.user
-        p.description = "Bonus points for your first attempt at: " + quiz.title
-        p.course = course
-        p.save()
-    
-        # add percentage points for their first attempt
-        if quiz_attempt.get_score_percent() > 0:
-            p = Points()
-            p.points = quiz_attempt.get_score_percent()
-            p.type = 'firstattemptscore'
-            p.description = "Score for first attempt at quiz: " + quiz.title
-            p.user = quiz_attempt.user
-            p.course = course
-            p.save()
-        
-        # if you get 100% on first attempt get bonus of 50 points
-        if quiz_attempt.get_score_percent() >= settings.OPPIA_POINTS['QUIZ_FIRST_ATTEMPT_THRESHOLD']:
-            p = Points()
-            p.points = settings.OPPIA_POINTS['QUIZ_FIRST_ATTEMPT_BONUS']
-            p.type = 'firstattemptbonus'
-            p.description = "Bonus points for getting 100% in first attempt at quiz: " + quiz.title
-            p.user = quiz_attempt.user
-            p.course = course
-            p.save()
-            
-    elif quiz_attempt.is_first_attempt_today():
-        # If it's the first time today they've attempted this quiz award 10 points
-        p = Points()
-        p.points = settings.OPPIA_POINTS['QUIZ_ATTEMPT']
-        p.type = 'quizattempt'
-        p.user = quiz_attempt.user
-        p.description = "Quiz attempt at: " + quiz.title
-        p.course = course
-        p.save()
-    
+    enqueue_event(quiz_attempt.user, 'quizattempt', object_id=quiz_attempt.id)
     return
 
 def createquiz_callback(sender, **kwargs):
@@ -110,56 +68,29 @@ def createquiz_callback(sender, **kwargs):
         return
     
     if created:
-        p = Points()
-        p.points = settings.OPPIA_POINTS['QUIZ_CREATED']
-        p.type = 'quizcreated'
-        p.description = "Quiz created: " + quiz.title
-        p.user = quiz.owner
-        p.save()
+        enqueue_event(quiz.owner, 'quizcreated', object_id=quiz.id)
     return
 
 def tracker_callback(sender, **kwargs):
     tracker = kwargs.get('instance')
-    if not apply_points(tracker.user):
+    # eg downloads, which are given points by the course_downloaded signal
+    if not tracker.digest:
         return
-    
-    if not tracker.activity_exists():
+    if not apply_points(tracker.user):
         return
-    
-    if tracker.course is not None and tracker.course.user == tracker.user and settings.OPPIA_COURSE_OWNERS_EARN_POINTS is False:
+    enqueue_event(tracker.user, 'trackers', data=[tracker_data(tracker)])
+    return
+
+def trackers_created_callback(sender, **kwargs):
+    """
+    Queues a batch of trackers from the same user that have been inserted with
+    bulk_create, as a single event
+    """
+    trackers = [t for t in kwargs.get('trackers') if t.digest]
+    user = kwargs.get('user')
+    if not trackers or not apply_points(user):
         return
-    
-    if tracker.get_activity_type() is not "media":
-        if not tracker.is_first_tracker_today():
-            return
-        if not tracker.completed:
-            return
-    
-    type = 'activitycompleted'
-    points = settings.OPPIA_POINTS['ACTIVITY_COMPLETED']
-    if tracker.get_activity_type() == "media":
-        description =  "Media played: " + tracker.get_activity_title()
-        type = 'mediaplayed'
-        if tracker.is_first_tracker_today():
-            points = settings.OPPIA_POINTS['MEDIA_STARTED']
-        else:
-            points = 0
-        points += (settings.OPPIA_POINTS['MEDIA_PLAYING_POINTS_PER_INTERVAL'] * math.floor(tracker.time_taken/settings.OPPIA_POINTS['MEDIA_PLAYING_INTERVAL']))
-        if points > settings.OPPIA_POINTS['MEDIA_MAX_POINTS']:
-            points = settings.OPPIA_POINTS['MEDIA_MAX_POINTS']
-    else:
-        description = "Activity completed: " + tracker.get_activity_title()    
-       
-    p = Points()
-    p.points = points
-    p.type = type
-    p.description = description
-    p.user = tracker.user
-    p.course = tracker.course
-    p.save()
-    
-    # @TODO test if tracker submitted on time
-    
+    enqueue_event(user, 'trackers', data=[tracker_data(t) for t in trackers])
     return
 
 def course_download_callback(sender, **kwargs):
@@ -167,37 +98,31 @@ def course_download_callback(sender, **kwargs):
     course = kwargs.get('course')
     if not apply_points(user):
         return
-    
-    if course.user == user and settings.OPPIA_COURSE_OWNERS_EARN_POINTS is False:
-        return
-    
-    if not course.is_first_download(user):
-        return 
-    
-    p = Points()
-    p.points = settings.OPPIA_POINTS['COURSE_DOWNLOADED']
-    p.type = 'coursedownloaded'
-    p.description = "Course downloaded: " + course.get_title()
-    p.user = user
-    p.course = course
-    p.save()
+    enqueue_event(user, 'coursedownloaded', object_id=course.id)
     return
 
 def badgeaward_callback(sender, **kwargs):
     award = kwargs.get('instance')
     if not apply_points(award.user):
         return
+    enqueue_event(award.user, 'badgeawarded', object_id=award.id)
+    return
+
+def activity_completion_callback(sender, **kwargs):
+    tracker = kwargs.get('instance')
+    UserActivityCompletion.update_from_trackers([tracker])
+    return
 
-    p = Points()
-    p.points = award.badge.points
-    p.type = 'badgeawarded'
-    p.description = award.description
-    p.user = award.user
-    p.save()
+def activities_completion_callback(sender, **kwargs):
+    trackers = kwargs.get('trackers')
+    UserActivityCompletion.update_from_trackers(trackers)
     return
 
 course_downloaded.connect(course_download_callback)
+trackers_created.connect(trackers_created_callback)
+trackers_created.connect(activities_completion_callback)
 models.signals.post_save.connect(tracker_callback, sender=Tracker)
+models.signals.post_save.connect(activity_completion_callback, sender=Tracker)
 models.signals.post_save.connect(signup_callback, sender=User)
 models.signals.post_save.connect(createquiz_callback, sender=Quiz)
 models.signals.post_save.connect(quizattempt_callback, sender=QuizAttempt)
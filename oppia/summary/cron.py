@@ -1,21 +1,38 @@
 # Interpreter deliberately excluded here - set it in your cron shell script.
 # /usr/bin/env python
 
+import argparse
+import datetime
+import math
+import multiprocessing
 import time
 
-from datetime import date
-
 import oppia
-from django.contrib.auth.models import User
-from django.db.models import Count
+from django.db import connection, connections, transaction
+from django.db.models import Count, Sum, Case, When, Value, IntegerField
 
-from oppia.models import Tracker, Points, Course
+from oppia.bulk import bulk_update, batches
+from oppia.models import Tracker, TrackerArchive, Points, Activity, Award, UserActivityCompletion
+from oppia.quiz.models import QuizDigest, QuizAttempt
 from oppia.summary.models import SettingProperties, UserCourseSummary, CourseDailyStats, UserPointsSummary
 
+# no of trackers (and points) to summarise before saving the checkpoint
+DEFAULT_CHUNK_SIZE = 50000
+# no of users/courses to include in each "IN (...)" lookup
+LOOKUP_BATCH_SIZE = 400
+
+
+def report(stage, **values):
+    """
+    Progress is written as one "summary <stage> key=value ..." line per stage,
+    so the output can be easily parsed/filtered
+    """
+    print ' '.join(['summary', stage] + ['%s=%s' % (k, values[k]) for k in sorted(values.keys())])
 
-def run():
-    print 'Starting Oppia Summary cron...'
+
+def run(workers=1, chunk_size=DEFAULT_CHUNK_SIZE):
     start = time.time()
+    report('start', workers=workers, chunk_size=chunk_size)
 
     # get last tracker and points PKs processed
     last_tracker_pk = SettingProperties.get_property('last_tracker_pk', 0)
@@ -27,98 +44,395 @@ def run():
         newest_tracker_pk = Tracker.objects.latest('id').id
         newest_points_pk  = Points.objects.latest('id').id
     except oppia.models.Tracker.DoesNotExist:
-        print "Tracker table is empty. Aborting cron..."
+        report('aborted', reason='no_trackers')
         return
     except oppia.models.Points.DoesNotExist:
         newest_points_pk = last_points_pk
 
-    print ('Last tracker processed: %d\nNewest tracker: %d\n' % (last_tracker_pk, newest_tracker_pk))
+    report('window', last_tracker_pk=last_tracker_pk, newest_tracker_pk=newest_tracker_pk,
+           last_points_pk=last_points_pk, newest_points_pk=newest_points_pk)
     if last_tracker_pk >= newest_tracker_pk:
-        print('No new trackers to process. Aborting cron...')
+        report('aborted', reason='no_new_trackers')
         return
 
+    if last_tracker_pk == 0 and last_points_pk == 0:
+        # the archived trackers are only counted in the existing summaries,
+        # so these can't be worked out again once any have been archived
+        if TrackerArchive.objects.exists():
+            report('aborted', reason='trackers_archived')
+            return
+
+        # summarising everything again, so the old summaries are replaced
+        # (rather than just those of the user/courses in the first chunk)
+        with transaction.atomic():
+            UserCourseSummary.objects.all().delete()
+            CourseDailyStats.objects.all().delete()
+            UserPointsSummary.objects.all().delete()
+        report('reset')
+
+    windows = chunk_windows((last_tracker_pk, newest_tracker_pk, last_points_pk, newest_points_pk), chunk_size)
+    for chunk, window in enumerate(windows):
+        chunk_start = time.time()
+        results = summarise(window, affected_users(window), workers)
+
+        # the summaries and the checkpoint are only saved once all the shards
+        # have been summarised, and are saved together so that if the cron is
+        # stopped the next run carries on from the last chunk saved
+        with transaction.atomic():
+            save_results(window, results)
+
+            # update last tracker and points PKs with the last one processed
+            SettingProperties.objects.update_or_create(key='last_tracker_pk', defaults={"int_value":window[1]})
+            SettingProperties.objects.update_or_create(key='last_points_pk', defaults={"int_value":window[3]})
+
+        report('chunk', chunk=chunk + 1, chunks=len(windows), last_tracker_pk=window[1], last_points_pk=window[3],
+               seconds='%.2f' % (time.time() - chunk_start))
+
+    report('completed', seconds='%.2f' % (time.time() - start))
+
+
+def chunk_windows(window, chunk_size):
+    """
+    Splits the tracker and points pk ranges into (at most) chunk_size pks each
+    """
+    last_tracker_pk, newest_tracker_pk, last_points_pk, newest_points_pk = window
+    no_chunks = max(int(math.ceil(float(newest_tracker_pk - last_tracker_pk) / chunk_size)),
+                    int(math.ceil(float(newest_points_pk - last_points_pk) / chunk_size)),
+                    1)
+    windows = []
+    for i in range(no_chunks):
+        windows.append((min(last_tracker_pk + i * chunk_size, newest_tracker_pk),
+                        min(last_tracker_pk + (i + 1) * chunk_size, newest_tracker_pk),
+                        min(last_points_pk + i * chunk_size, newest_points_pk),
+                        min(last_points_pk + (i + 1) * chunk_size, newest_points_pk)))
+    return windows
+
+
+def affected_users(window):
+    last_tracker_pk, newest_tracker_pk, last_points_pk, newest_points_pk = window
+    user_ids = set(Tracker.objects.filter(pk__gt=last_tracker_pk, pk__lte=newest_tracker_pk) \
+                                  .values_list('user', flat=True).distinct())
+    user_ids.update(points_window(last_points_pk, newest_points_pk).values_list('user', flat=True).distinct())
+    return sorted(user_ids)
+
+
+def summarise(window, user_ids, workers=1):
+    """
+    Splits the users into shards (one per worker) and summarises each shard,
+    in a pool of processes if there's more than one worker. Nothing is saved
+    here, the shard results are merged and returned
+    """
+    shards = [(window, user_ids[i::workers]) for i in range(workers)]
+    if workers > 1:
+        # each process has to open its own database connection
+        connections.close_all()
+        pool = multiprocessing.Pool(workers)
+        try:
+            results = pool.map(summarise_shard, shards)
+        finally:
+            pool.terminate()
+            pool.join()
+    else:
+        results = map(summarise_shard, shards)
+    return merge_results(results)
+
+
+def summarise_shard(args):
+    window, user_ids = args
+    start = time.time()
+    result = new_result()
+    for batch in batches(user_ids, LOOKUP_BATCH_SIZE):
+        result['summaries'] += user_course_summaries(window, batch)
+        add_totals(result['daily'], course_daily_totals(window, batch))
+        add_totals(result['points'], user_points_totals(window, batch))
+    report('shard', users=len(user_ids), summaries=len(result['summaries']),
+           seconds='%.2f' % (time.time() - start))
+    return result
+
+
+def new_result():
+    return {'summaries': [], 'daily': {}, 'points': {}}
+
+
+def merge_results(results):
+    merged = new_result()
+    for result in results:
+        merged['summaries'] += result['summaries']
+        add_totals(merged['daily'], result['daily'])
+        add_totals(merged['points'], result['points'])
+    return merged
+
+
+def add_totals(totals, new_totals):
+    for key, total in new_totals.items():
+        if key in totals:
+            totals[key] = (totals[key] or 0) + (total or 0)
+        else:
+            totals[key] = total
+
+
+def save_results(window, results):
+    last_tracker_pk, newest_tracker_pk, last_points_pk, newest_points_pk = window
+    save_user_course_summaries(results['summaries'])
+    save_course_daily_stats(results['daily'], first_tracker=(last_tracker_pk == 0))
+    save_user_points_summaries(results['points'], first_points=(last_points_pk == 0))
+
+
+def user_course_summaries(window, user_ids):
+    """
+    The updated UserCourseSummary (not saved) for each of the user's courses
+    with new trackers or points
+    """
+    last_tracker_pk, newest_tracker_pk, last_points_pk, newest_points_pk = window
+    first_tracker = (last_tracker_pk == 0)
+    first_points = (last_points_pk == 0)
+
+    trackers = Tracker.objects.filter(pk__gt=last_tracker_pk, pk__lte=newest_tracker_pk, user__in=user_ids) \
+                              .exclude(course__isnull=True)
+    tracker_totals = {}
+    for t in trackers.values('user', 'course') \
+                     .annotate(total=Count('id'),
+                               downloads=Sum(Case(When(type='download', then=Value(1)), default=Value(0), output_field=IntegerField()))):
+        tracker_totals[(t['user'], t['course'])] = t
+
+    points = points_window(last_points_pk, newest_points_pk).filter(user__in=user_ids).exclude(course__isnull=True)
+    points_totals = {}
+    for p in points.values('user', 'course').annotate(total=Sum('points')):
+        points_totals[(p['user'], p['course'])] = p['total']
+
+    # points may be given after the trackers they're for have been summarised,
+    # so the user/courses with new points are updated too
+    pairs = sorted(set(tracker_totals.keys()) | set(points_totals.keys()))
+    course_ids = set([course_id for user_id, course_id in pairs])
+    if not pairs:
+        return []
+
+    activities, quizzes = course_activity_digests(course_ids)
+    pretest_quizzes = course_pretest_quizzes(course_ids)
+    completed = activities_completed(user_ids, course_ids, activities)
+    quizzes_completed = activities_completed(user_ids, course_ids, quizzes)
+    badges = badges_achieved(user_ids, course_ids)
+    pretest_scores = pretest_score(user_ids, pretest_quizzes)
 
-    # get different (distinct) user/courses involved
-    userCourses = Tracker.objects\
-            .filter(pk__gt=last_tracker_pk, pk__lte=newest_tracker_pk)\
-            .exclude(course__isnull=True)\
-            .values('course', 'user').distinct()
-
-    totalUsers = userCourses.count()
-    print ('%d different user/courses to process.' % totalUsers)
-
-    count = 1
-    for ucTracker in userCourses:
-        print ('processing user/course trackers... (%d/%d)' % (count, totalUsers))
-        print ucTracker
-        user = User.objects.get(pk=ucTracker['user'])
-        course = Course.objects.get(pk=ucTracker['course'])
-        userCourse, created = UserCourseSummary.objects.get_or_create(course=course, user=user)
-        userCourse.update_summary(
-                last_tracker_pk=last_tracker_pk, last_points_pk=last_points_pk,
-                newest_tracker_pk=newest_tracker_pk, newest_points_pk=newest_points_pk)
-        count+=1
-
-
-    # get different (distinct) courses/dates involved
-    courseDailyTypeLogs = Tracker.objects\
-            .filter(pk__gt=last_tracker_pk, pk__lte=newest_tracker_pk, user__is_staff=False)\
-            .exclude(course__isnull=True)\
-            .extra({'day':"day(tracker_date)",'month':"month(tracker_date)", 'year':"year(tracker_date)"})\
-            .values('course', 'day','month','year', 'type')\
-            .annotate(total=Count('type'))\
-            .order_by('day')
-
-    totalLogs = courseDailyTypeLogs.count()
-    print ('%d different courses/dates/types to process.' % totalLogs)
-    count = 0
-    for typeLog in courseDailyTypeLogs:
-        day = date(typeLog['year'], typeLog['month'], typeLog['day'])
-        course = Course.objects.get(pk=typeLog['course'])
-        stats, created = CourseDailyStats.objects.get_or_create(course=course, day=day, type=typeLog['type'])
-        stats.total = (0 if last_tracker_pk == 0 else stats.total) + typeLog['total']
-        stats.save()
-
-        count+=1
-        print count
+    existing = {}
+    for s in UserCourseSummary.objects.filter(user__in=user_ids, course__in=course_ids):
+        existing[(s.user_id, s.course_id)] = s
+
+    summaries = []
+    for pair in pairs:
+        user_id, course_id = pair
+        summary = existing.get(pair, UserCourseSummary(user_id=user_id, course_id=course_id))
+
+        ### Add the values that are directly obtained from the last pks
+        totals = tracker_totals.get(pair, {'total': 0, 'downloads': 0})
+        summary.total_activity  = (0 if first_tracker else summary.total_activity) + totals['total']
+        summary.total_downloads = (0 if first_tracker else summary.total_downloads) + (totals['downloads'] or 0)
+
+        new_points = points_totals.get(pair)
+        if new_points:
+            summary.points = (0 if first_points else summary.points) + new_points
+
+        ### Values that need to be recalculated (as the course digests may vary)
+        summary.pretest_score = pretest_scores.get((user_id, pretest_quizzes.get(course_id)))
+        summary.quizzes_passed = quizzes_completed.get(pair, 0)
+        summary.badges_achieved = badges.get(pair, 0)
+        summary.completed_activities = completed.get(pair, 0)
+        summaries.append(summary)
+    return summaries
+
+
+def save_user_course_summaries(summaries):
+    start = time.time()
+    created = [s for s in summaries if s.pk is None]
+    updated = [s for s in summaries if s.pk is not None]
+    UserCourseSummary.objects.bulk_create(created)
+    bulk_update(UserCourseSummary, updated, ['points', 'total_downloads', 'total_activity', 'quizzes_passed',
+                                             'badges_achieved', 'pretest_score', 'completed_activities'])
+    report('user_course', pairs=len(summaries), created=len(created), updated=len(updated),
+           seconds='%.2f' % (time.time() - start))
+
+
+def course_daily_totals(window, user_ids):
+    """
+    No of new trackers (from non staff users) for each course/day/type, and
+    of searches for each day
+    """
+    last_tracker_pk, newest_tracker_pk, last_points_pk, newest_points_pk = window
+    day = {'day': connection.ops.date_trunc_sql('day', 'tracker_date')}
+    trackers = Tracker.objects.filter(pk__gt=last_tracker_pk, pk__lte=newest_tracker_pk,
+                                      user__in=user_ids, user__is_staff=False)
+
+    totals = {}
+    # get different (distinct) courses/dates/types involved
+    for log in trackers.exclude(course__isnull=True) \
+                       .extra(day) \
+                       .values('course', 'day', 'type') \
+                       .annotate(total=Count('type')):
+        add_totals(totals, {(log['course'], to_date(log['day']), log['type']): log['total']})
 
     # get different (distinct) search logs involved
-    searchDailyLogs = Tracker.objects\
-            .filter(pk__gt=last_tracker_pk, pk__lte=newest_tracker_pk, user__is_staff=False, type='search')\
-            .extra({'day':"day(tracker_date)",'month':"month(tracker_date)", 'year':"year(tracker_date)"})\
-            .values('day','month','year')\
-            .annotate(total=Count('id'))\
-            .order_by('day')
+    for log in trackers.filter(type='search') \
+                       .extra(day) \
+                       .values('day') \
+                       .annotate(total=Count('id')):
+        add_totals(totals, {(None, to_date(log['day']), 'search'): log['total']})
+    return totals
+
+
+def save_course_daily_stats(totals, first_tracker=False):
+    start = time.time()
+    stats = {}
+    for s in CourseDailyStats.objects.filter(day__in=set([d for c, d, t in totals.keys()])).order_by('-id'):
+        stats[(s.course_id, s.day, s.type)] = s
 
-    print ('%d different search/dates to process.' % searchDailyLogs.count())
-    for searchLog in searchDailyLogs:
-        day = date(searchLog['year'], searchLog['month'], searchLog['day'])
-        stats, created = CourseDailyStats.objects.get_or_create(course=None, day=day, type='search')
-        stats.total = (0 if last_tracker_pk == 0 else stats.total) + searchLog['total']
-        stats.save()
+    created = []
+    updated = []
+    for key in sorted(totals.keys()):
+        course_id, day, type = key
+        if key in stats:
+            s = stats[key]
+            s.total = (0 if first_tracker else s.total) + totals[key]
+            updated.append(s)
+        else:
+            created.append(CourseDailyStats(course_id=course_id, day=day, type=type, total=totals[key]))
 
+    CourseDailyStats.objects.bulk_create(created)
+    bulk_update(CourseDailyStats, updated, ['total'])
+    report('course_daily', rows=len(totals), created=len(created), updated=len(updated),
+           seconds='%.2f' % (time.time() - start))
 
+
+def user_points_totals(window, user_ids):
+    last_tracker_pk, newest_tracker_pk, last_points_pk, newest_points_pk = window
     # get different (distinct) user/points involved
-    usersPoints = Points.objects\
-            .filter(pk__gt=last_points_pk, pk__lte=newest_points_pk)\
-            .values('user').distinct()
+    return dict(points_window(last_points_pk, newest_points_pk).filter(user__in=user_ids) \
+                                                               .values_list('user') \
+                                                               .annotate(total=Sum('points')))
+
+
+def save_user_points_summaries(totals, first_points=False):
+    start = time.time()
+    user_ids = sorted(totals.keys())
+
+    created = []
+    updated = []
+    for batch in batches(user_ids, LOOKUP_BATCH_SIZE):
+        summaries = dict((s.user_id, s) for s in UserPointsSummary.objects.filter(user__in=batch))
+        # If we update the user points, we need to recalculate their badges as well
+        badges = dict(UserCourseSummary.objects.filter(user__in=batch) \
+                                               .values_list('user') \
+                                               .annotate(badges=Sum('badges_achieved')))
+        for user_id in batch:
+            summary = summaries.get(user_id)
+            if summary is None:
+                summary = UserPointsSummary(user_id=user_id)
+                created.append(summary)
+            new_points = totals[user_id]
+            if not new_points:
+                continue
+            if summary.pk is not None:
+                updated.append(summary)
+            summary.badges = badges.get(user_id) or 0
+            summary.points = (0 if first_points else summary.points) + new_points
+
+    UserPointsSummary.objects.bulk_create(created)
+    bulk_update(UserPointsSummary, updated, ['points', 'badges'])
+    report('user_points', users=len(user_ids), created=len(created), updated=len(updated),
+           seconds='%.2f' % (time.time() - start))
+
+
+def points_window(last_points_pk, newest_points_pk):
+    return Points.objects.filter(pk__gt=last_points_pk, pk__lte=newest_points_pk)
+
+
+def course_activity_digests(course_ids):
+    """
+    The (non baseline) activity digests and quiz digests for each course
+    """
+    activities = dict((course_id, set()) for course_id in course_ids)
+    quizzes = dict((course_id, set()) for course_id in course_ids)
+    for batch in batches(sorted(course_ids), LOOKUP_BATCH_SIZE):
+        for course_id, digest, type in Activity.objects.filter(section__course__in=batch, baseline=False) \
+                                                       .values_list('section__course', 'digest', 'type'):
+            activities[course_id].add(digest)
+            if type == Activity.QUIZ:
+                quizzes[course_id].add(digest)
+    return activities, quizzes
+
+
+def course_pretest_quizzes(course_ids):
+    """
+    The quiz used as the pre test for each course (the quiz in section 0), if
+    the course has one
+    """
+    baselines = {}
+    for batch in batches(sorted(course_ids), LOOKUP_BATCH_SIZE):
+        for course_id, digest in Activity.objects.filter(section__course__in=batch, type=Activity.QUIZ, section__order=0) \
+                                                 .values_list('section__course', 'digest'):
+            baselines.setdefault(course_id, []).append(digest)
+    baselines = dict((c, d[0]) for c, d in baselines.items() if len(d) == 1)
+
+    quizzes = {}
+    for batch in batches(sorted(set(baselines.values())), LOOKUP_BATCH_SIZE):
+        for digest, quiz_id in QuizDigest.objects.filter(digest__in=batch).values_list('digest', 'quiz'):
+            quizzes.setdefault(digest, []).append(quiz_id)
+
+    pretest_quizzes = {}
+    for course_id, digest in baselines.items():
+        if len(quizzes.get(digest, [])) == 1:
+            pretest_quizzes[course_id] = quizzes[digest][0]
+    return pretest_quizzes
+
+
+def activities_completed(user_ids, course_ids, course_digests):
+    """
+    No of distinct digests (from course_digests) each user has completed in
+    each course
+    """
+    completed = {}
+    for user_id, course_id, digest in UserActivityCompletion.objects.filter(user__in=user_ids, course__in=course_ids, completed=True) \
+                                                                   .values_list('user', 'course', 'digest'):
+        if digest in course_digests.get(course_id, ()):
+            completed[(user_id, course_id)] = completed.get((user_id, course_id), 0) + 1
+    return completed
+
+
+def badges_achieved(user_ids, course_ids):
+    badges = {}
+    for user_id, course_id, total in Award.objects.filter(user__in=user_ids, awardcourse__course__in=course_ids) \
+                                                  .values_list('user', 'awardcourse__course') \
+                                                  .annotate(total=Count('id')):
+        badges[(user_id, course_id)] = total
+    return badges
+
+
+def pretest_score(user_ids, pretest_quizzes):
+    """
+    Best score (as a percentage) for each user/quiz, keyed by (user, quiz)
+    """
+    scores = {}
+    attempts = QuizAttempt.objects.filter(user__in=user_ids, quiz__in=set(pretest_quizzes.values())).order_by('id')
+    for user_id, quiz_id, score, maxscore in attempts.values_list('user', 'quiz', 'score', 'maxscore'):
+        best, first_maxscore = scores.get((user_id, quiz_id), (score, maxscore))
+        scores[(user_id, quiz_id)] = (max(best, score), first_maxscore)
 
-    totalUsers = usersPoints.count()
-    print ('%d different user/points to process.' % totalUsers)
-    for userPoints in usersPoints:
-        user = User.objects.get(pk=userPoints['user'])
-        points, created = UserPointsSummary.objects.get_or_create(user=user)
-        points.update_points(last_points_pk=last_points_pk, newest_points_pk=newest_points_pk)
+    # score relative to the maxscore of the first attempt
+    return dict((key, 100*float(best) / float(maxscore))
+                for key, (best, maxscore) in scores.items() if maxscore > 0)
 
-    # update last tracker and points PKs with the last one processed
-    SettingProperties.objects.update_or_create(key='last_tracker_pk', defaults={"int_value":newest_tracker_pk})
-    SettingProperties.objects.update_or_create(key='last_points_pk', defaults={"int_value":newest_points_pk})
 
-    elapsed_time = time.time() - start
-    print ('cron completed, took %.2f seconds' % elapsed_time)
+def to_date(day):
+    # depending on the database, the truncated day is a datetime or a string
+    if isinstance(day, datetime.datetime):
+        return day.date()
+    return datetime.datetime.strptime(str(day)[:10], '%Y-%m-%d').date()
 
 
 if __name__ == "__main__":
     import django
     django.setup()
-    run()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", help="no of processes to summarise the users in", type=int, default=1)
+    parser.add_argument("--chunk-size", help="no of trackers to summarise before saving the checkpoint", type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args()
+    run(args.workers, args.chunk_size)
@@ -1,10 +1,13 @@
 # oppia/tests/api/test_api.py
 from django.contrib.auth.models import User
+from django.db import connection
 from django.test import TestCase
 from django.test.client import Client
+from django.test.utils import CaptureQueriesContext
 
-from oppia.models import Tracker
+from oppia.models import Tracker, Points, Course, Schedule, Cohort, CourseCohort, Participant
 from oppia.quiz.models import QuizAttempt,QuizAttemptResponse
+from oppia.scoring import process_events
 
 from tastypie.models import ApiKey
 from tastypie.test import ResourceTestCase
@@ -310,6 +313,63 @@ class CourseResourceTest(ResourceTestCase):
             self.assertTrue('title' in course)
             self.assertTrue('version' in course)
        
+    # check course list not sent again if unchanged
+    def test_not_modified(self):
+        resp = self.api_client.get(self.url, format='json', data=self.auth_data)
+        etag = resp['ETag']
+        resp = self.api_client.get(self.url, format='json', data=self.auth_data, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(304, resp.status_code)
+        
+        course = Course.objects.get(pk=1)
+        course.version += 1
+        course.save()
+        resp = self.api_client.get(self.url, format='json', data=self.auth_data, HTTP_IF_NONE_MATCH=etag)
+        self.assertHttpOK(resp)
+        self.assertNotEqual(etag, resp['ETag'])
+    
+    # check the author's name is updated
+    def test_author_changed(self):
+        resp = self.api_client.get(self.url, format='json', data=self.auth_data)
+        etag = resp['ETag']
+        
+        course = Course.objects.get(pk=1)
+        course.user.first_name = 'New'
+        course.user.save()
+        resp = self.api_client.get(self.url, format='json', data=self.auth_data, HTTP_IF_NONE_MATCH=etag)
+        self.assertHttpOK(resp)
+        courses = dict((c['id'], c) for c in self.deserialize(resp)['courses'])
+        self.assertTrue(courses[1]['author'].startswith('New '))
+        
+    # check the cohort schedule is used, and changing it changes the etag
+    def test_cohort_schedule(self):
+        user = User.objects.get(username='demo')
+        admin = User.objects.get(username='admin')
+        course = Course.objects.get(pk=1)
+        Schedule.objects.create(title='default', course=course, default=True, created_by=admin)
+        resp = self.api_client.get(self.url, format='json', data=self.auth_data)
+        etag = resp['ETag']
+        
+        schedule = Schedule.objects.create(title='cohort', course=course, created_by=admin)
+        cohort = Cohort.objects.create(description='test', schedule=schedule,
+                                       start_date='2000-01-01T00:00:00Z', end_date='2100-01-01T00:00:00Z')
+        CourseCohort.objects.create(course=course, cohort=cohort)
+        Participant.objects.create(cohort=cohort, user=user, role=Participant.STUDENT)
+        resp = self.api_client.get(self.url, format='json', data=self.auth_data, HTTP_IF_NONE_MATCH=etag)
+        self.assertHttpOK(resp)
+        courses = dict((c['id'], c) for c in self.deserialize(resp)['courses'])
+        self.assertTrue(courses[1]['schedule_uri'].endswith('/%d/' % schedule.id))
+        
+    # check the course details aren't read for each course
+    def test_no_queries_per_course(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.api_client.get(self.url, format='json', data=self.auth_data)
+        course = Course.objects.get(pk=1)
+        course.pk = None
+        course.save()
+        with self.assertNumQueries(len(queries)):
+            resp = self.api_client.get(self.url, format='json', data=self.auth_data)
+        self.assertEquals(len(self.deserialize(resp)['courses']),3)
+       
     # TODO test course file found     
     def test_course_download_file_found(self):
         #resp = self.api_client.get(self.url+"20/download/", format='json', data=self.auth_data)
@@ -574,6 +634,46 @@ class TrackerResourceTest(ResourceTestCase):
         self.assertTrue('points' in response_data)
         self.assertTrue('badges' in response_data)   
     
+    # check the batch picks up the course and type from the digest
+    def test_patch_course_and_type(self):
+        activity1 = {
+            'digest': '11cc12291f730160c324b727dd2268b612137', #page
+            'data': '{"activity":"completed", "timetaken":"12", "lang":"en"}',
+        }
+        activity2 = {
+            'digest': '45ad219ead30b9a1818176598f8bbbf9', #media
+        }
+        data = {'objects':[activity1,activity2]}
+        resp = self.api_client.patch(self.url, format='json', data=data, authentication=self.get_credentials())
+        self.assertHttpOK(resp)
+        
+        page = Tracker.objects.get(digest='11cc12291f730160c324b727dd2268b612137')
+        self.assertEqual(page.course.shortname, 'anc1-all')
+        self.assertEqual(page.type, 'page')
+        self.assertTrue(page.completed)
+        self.assertEqual(page.time_taken, 12)
+        self.assertEqual(page.lang, 'en')
+        media = Tracker.objects.get(digest='45ad219ead30b9a1818176598f8bbbf9')
+        self.assertEqual(media.type, 'media')
+        self.assertFalse(media.completed)
+    
+    # check points are only given once per day for the same completed activity
+    def test_patch_points_first_today(self):
+        activity = {
+            'digest': '11cc12291f730160c324b727dd2268b612137', #page
+            'data': '{"activity":"completed"}',
+        }
+        data = {'objects':[activity,activity]}
+        points_count_start = Points.objects.filter(type='activitycompleted').count()
+        resp = self.api_client.patch(self.url, format='json', data=data, authentication=self.get_credentials())
+        self.assertHttpOK(resp)
+        process_events()
+        resp = self.api_client.patch(self.url, format='json', data=data, authentication=self.get_credentials())
+        self.assertHttpOK(resp)
+        process_events()
+        points_count_end = Points.objects.filter(type='activitycompleted').count()
+        self.assertEqual(points_count_start+1, points_count_end)
+        
 # UserResource
 class UserResourceTest(ResourceTestCase): 
     fixtures = ['user.json', 'oppia.json']   
@@ -1,10 +1,14 @@
 # oppia/tests/quiz/test_auiz_api.py
+import json
+
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import TestCase, RequestFactory
 from django.test.client import Client
 
 from oppia.models import Tracker
-from oppia.quiz.models import QuizAttempt,QuizAttemptResponse
+from oppia.quiz.api.resources import QuizResource
+from oppia.quiz.models import Quiz, QuizAttempt, QuizAttemptResponse, ResponseProps
 
 from tastypie.models import ApiKey
 from tastypie.test import ResourceTestCase
@@ -60,6 +64,12 @@ class QuizAttemptResourceTest(ResourceTestCase):
         quizattemptresponse_count_end = QuizAttemptResponse.objects.all().count()
         self.assertEqual(quizattempt_count_start+1, quizattempt_count_end)
         self.assertEqual(quizattemptresponse_count_start+3, quizattemptresponse_count_end)
+        
+        # the responses aren't returned
+        attempt = self.deserialize(resp)
+        self.assertEqual(QuizAttempt.objects.latest('id').id, attempt['id'])
+        self.assertTrue('points' in attempt)
+        self.assertFalse('responses' in attempt)
       
     def test_unauthorized(self):
         data = {
@@ -169,6 +179,77 @@ class QuizAttemptResourceTest(ResourceTestCase):
         self.assertEqual(quizattempt_count_start, quizattempt_count_end)
         self.assertEqual(quizattemptresponse_count_start, quizattemptresponse_count_end) 
         
+    def test_duplicate_instance_id(self):
+        data = {
+                "quiz_id":2,
+                "maxscore":30,
+                "score":10,
+                "instance_id":"abc123",
+                "attempt_date":"2012-12-18T15:35:12",
+                "responses":[
+                             {"question_id":"132",
+                              "score":10,
+                              "text":"true"}]}
+        resp = self.api_client.post(self.url, format='json', data=data, authentication=self.get_credentials())
+        self.assertHttpCreated(resp)
+        resp = self.api_client.post(self.url, format='json', data=data, authentication=self.get_credentials())
+        self.assertHttpBadRequest(resp)
+        self.assertEqual(1, QuizAttempt.objects.filter(instance_id='abc123').count())
+        
+    def test_batch(self):
+        attempt = {
+                "quiz_id":2,
+                "maxscore":30,
+                "score":10,
+                "attempt_date":"2012-12-18T15:35:12",
+                "responses":[
+                             {"question_id":"132",
+                              "score":0,
+                              "text":"true"},
+                             {"question_id":"133",
+                              "score":10,
+                              "text":"true"}]}
+        invalid = dict(attempt, responses=[{"question_id":"142", "score":0, "text":"true"}])
+        data = {"objects": [dict(attempt, instance_id="a1"), invalid, dict(attempt, instance_id="a2"), dict(attempt, instance_id="a1")]}
+        quizattemptresponse_count_start = QuizAttemptResponse.objects.all().count()
+        resp = self.api_client.post(self.url + 'batch/', format='json', data=data, authentication=self.get_credentials())
+        self.assertHttpCreated(resp)
+        results = self.deserialize(resp)['attempts']
+        self.assertEqual(4, len(results))
+        self.assertEqual(QuizAttempt.objects.get(instance_id="a1").id, results[0]['id'])
+        self.assertEqual('This question is not part of this quiz', results[1]['error'])
+        self.assertEqual(QuizAttempt.objects.get(instance_id="a2").id, results[2]['id'])
+        self.assertEqual('QuizAttempt already submitted', results[3]['error'])
+        self.assertEqual(quizattemptresponse_count_start+4, QuizAttemptResponse.objects.all().count())
+        self.assertTrue('points' in self.deserialize(resp))
+
+    def test_batch_invalid_attempts(self):
+        attempt = {
+                "quiz_id":2,
+                "maxscore":30,
+                "score":10,
+                "attempt_date":"2012-12-18T15:35:12",
+                "responses":[
+                             {"question_id":"132",
+                              "score":10,
+                              "text":"true"}]}
+        data = {"objects": [dict(attempt, instance_id="b1"),
+                            dict(attempt, instance_id="b2", attempt_date="not-a-date"),
+                            "not an attempt",
+                            dict(attempt, instance_id="b3", score="not-a-score"),
+                            dict(attempt, instance_id="b4")]}
+        resp = self.api_client.post(self.url + 'batch/', format='json', data=data, authentication=self.get_credentials())
+        self.assertHttpCreated(resp)
+        results = self.deserialize(resp)['attempts']
+        self.assertEqual(5, len(results))
+        self.assertEqual(QuizAttempt.objects.get(instance_id="b1").id, results[0]['id'])
+        self.assertTrue('error' in results[1])
+        self.assertTrue('error' in results[2])
+        self.assertTrue('error' in results[3])
+        self.assertEqual(QuizAttempt.objects.get(instance_id="b4").id, results[4]['id'])
+        self.assertEqual(['b1', 'b4'], sorted(QuizAttempt.objects.filter(instance_id__startswith='b') \
+                                                           .values_list('instance_id', flat=True)))
+        
 # TODO QuizQuestionResource
 # TODO QuestionResource
 # TODO QuestionPropsResource
@@ -177,9 +258,57 @@ class QuizAttemptResourceTest(ResourceTestCase):
 # TODO QuizPropsResource
     # getting a quiz via digest
     
-# TODO QuizResource
-    # TODO check get and post valid
+# QuizResource
+class QuizResourceTest(ResourceTestCase):
+    fixtures = ['user.json', 'oppia.json', 'quiz.json']
+    
+    def setUp(self):
+        super(QuizResourceTest, self).setUp()
+        cache.clear()
+        user = User.objects.get(username='demo')
+        self.auth_data = {
+            'username': 'demo',
+            'api_key': ApiKey.objects.get(user=user).key,
+        }
+        self.quiz = Quiz.objects.get(pk=2)
+        self.url = '/api/v1/quiz/%d/' % self.quiz.id
+        
+    def dehydrated(self):
+        # the quiz as serialised by tastypie, without the cache
+        request = RequestFactory().get(self.url)
+        resource = QuizResource()
+        bundle = resource.full_dehydrate(resource.build_bundle(obj=self.quiz, request=request))
+        return json.loads(resource._meta.serializer.to_json(bundle))
+        
     # getting a quiz via id no
+    def test_get_quiz(self):
+        resp = self.api_client.get(self.url, format='json', data=self.auth_data)
+        self.assertHttpOK(resp)
+        self.assertValidJSON(resp.content)
+        self.assertEqual(self.dehydrated(), self.deserialize(resp))
+        self.assertTrue(len(self.deserialize(resp)['questions']) > 0)
+        
+        # served from the cache the next time
+        with self.assertNumQueries(3):
+            self.api_client.get(self.url, format='json', data=self.auth_data)
+        
+    def test_cache_cleared(self):
+        self.api_client.get(self.url, format='json', data=self.auth_data)
+        question = self.quiz.questions.all()[0]
+        response = question.response_set.all()[0]
+        ResponseProps.objects.create(response=response, name='feedback', value='changed')
+        
+        resp = self.api_client.get(self.url, format='json', data=self.auth_data)
+        self.assertEqual(self.dehydrated(), self.deserialize(resp))
+        questions = [q['question'] for q in self.deserialize(resp)['questions']]
+        responses = [r for q in questions if q['id'] == question.id for r in q['responses']]
+        self.assertEqual('changed', [r for r in responses if r['id'] == response.id][0]['props']['feedback'])
+        
+    def test_not_found(self):
+        self.assertHttpNotFound(self.api_client.get('/api/v1/quiz/9999/', format='json', data=self.auth_data))
+    
+# TODO QuizResource
+    # TODO check post valid
     
     # getting an invalid digest
     # creating a quiz (and data required etc)
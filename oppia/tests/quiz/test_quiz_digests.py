@@ -0,0 +1,32 @@
+# oppia/tests/quiz/test_quiz_digests.py
+from django.test import TestCase
+
+from oppia.quiz.models import Quiz, QuizAttempt, QuizDigest, QuizProps, quizzes_for_digests
+
+DIGEST = '32023eeb692e69528b2d7061ffa53a1212136cr10s2a0p80a0'
+
+
+class QuizDigestTest(TestCase):
+    fixtures = ['user.json', 'oppia.json', 'quiz.json']
+
+    def test_lookup(self):
+        with self.assertNumQueries(1):
+            quizzes = quizzes_for_digests([DIGEST, 'not-a-digest'])
+        self.assertEqual({DIGEST: Quiz.objects.get(pk=1)}, quizzes)
+
+    def test_props_synced(self):
+        prop = QuizProps.objects.get(quiz_id=1, name='digest')
+        prop.value = 'new-digest'
+        prop.save()
+        self.assertEqual(['new-digest'], list(QuizDigest.objects.filter(quiz_id=1).values_list('digest', flat=True)))
+        self.assertEqual({}, quizzes_for_digests([DIGEST]))
+
+        prop.delete()
+        self.assertFalse(QuizDigest.objects.filter(quiz_id=1).exists())
+        self.assertEqual(None, QuizAttempt(quiz_id=1).get_quiz_digest())
+
+    def test_shared_digest_skipped(self):
+        QuizProps.objects.create(quiz_id=2, name='digest', value=DIGEST)
+        self.assertEqual({}, quizzes_for_digests([DIGEST]))
+        # quiz 2 now has 2 digests
+        self.assertEqual(None, QuizAttempt(quiz_id=2).get_quiz_digest())
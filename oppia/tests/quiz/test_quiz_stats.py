@@ -0,0 +1,114 @@
+# oppia/tests/quiz/test_quiz_stats.py
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from oppia.quiz.models import Quiz, QuizAttempt, QuizAttemptResponse, preload_maxscores
+from oppia.quiz.stats import get_quiz_stats
+
+
+class QuizStatsTest(TestCase):
+    fixtures = ['user.json', 'oppia.json', 'quiz.json']
+
+    def setUp(self):
+        super(QuizStatsTest, self).setUp()
+        cache.clear()
+        self.quiz = Quiz.objects.get(pk=2)
+        self.user = User.objects.get(username='demo')
+
+    def add_attempt(self, scores):
+        # scores of questions 132, 133, ... each out of 1
+        attempt = QuizAttempt.objects.create(user=self.user, quiz=self.quiz, ip='127.0.0.1',
+                                             score=sum(scores), maxscore=len(scores))
+        for i, score in enumerate(scores):
+            QuizAttemptResponse.objects.create(quizattempt=attempt, question_id=132 + i, score=score)
+        return attempt
+
+    def test_no_attempts(self):
+        stats = get_quiz_stats(self.quiz)
+        self.assertEqual(0, stats.no_attempts)
+        self.assertEqual(0, stats.avg_score)
+        self.assertEqual(0, self.quiz.avg_score())
+        self.assertEqual({'no_responses': 0, 'facility': None, 'discrimination': None}, stats.get_question(132))
+
+    def test_stats(self):
+        self.add_attempt([1, 1, 1, 1])
+        self.add_attempt([1, 1, 0, 0])
+        self.add_attempt([1, 0, 0, 0])
+        attempts = list(QuizAttempt.objects.filter(quiz=self.quiz))
+        stats = get_quiz_stats(self.quiz)
+
+        self.assertEqual(3, stats.no_attempts)
+        self.assertEqual(int(sum(a.get_score_percent() for a in attempts) / 3.0), stats.avg_score)
+        self.assertEqual(self.quiz.avg_score(), stats.avg_score)
+        histogram = dict(stats.get_histogram())
+        self.assertEqual(1, histogram[20])
+        self.assertEqual(1, histogram[50])
+        self.assertEqual(1, histogram[90])
+        self.assertEqual(3, sum(histogram.values()))
+
+        # everyone got 132 right, so it doesn't discriminate
+        self.assertEqual({'no_responses': 3, 'facility': 100, 'discrimination': None}, stats.get_question(132))
+        self.assertEqual(67, stats.get_question(133)['facility'])
+        self.assertEqual(0.76, stats.get_question(133)['discrimination'])
+
+    def test_incremental(self):
+        self.add_attempt([1, 1])
+        get_quiz_stats(self.quiz)
+        self.add_attempt([0, 0])
+        with self.assertNumQueries(3):
+            stats = get_quiz_stats(self.quiz)
+            self.assertEqual(2, stats.no_attempts)
+            self.assertEqual(50, stats.avg_score)
+        self.assertEqual(1.0, stats.get_question(132)['discrimination'])
+
+        # nothing new, so only checked, and the maxscores aren't read for the
+        # average score
+        with self.assertNumQueries(2):
+            self.assertEqual(50, self.quiz.avg_score())
+
+    def test_removed_attempt(self):
+        attempt = self.add_attempt([1, 1])
+        self.add_attempt([0, 0])
+        get_quiz_stats(self.quiz)
+        attempt.delete()
+        stats = get_quiz_stats(self.quiz)
+        self.assertEqual(1, stats.no_attempts)
+        self.assertEqual(0, stats.avg_score)
+        self.assertEqual(1, stats.get_question(132)['no_responses'])
+
+    def test_attempts_page(self):
+        admin = User.objects.get(username='admin')
+        admin.set_password('secret')
+        admin.save()
+        self.client.login(username='admin', password='secret')
+        self.add_attempt([1, 0])
+        response = self.client.get('/course/1/quiz/2/attempts/')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(1, response.context['stats'].no_attempts)
+        self.assertEqual(2, len(response.context['page'].object_list[0].responses))
+        facilities = dict((q.id, q.stats['facility']) for q in response.context['questions'])
+        self.assertEqual(100, facilities[132])
+        self.assertEqual(0, facilities[133])
+
+        # the responses (and their maxscores) are read along with the
+        # attempts, not for each attempt
+        for url in ['/course/1/quiz/2/attempts/', '/course/1/feedback/2/responses/']:
+            cache.clear()
+            with CaptureQueriesContext(connection) as before:
+                self.client.get(url)
+            self.add_attempt([1, 1])
+            self.add_attempt([0, 1])
+            cache.clear()
+            with CaptureQueriesContext(connection) as after:
+                response = self.client.get(url)
+            self.assertTrue(len(response.context['page'].object_list) > 1)
+            self.assertEqual(len(before), len(after))
+
+    def test_preload_maxscores(self):
+        self.add_attempt([1, 0, 0.5])
+        responses = preload_maxscores(QuizAttemptResponse.objects.select_related('question').order_by('question_id'))
+        with self.assertNumQueries(0):
+            self.assertEqual([100, 0, 50], [r.get_score_percent() for r in responses])
@@ -0,0 +1,101 @@
+# oppia/tests/test_archive.py
+import datetime
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from tastypie.models import ApiKey
+from django.utils import timezone
+
+from oppia.archive import archive_trackers, all_trackers
+from oppia.models import Course, Tracker, TrackerArchive
+from oppia.summary.models import SettingProperties
+
+
+class TrackerArchiveTest(TestCase):
+    fixtures = ['user.json', 'oppia.json']
+
+    def setUp(self):
+        super(TrackerArchiveTest, self).setUp()
+        self.user = User.objects.get(username='demo')
+        self.course = Course.objects.get(pk=1)
+
+    def add_tracker(self, days_ago, type=None, completed=False):
+        tracker = Tracker()
+        tracker.user = self.user
+        tracker.ip = '127.0.0.1'
+        tracker.course = self.course
+        tracker.type = type
+        tracker.completed = completed
+        tracker.digest = '11cc12291f730160c324b727dd2268b612137'
+        tracker.tracker_date = timezone.now() - datetime.timedelta(days=days_ago)
+        tracker.submitted_date = tracker.tracker_date
+        tracker.save()
+        return tracker
+
+    def test_archive(self):
+        old = self.add_tracker(400)
+        recent = self.add_tracker(1)
+        SettingProperties.objects.create(key='last_tracker_pk', int_value=recent.id)
+
+        self.assertEqual(1, archive_trackers(12))
+        self.assertEqual([recent.id], list(Tracker.objects.values_list('id', flat=True)))
+        archived = TrackerArchive.objects.get(id=old.id)
+        self.assertEqual(old.tracker_date.date().replace(day=1), archived.month)
+        self.assertEqual(old.digest, archived.digest)
+
+    def test_archive_only_summarised(self):
+        old = self.add_tracker(400)
+        SettingProperties.objects.create(key='last_tracker_pk', int_value=old.id - 1)
+
+        self.assertEqual(0, archive_trackers(12))
+        self.assertEqual(0, TrackerArchive.objects.count())
+
+    def test_all_trackers(self):
+        oldest = self.add_tracker(500)
+        old = self.add_tracker(400)
+        recent = self.add_tracker(1)
+        SettingProperties.objects.create(key='last_tracker_pk', int_value=recent.id)
+        archive_trackers(12)
+
+        self.assertEqual([recent.id, old.id, oldest.id], [t.id for t in all_trackers(course=self.course)])
+        self.assertEqual([oldest.id, old.id, recent.id], [t.id for t in all_trackers(order_by='tracker_date', course=self.course)])
+
+    def test_all_trackers_paged(self):
+        trackers = [self.add_tracker(days) for days in (500, 400, 400, 400, 300, 1, 1, 0)]
+        # pages smaller than the no of trackers with the same date
+        for same in (trackers[1:4], trackers[5:7]):
+            Tracker.objects.filter(id__in=[t.id for t in same]).update(tracker_date=same[0].tracker_date)
+        SettingProperties.objects.create(key='last_tracker_pk', int_value=trackers[4].id)
+        archive_trackers(12)
+        self.assertEqual(4, TrackerArchive.objects.count())
+
+        expected = sorted(Tracker.objects.values_list('tracker_date', 'id'), reverse=True)
+        expected += sorted(TrackerArchive.objects.values_list('tracker_date', 'id'), reverse=True)
+        self.assertEqual([id for date, id in expected], [t.id for t in all_trackers(page_size=2, course=self.course)])
+        self.assertEqual([id for date, id in expected],
+                         [t['id'] for t in all_trackers(values=['tracker_date'], page_size=2, course=self.course)])
+        expected.sort()
+        self.assertEqual([id for date, id in expected],
+                         [t.id for t in all_trackers(order_by='tracker_date', page_size=1, course=self.course)])
+
+    def test_redownload_after_archive(self):
+        self.add_tracker(400, type='download')
+        self.add_tracker(400, type='page', completed=True)
+        SettingProperties.objects.create(key='last_tracker_pk', int_value=Tracker.objects.latest('id').id)
+        archive_trackers(12)
+        self.assertFalse(Tracker.objects.filter(user=self.user, course=self.course).exists())
+
+        # the archived progress is still sent to the app, and the download still counted
+        self.assertTrue(Tracker.has_completed_trackers(self.course, self.user))
+        response = self.client.get('/api/v1/course/%d/activity/' % self.course.id,
+                                   {'username': 'demo', 'api_key': ApiKey.objects.get(user=self.user).key})
+        self.assertEqual(200, response.status_code)
+        self.assertTrue('digest="11cc12291f730160c324b727dd2268b612137"' in response.content)
+        self.assertTrue('completed="True"' in response.content)
+        self.assertEqual(1, self.course.no_downloads())
+        self.assertEqual(1, self.course.no_distinct_downloads())
+
+        self.add_tracker(0, type='download')
+        self.assertFalse(self.course.is_first_download(self.user))
+        self.assertEqual(2, self.course.no_downloads())
+        self.assertEqual(1, self.course.no_distinct_downloads())
@@ -0,0 +1,39 @@
+# oppia/tests/test_cohorts.py
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from oppia.models import Course, Cohort, CourseCohort, Participant
+
+
+class CohortMemberTest(TestCase):
+    fixtures = ['user.json', 'oppia.json']
+
+    def setUp(self):
+        super(CohortMemberTest, self).setUp()
+        self.user = User.objects.get(username='demo')
+        self.course = Course.objects.get(pk=1)
+        self.other_course = Course.objects.get(pk=2)
+
+    def add_cohort(self, role, start_date='2000-01-01T00:00:00Z', end_date='2100-01-01T00:00:00Z'):
+        cohort = Cohort.objects.create(description=role, start_date=start_date, end_date=end_date)
+        CourseCohort.objects.create(course=self.course, cohort=cohort)
+        Participant.objects.create(cohort=cohort, user=self.user, role=role)
+        return cohort
+
+    def test_member_now(self):
+        self.add_cohort(Participant.STUDENT, end_date='2001-01-01T00:00:00Z')
+        teacher = self.add_cohort(Participant.TEACHER)
+        student = self.add_cohort(Participant.STUDENT)
+
+        self.assertEqual(teacher, Cohort.member_now(self.course, self.user))
+        self.assertEqual(student, Cohort.student_member_now(self.course, self.user))
+        self.assertEqual(teacher, Cohort.teacher_member_now(self.course, self.user))
+        self.assertIsNone(Cohort.member_now(self.other_course, self.user))
+
+    def test_one_query_per_user(self):
+        self.add_cohort(Participant.STUDENT)
+        with self.assertNumQueries(1):
+            for course in [self.course, self.other_course]:
+                Cohort.member_now(course, self.user)
+                Cohort.student_member_now(course, self.user)
+                Cohort.teacher_member_now(course, self.user)
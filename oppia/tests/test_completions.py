@@ -0,0 +1,73 @@
+# oppia/tests/test_completions.py
+import datetime
+import imp
+import os
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+import oppia
+from oppia.models import Course, Tracker, TrackerArchive, UserActivityCompletion
+from oppia.signals import trackers_created
+
+update_activity_completions = imp.load_source('update_activity_completions',
+                                              os.path.join(os.path.dirname(oppia.__file__), 'utils', 'update_activity_completions.py'))
+
+
+class UserActivityCompletionTest(TestCase):
+    fixtures = ['user.json', 'oppia.json']
+
+    def setUp(self):
+        super(UserActivityCompletionTest, self).setUp()
+        self.user = User.objects.get(username='demo')
+        self.course = Course.objects.get(pk=1)
+
+    def new_tracker(self, digest, completed):
+        tracker = Tracker()
+        tracker.user = self.user
+        tracker.ip = '127.0.0.1'
+        tracker.course = self.course
+        tracker.digest = digest
+        tracker.completed = completed
+        return tracker
+
+    def test_single_tracker(self):
+        self.new_tracker('11cc12291f730160c324b727dd2268b612137', False).save()
+        completion = UserActivityCompletion.objects.get(user=self.user, course=self.course)
+        self.assertFalse(completion.completed)
+        self.assertEqual(0, Course.get_activities_completed(self.course, self.user))
+
+        self.new_tracker('11cc12291f730160c324b727dd2268b612137', True).save()
+        completion = UserActivityCompletion.objects.get(user=self.user, course=self.course)
+        self.assertTrue(completion.completed)
+        self.assertEqual(1, Course.get_activities_completed(self.course, self.user))
+
+    def test_bulk_trackers(self):
+        trackers = [self.new_tracker('11cc12291f730160c324b727dd2268b612137', False),
+                    self.new_tracker('11cc12291f730160c324b727dd2268b612137', True),
+                    self.new_tracker('45ad219ead30b9a1818176598f8bbbf9', False)]
+        Tracker.objects.bulk_create(trackers)
+        trackers_created.send(sender=self, trackers=trackers, user=self.user)
+
+        self.assertEqual(2, UserActivityCompletion.objects.filter(user=self.user).count())
+        self.assertEqual(1, Course.get_activities_completed(self.course, self.user))
+        self.assertEqual(1, Course.get_media_viewed(self.course, self.user))
+
+    def test_rebuild(self):
+        self.new_tracker('11cc12291f730160c324b727dd2268b612137', True).save()
+        self.new_tracker('45ad219ead30b9a1818176598f8bbbf9', False).save()
+        UserActivityCompletion.objects.all().delete()
+
+        UserActivityCompletion.rebuild([self.user.id])
+        self.assertEqual(set([('11cc12291f730160c324b727dd2268b612137', True), ('45ad219ead30b9a1818176598f8bbbf9', False)]),
+                         set(UserActivityCompletion.objects.values_list('digest', 'completed')))
+
+    def test_rebuild_script_archived(self):
+        # only archived trackers left for the user
+        TrackerArchive.objects.create(user=self.user, course=self.course, ip='127.0.0.1', completed=True,
+                                      digest='11cc12291f730160c324b727dd2268b612137', month=datetime.date(2015, 1, 1))
+        UserActivityCompletion.objects.all().delete()
+
+        update_activity_completions.run()
+        self.assertEqual([('11cc12291f730160c324b727dd2268b612137', True)],
+                         list(UserActivityCompletion.objects.filter(user=self.user).values_list('digest', 'completed')))
@@ -0,0 +1,71 @@
+# oppia/tests/test_digests.py
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+
+from oppia.digests import get_digest, get_digests, invalidate_course
+from oppia.models import Activity, Course, Media
+
+
+class DigestIndexTest(TestCase):
+    fixtures = ['user.json', 'oppia.json']
+
+    def setUp(self):
+        super(DigestIndexTest, self).setUp()
+        cache.clear()
+
+    def test_activity(self):
+        entry = get_digest('11cc12291f730160c324b727dd2268b612137')
+        self.assertTrue(entry.exists())
+        self.assertEqual(entry.get_type(), 'page')
+        self.assertEqual(entry.get_title(), 'Introduction')
+        self.assertEqual(entry.get_activity()['course_shortname'], 'anc1-all')
+        self.assertEqual(entry.get_activity('ncd1-all'), None)
+
+    def test_media(self):
+        entry = get_digest('45ad219ead30b9a1818176598f8bbbf9')
+        self.assertTrue(entry.exists())
+        self.assertEqual(entry.get_type(), 'media')
+        self.assertEqual(entry.get_title(), 'who-why-did-mrs-x-die-20140220.m4v')
+
+    def test_not_found(self):
+        entry = get_digest('a1b2c3d4e5f6a7b8c9d')
+        self.assertFalse(entry.exists())
+        self.assertEqual(entry.get_type(), None)
+
+    def test_cached(self):
+        digests = ['11cc12291f730160c324b727dd2268b612137', '45ad219ead30b9a1818176598f8bbbf9']
+        get_digests(digests)
+        with self.assertNumQueries(0):
+            entries = get_digests(digests)
+        self.assertEqual(len(entries), 2)
+
+    def test_invalidate_course(self):
+        entry = get_digest('11cc12291f730160c324b727dd2268b612137')
+        Activity.objects.filter(digest='11cc12291f730160c324b727dd2268b612137').update(type='quiz')
+        self.assertEqual(get_digest('11cc12291f730160c324b727dd2268b612137').get_type(), 'page')
+
+        invalidate_course(entry.get_activity()['course_id'])
+        self.assertEqual(get_digest('11cc12291f730160c324b727dd2268b612137').get_type(), 'quiz')
+
+    def test_changes_invalidate(self):
+        digest = '11cc12291f730160c324b727dd2268b612137'
+        course = Course.objects.get(pk=get_digest(digest).get_activity()['course_id'])
+        owner = User.objects.exclude(pk=course.user_id).first()
+        course.user = owner
+        course.save()
+        self.assertEqual(owner.id, get_digest(digest).get_activity()['course_user_id'])
+
+        activity = Activity.objects.get(digest=digest)
+        activity.type = 'quiz'
+        activity.save()
+        self.assertEqual('quiz', get_digest(digest).get_type())
+        activity.delete()
+        self.assertFalse(get_digest(digest).exists())
+
+        media = Media.objects.get(digest='45ad219ead30b9a1818176598f8bbbf9')
+        media.filename = 'renamed.m4v'
+        media.save()
+        self.assertEqual('renamed.m4v', get_digest(media.digest).get_title())
+        media.delete()
+        self.assertFalse(get_digest(media.digest).exists())
@@ -0,0 +1,224 @@
+# oppia/tests/test_downloads.py
+import io
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+
+from django.contrib.auth.models import User
+from django.test import TestCase, RequestFactory
+from django.test.utils import override_settings
+from tastypie.models import ApiKey
+
+from oppia.downloads import CoursePackage, course_etag, file_response, is_new_download
+from oppia.downloads import save_manifest, delta_package, remove_delta_packages
+from oppia.models import Course, Schedule, ActivitySchedule, Tracker
+
+
+class CoursePackageTest(TestCase):
+
+    def setUp(self):
+        super(CoursePackageTest, self).setUp()
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'course.zip')
+        zip = zipfile.ZipFile(self.path, 'w', zipfile.ZIP_DEFLATED)
+        zip.writestr('course/module.xml', '<module/>')
+        zip.writestr('course/page.html', '<html>' + 'x' * 200000 + '</html>')
+        zip.comment = 'test course'
+        zip.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+        super(CoursePackageTest, self).tearDown()
+
+    def test_entries_appended(self):
+        package = CoursePackage(self.path, [('course/schedule.xml', u'<schedule/>'),
+                                            ('course/tracker.xml', u'<trackers/>')])
+        content = ''.join(package)
+        self.assertEqual(len(package), len(content))
+
+        zip = zipfile.ZipFile(io.BytesIO(content))
+        self.assertIsNone(zip.testzip())
+        self.assertEqual(['course/module.xml', 'course/page.html', 'course/schedule.xml', 'course/tracker.xml'],
+                         zip.namelist())
+        self.assertEqual('<module/>', zip.read('course/module.xml'))
+        self.assertEqual('<schedule/>', zip.read('course/schedule.xml'))
+        self.assertEqual('test course', zip.comment)
+
+        # the original entries are passed through unchanged
+        with open(self.path, 'rb') as f:
+            original = f.read()
+        start_dir = zipfile.ZipFile(self.path).start_dir
+        self.assertEqual(original[:start_dir], content[:start_dir])
+
+    def test_no_entries(self):
+        package = CoursePackage(self.path, [])
+        content = ''.join(package)
+        with open(self.path, 'rb') as f:
+            self.assertEqual(f.read(), content)
+
+
+class FileResponseTest(TestCase):
+    fixtures = ['user.json', 'oppia.json']
+
+    def setUp(self):
+        super(FileResponseTest, self).setUp()
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'course.zip')
+        with open(self.path, 'wb') as f:
+            f.write('0123456789' * 10)
+        self.course = Course.objects.get(pk=1)
+        self.etag = course_etag(self.course)
+        self.factory = RequestFactory()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+        super(FileResponseTest, self).tearDown()
+
+    def get(self, **headers):
+        self.request = self.factory.get('/', **headers)
+        return file_response(self.request, self.path, 'course.zip', self.etag, self.course.lastupdated_date)
+
+    def test_etag_changes_with_version(self):
+        self.course.version += 1
+        self.assertNotEqual(self.etag, course_etag(self.course))
+
+    def test_full(self):
+        response = self.get()
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(self.etag, response['ETag'])
+        self.assertEqual('100', response['Content-Length'])
+        self.assertEqual('0123456789' * 10, ''.join(response.streaming_content))
+        self.assertTrue(is_new_download(self.request, response))
+
+    def test_not_modified(self):
+        response = self.get(HTTP_IF_NONE_MATCH=self.etag)
+        self.assertEqual(304, response.status_code)
+        self.assertFalse(is_new_download(self.request, response))
+        self.assertEqual(200, self.get(HTTP_IF_NONE_MATCH='"old"').status_code)
+
+    def test_range(self):
+        response = self.get(HTTP_RANGE='bytes=95-')
+        self.assertEqual(206, response.status_code)
+        self.assertEqual('bytes 95-99/100', response['Content-Range'])
+        self.assertEqual('56789', ''.join(response.streaming_content))
+        self.assertFalse(is_new_download(self.request, response))
+
+        response = self.get(HTTP_RANGE='bytes=0-9')
+        self.assertEqual('0123456789', ''.join(response.streaming_content))
+        self.assertTrue(is_new_download(self.request, response))
+
+        self.assertEqual('789', ''.join(self.get(HTTP_RANGE='bytes=-3').streaming_content))
+        self.assertEqual(416, self.get(HTTP_RANGE='bytes=100-').status_code)
+
+    def test_range_other_version(self):
+        response = self.get(HTTP_RANGE='bytes=95-', HTTP_IF_RANGE='"old"')
+        self.assertEqual(200, response.status_code)
+
+    def test_offload(self):
+        with override_settings(OPPIA_DOWNLOAD_OFFLOAD='X-Sendfile'):
+            response = self.get()
+            self.assertEqual(self.path, response['X-Sendfile'])
+            self.assertEqual('', response.content)
+        with override_settings(OPPIA_DOWNLOAD_OFFLOAD='X-Accel-Redirect', COURSE_UPLOAD_DIR=self.dir,
+                               OPPIA_DOWNLOAD_ACCEL_REDIRECT_URL='/protected/'):
+            response = self.get()
+            self.assertEqual('/protected/course.zip', response['X-Accel-Redirect'])
+
+    def test_offload_resume(self):
+        # the web server sends the range, so the response is always 200
+        def is_new(**headers):
+            response = self.get(**headers)
+            self.assertEqual(200, response.status_code)
+            return is_new_download(self.request, response)
+
+        with override_settings(OPPIA_DOWNLOAD_OFFLOAD='X-Sendfile'):
+            self.assertTrue(is_new())
+            self.assertTrue(is_new(HTTP_RANGE='bytes=0-9'))
+            self.assertFalse(is_new(HTTP_RANGE='bytes=95-'))
+            self.assertFalse(is_new(HTTP_RANGE='bytes=-3'))
+            self.assertTrue(is_new(HTTP_RANGE='bytes=95-', HTTP_IF_RANGE='"old"'))
+
+    def test_offload_resume_tracked_once(self):
+        user = User.objects.get(username='demo')
+        with override_settings(OPPIA_DOWNLOAD_OFFLOAD='X-Sendfile', COURSE_UPLOAD_DIR=self.dir + '/'):
+            self.course.filename = 'course.zip'
+            self.course.save()
+            url = '/api/v1/course/%d/download/' % self.course.id
+            auth = {'username': 'demo', 'api_key': ApiKey.objects.get(user=user).key}
+            before = Tracker.objects.filter(user=user, type='download').count()
+
+            response = self.client.get(url, auth)
+            self.assertEqual(200, response.status_code)
+            self.assertEqual(self.path, response['X-Sendfile'])
+            response = self.client.get(url, auth, HTTP_RANGE='bytes=50-')
+            self.assertEqual(200, response.status_code)
+            self.assertEqual(before + 1, Tracker.objects.filter(user=user, type='download').count())
+
+
+class DeltaPackageTest(TestCase):
+    fixtures = ['user.json', 'oppia.json']
+
+    def setUp(self):
+        super(DeltaPackageTest, self).setUp()
+        self.dir = tempfile.mkdtemp() + '/'
+        self.settings = override_settings(COURSE_UPLOAD_DIR=self.dir)
+        self.settings.enable()
+        self.course = Course.objects.get(pk=1)
+
+    def tearDown(self):
+        self.settings.disable()
+        shutil.rmtree(self.dir)
+        super(DeltaPackageTest, self).tearDown()
+
+    def upload(self, version, files):
+        self.course.version = version
+        self.course.filename = 'course-%d.zip' % version
+        zip = zipfile.ZipFile(self.course.getAbsPath(), 'w', zipfile.ZIP_DEFLATED)
+        for name, content in files:
+            zip.writestr(self.course.shortname + '/' + name, content)
+        zip.close()
+        save_manifest(self.course)
+
+    def test_delta(self):
+        self.upload(1, [('module.xml', 'v1'), ('page1.html', 'page 1'), ('page2.html', 'page 2')])
+        self.upload(2, [('module.xml', 'v2'), ('page1.html', 'page 1'), ('page3.html', 'page 3')])
+
+        path, filename = delta_package(self.course, 1)
+        zip = zipfile.ZipFile(path)
+        prefix = self.course.shortname + '/'
+        self.assertEqual(set([prefix + 'module.xml', prefix + 'page3.html', prefix + 'delta.json']), set(zip.namelist()))
+        self.assertEqual('v2', zip.read(prefix + 'module.xml'))
+        delta = json.loads(zip.read(prefix + 'delta.json'))
+        self.assertEqual([prefix + 'page2.html'], delta['removed'])
+        self.assertEqual(1, delta['from'])
+        zip.close()
+
+        # kept until the course is updated
+        self.assertEqual((path, filename), delta_package(self.course, 1))
+        remove_delta_packages(self.course)
+        self.assertFalse(os.path.exists(path))
+
+    def test_no_manifest(self):
+        self.upload(2, [('module.xml', 'v2')])
+        self.assertIsNone(delta_package(self.course, 1))
+        self.assertIsNone(delta_package(self.course, 2))
+
+
+class ScheduleXMLTest(TestCase):
+    fixtures = ['user.json', 'oppia.json']
+
+    def test_cached_until_updated(self):
+        schedule = Schedule.objects.create(title='test', course=Course.objects.get(pk=1),
+                                           created_by=User.objects.get(username='admin'))
+        ActivitySchedule.objects.create(schedule=schedule, digest='11cc12291f730160c324b727dd2268b612137')
+        xml = schedule.to_xml_string()
+        self.assertTrue('11cc12291f730160c324b727dd2268b612137' in xml)
+
+        ActivitySchedule.objects.filter(schedule=schedule).delete()
+        with self.assertNumQueries(0):
+            self.assertEqual(xml, schedule.to_xml_string())
+
+        schedule.lastupdated_date = schedule.lastupdated_date.replace(year=schedule.lastupdated_date.year + 1)
+        self.assertFalse('11cc12291f730160c324b727dd2268b612137' in schedule.to_xml_string())
@@ -0,0 +1,53 @@
+# oppia/tests/test_exports.py
+import json
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from oppia.models import Course, Tracker
+
+
+class TrackerExportTest(TestCase):
+    fixtures = ['user.json', 'oppia.json']
+
+    def setUp(self):
+        super(TrackerExportTest, self).setUp()
+        self.user = User.objects.get(username='demo')
+        self.course = Course.objects.get(pk=1)
+        self.url = '/course/%d/detail/export/' % self.course.id
+        admin = User.objects.get(username='admin')
+        admin.set_password('secret')
+        admin.save()
+
+        tracker = Tracker()
+        tracker.user = self.user
+        tracker.ip = '127.0.0.1'
+        tracker.course = self.course
+        tracker.digest = '45ad219ead30b9a1818176598f8bbbf9'
+        tracker.section_title = '{"en": "Section 1"}'
+        tracker.data = '{"lang": "en"}'
+        tracker.save()
+
+    def test_export_csv(self):
+        self.client.login(username='admin', password='secret')
+        response = self.client.get(self.url)
+        self.assertEqual(200, response.status_code)
+        self.assertTrue(response.streaming)
+        lines = ''.join(response.streaming_content).splitlines()
+        self.assertEqual(2, len(lines))
+        self.assertTrue(lines[0].startswith('Date,UserId,Type,Activity Title'))
+        self.assertTrue(',who-why-did-mrs-x-die-20140220.m4v,Section 1,0,127.0.0.1,,en' in lines[1])
+
+    def test_export_json(self):
+        self.client.login(username='admin', password='secret')
+        response = self.client.get(self.url + '?format=json')
+        self.assertEqual(200, response.status_code)
+        rows = [json.loads(l) for l in ''.join(response.streaming_content).splitlines()]
+        self.assertEqual(1, len(rows))
+        self.assertEqual(self.user.id, rows[0]['UserId'])
+        self.assertEqual('who-why-did-mrs-x-die-20140220.m4v', rows[0]['Activity Title'])
+
+    def test_export_unauthorized(self):
+        self.client.login(username='demo', password='secret')
+        response = self.client.get(self.url)
+        self.assertNotEqual(200, response.status_code)
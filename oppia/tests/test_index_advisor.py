@@ -0,0 +1,67 @@
+# oppia/tests/test_index_advisor.py
+import imp
+import importlib
+import os
+
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+import oppia
+from oppia.models import Course, Tracker
+
+# the utils scripts aren't a package
+index_advisor = imp.load_source('index_advisor', os.path.join(os.path.dirname(oppia.__file__), 'utils', 'index_advisor.py'))
+
+
+class IndexAdvisorTest(TestCase):
+    fixtures = ['user.json', 'oppia.json']
+
+    def setUp(self):
+        super(IndexAdvisorTest, self).setUp()
+        self.user = User.objects.get(username='demo')
+        self.course = Course.objects.get(pk=1)
+
+    def add_tracker(self, uuid=None):
+        tracker = Tracker()
+        tracker.user = self.user
+        tracker.ip = '127.0.0.1'
+        tracker.course = self.course
+        tracker.digest = '11cc12291f730160c324b727dd2268b612137'
+        tracker.uuid = uuid
+        tracker.save()
+        return tracker
+
+    def test_run(self):
+        self.add_tracker('ab12cd34-ef56-ab78-cd90-ef12ab34cd56')
+        full_scans = index_advisor.run(verbose=True)
+        self.assertTrue(0 <= full_scans <= len(index_advisor.get_queries()))
+
+        # the tracker digest index is found in the query plan
+        queryset = Tracker.objects.filter(digest='11cc12291f730160c324b727dd2268b612137')
+        indexes, scans = index_advisor.indexes_used(index_advisor.explain(queryset))
+        self.assertTrue(indexes)
+        self.assertEqual([], scans)
+
+    def test_indexes_used(self):
+        self.assertEqual((['oppia_tracker_digest'], ['oppia_course']),
+                         index_advisor.indexes_used([{'detail': 'SEARCH TABLE oppia_tracker USING INDEX oppia_tracker_digest (digest=?)'},
+                                                     {'detail': 'SCAN TABLE oppia_course'}]))
+        self.assertEqual((['oppia_tracker_uuid'], ['oppia_tracker']),
+                         index_advisor.indexes_used([{'key': 'oppia_tracker_uuid', 'table': 'oppia_tracker'},
+                                                     {'key': None, 'table': 'oppia_tracker'}]))
+        self.assertEqual((['oppia_tracker_pkey'], ['oppia_tracker']),
+                         index_advisor.indexes_used([{'QUERY PLAN': 'Index Scan using oppia_tracker_pkey on oppia_tracker'},
+                                                     {'QUERY PLAN': 'Seq Scan on oppia_tracker  (cost=0.00..1.01 rows=1)'}]))
+
+
+class TrackerUUIDMigrationTest(TestCase):
+    fixtures = ['user.json', 'oppia.json']
+
+    def test_long_uuids_stop_migration(self):
+        migration = importlib.import_module('oppia.migrations.0013_tracker_indexes')
+        migration.check_uuid_lengths(apps, None)
+
+        # sqlite doesn't enforce the column length
+        Tracker.objects.create(user=User.objects.get(username='demo'), ip='127.0.0.1', uuid='x' * 101)
+        self.assertRaises(ValueError, migration.check_uuid_lengths, apps, None)
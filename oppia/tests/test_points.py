@@ -1,5 +1,121 @@
-# TODO signals tests
-    # TODO test points awarded for one day but not twice on same day for page
+# oppia/tests/test_points.py
+import datetime
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models import Sum
+from django.test import TestCase
+from django.utils import timezone
+
+from oppia.models import Course, Tracker, TrackerArchive, Points, PointsEvent, Award
+from oppia.scoring import process_events
+from oppia.signals import course_downloaded
+
+
+class ScoringWorkerTest(TestCase):
+    fixtures = ['user.json', 'oppia.json']
+
+    def setUp(self):
+        super(ScoringWorkerTest, self).setUp()
+        self.user = User.objects.get(username='demo')
+        self.course = Course.objects.get(pk=1)
+        # clear out the events queued while loading the fixtures
+        process_events()
+
+    def add_tracker(self, digest, completed=True, time_taken=0):
+        tracker = Tracker()
+        tracker.user = self.user
+        tracker.ip = '127.0.0.1'
+        tracker.course = self.course
+        tracker.digest = digest
+        tracker.completed = completed
+        tracker.time_taken = time_taken
+        tracker.save()
+        return tracker
+
+    def test_signup(self):
+        user = User.objects.create_user('newuser', 'newuser@example.com', 'password')
+        self.assertEqual(0, Points.objects.filter(user=user).count())
+        self.assertEqual(1, PointsEvent.objects.filter(user=user).count())
+
+        process_events()
+        points = Points.objects.get(user=user)
+        self.assertEqual('signup', points.type)
+        self.assertEqual(settings.OPPIA_POINTS['REGISTER'], points.points)
+        self.assertEqual(0, PointsEvent.objects.count())
+
+    def test_activity_once_a_day(self):
+        self.add_tracker('11cc12291f730160c324b727dd2268b612137')
+        self.add_tracker('11cc12291f730160c324b727dd2268b612137')
+        process_events()
+        self.add_tracker('11cc12291f730160c324b727dd2268b612137')
+        process_events()
+
+        points = Points.objects.filter(user=self.user, type='activitycompleted')
+        self.assertEqual(1, points.count())
+        self.assertEqual(self.course.id, points[0].course_id)
+        self.assertEqual(settings.OPPIA_POINTS['ACTIVITY_COMPLETED'], points[0].points)
+
+    def test_media_played(self):
+        self.add_tracker('45ad219ead30b9a1818176598f8bbbf9', time_taken=65)
+        self.add_tracker('45ad219ead30b9a1818176598f8bbbf9', time_taken=65)
+        process_events()
+
+        points = Points.objects.filter(user=self.user, type='mediaplayed').order_by('id')
+        per_interval = settings.OPPIA_POINTS['MEDIA_PLAYING_POINTS_PER_INTERVAL'] * (65 / settings.OPPIA_POINTS['MEDIA_PLAYING_INTERVAL'])
+        self.assertEqual([settings.OPPIA_POINTS['MEDIA_STARTED'] + per_interval, per_interval],
+                         [p.points for p in points])
+
+    def test_unknown_digest(self):
+        points_count_start = Points.objects.filter(user=self.user).count()
+        self.add_tracker('not-a-digest')
+        process_events()
+        self.assertEqual(points_count_start, Points.objects.filter(user=self.user).count())
+        self.assertEqual(0, PointsEvent.objects.count())
+
+    def test_no_digest_not_queued(self):
+        tracker = self.add_tracker('')
+        tracker.type = 'download'
+        tracker.save()
+        self.assertEqual(0, PointsEvent.objects.count())
+
+    def test_archived_download(self):
+        TrackerArchive.objects.create(user=self.user, course=self.course, ip='127.0.0.1', type='download',
+                                      month=datetime.date(2015, 1, 1),
+                                      submitted_date=timezone.now() - datetime.timedelta(days=400))
+        tracker = self.add_tracker('')
+        tracker.type = 'download'
+        tracker.save()
+        process_events()
+        course_downloaded.send(sender=self, course=self.course, user=self.user)
+        process_events()
+        self.assertFalse(Points.objects.filter(user=self.user, type='coursedownloaded').exists())
+
+    def test_running_totals(self):
+        self.add_tracker('11cc12291f730160c324b727dd2268b612137')
+        self.add_tracker('45ad219ead30b9a1818176598f8bbbf9', time_taken=65)
+        process_events()
+        Points.objects.create(user=self.user, points=5, description='test', type='signup')
+
+        user = User.objects.get(pk=self.user.pk)
+        self.assertEqual(Points.objects.filter(user=self.user).aggregate(total=Sum('points'))['total'],
+                         Points.get_userscore(user))
+        course_points = Points.objects.filter(user=self.user, course=self.course).aggregate(total=Sum('points'))['total']
+        self.assertEqual([{'course__shortname': self.course.shortname, 'total_points': course_points}],
+                         Points.get_course_points(user))
+
+        # deleted points are taken off
+        Points.objects.filter(user=self.user, type='mediaplayed')[0].delete()
+        user = User.objects.get(pk=self.user.pk)
+        self.assertEqual(Points.objects.filter(user=self.user).aggregate(total=Sum('points'))['total'],
+                         Points.get_userscore(user))
+
+    def test_read_once_per_user(self):
+        user = User.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(2):
+            for i in range(2):
+                Points.get_userscore(user)
+                Points.get_course_points(user)
+                Award.get_userawards(user)
+
     # TODO test points awarded for one day but not twice on same day for quiz
-    # TODO test points awarded for one day but not twice on same day for media
-    
\ No newline at end of file
@@ -0,0 +1,167 @@
+# oppia/tests/test_publishing.py
+import datetime
+import imp
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+from tastypie.models import ApiKey
+
+import oppia
+from oppia.models import Course, CourseTag, PublishJob
+from oppia.profile.models import UserProfile
+from oppia import publishing
+from oppia.publishing import add_job, claim_job, fail_stale_jobs, run_job
+from oppia.tests.test_uploader import MODULE_XML
+
+tidy_upload_dir = imp.load_source('tidy_upload_dir', os.path.join(os.path.dirname(oppia.__file__), 'utils', 'tidy_upload_dir.py'))
+
+
+class QueueOnlyPool(object):
+    # leaves the jobs queued, instead of running them in another thread
+    def apply_async(self, func, args):
+        pass
+
+
+class PublishJobTest(TestCase):
+    fixtures = ['user.json', 'oppia.json']
+
+    def setUp(self):
+        super(PublishJobTest, self).setUp()
+        self.dir = tempfile.mkdtemp() + '/'
+        self.settings = override_settings(COURSE_UPLOAD_DIR=self.dir, MEDIA_ROOT=self.dir, OPPIA_PUBLISH_WORKERS=0)
+        self.settings.enable()
+        self.user = User.objects.get(username='admin')
+        self.user.set_password('secret')
+        self.user.save()
+
+    def tearDown(self):
+        self.settings.disable()
+        shutil.rmtree(self.dir)
+        super(PublishJobTest, self).tearDown()
+
+    def course_file(self, module_xml=MODULE_XML):
+        content = io.BytesIO()
+        zip = zipfile.ZipFile(content, 'w')
+        zip.writestr('upload-test/module.xml', module_xml)
+        zip.close()
+        return SimpleUploadedFile('upload-test.zip', content.getvalue(), content_type='application/zip')
+
+    def test_job(self):
+        job = add_job(self.user, self.course_file(), False, 'tag1, tag2')
+        self.assertEqual(PublishJob.DONE, job.status)
+        self.assertEqual(100, job.progress)
+        self.assertFalse(job.course.is_draft)
+        self.assertEqual(2, CourseTag.objects.filter(course=job.course).count())
+        # moved from the pending dir to its own name once published
+        self.assertEqual('upload-test.zip', job.course.filename)
+        self.assertTrue(os.path.isfile(self.dir + 'upload-test.zip'))
+        self.assertFalse(os.path.exists(self.dir + job.upload_path))
+
+    def test_failed_job(self):
+        with open(self.dir + 'upload-test.zip', 'wb') as f:
+            f.write('the existing file')
+        job = add_job(self.user, SimpleUploadedFile('upload-test.zip', 'not a zip file'))
+        self.assertEqual(PublishJob.FAILED, job.status)
+        self.assertEqual('Invalid course zip file', job.message)
+        self.assertIsNone(job.course)
+        # the file with the same name is left alone
+        with open(self.dir + 'upload-test.zip', 'rb') as f:
+            self.assertEqual('the existing file', f.read())
+        self.assertFalse(os.path.exists(self.dir + job.upload_path))
+
+    def test_queued_upload_saved_separately(self):
+        with open(self.dir + 'upload-test.zip', 'wb') as f:
+            f.write('the existing file')
+        publishing._pool = QueueOnlyPool()
+        try:
+            with override_settings(OPPIA_PUBLISH_WORKERS=1):
+                first = add_job(self.user, self.course_file())
+                second = add_job(self.user, self.course_file())
+        finally:
+            publishing._pool = None
+        self.assertEqual(PublishJob.QUEUED, first.status)
+        self.assertNotEqual(first.upload_path, second.upload_path)
+        with open(self.dir + 'upload-test.zip', 'rb') as f:
+            self.assertEqual('the existing file', f.read())
+
+        # the files of the queued jobs aren't tidied away
+        old = time.time() - 2 * tidy_upload_dir.PENDING_UPLOAD_MIN_AGE
+        os.utime(self.dir + first.upload_path, (old, old))
+        tidy_upload_dir.run()
+        self.assertTrue(os.path.isfile(self.dir + 'upload-test.zip'))
+        self.assertTrue(os.path.isfile(self.dir + first.upload_path))
+
+        run_job(first.id)
+        run_job(second.id)
+        self.assertEqual(PublishJob.DONE, PublishJob.objects.get(pk=second.id).status)
+        self.assertEqual(1, Course.objects.filter(filename='upload-test.zip').count())
+
+    def test_worker_runs_queued_jobs(self):
+        # eg left queued when the web server process was restarted
+        with open(self.dir + 'upload-test.zip', 'wb') as f:
+            f.write(self.course_file().read())
+        job = PublishJob.objects.create(user=self.user, filename='upload-test.zip')
+        publishing.run()
+        job = PublishJob.objects.get(pk=job.id)
+        self.assertEqual(PublishJob.DONE, job.status)
+        self.assertIsNotNone(job.course)
+
+    def test_job_claimed_once(self):
+        job = PublishJob.objects.create(user=self.user, filename='upload-test.zip')
+        self.assertEqual(job.id, claim_job().id)
+        self.assertIsNone(claim_job(job.id))
+        # already running elsewhere, so left alone
+        self.assertEqual(PublishJob.RUNNING, run_job(job.id).status)
+
+    def test_stale_jobs_failed(self):
+        stale = PublishJob.objects.create(user=self.user, filename='stale.zip', status=PublishJob.RUNNING,
+                                          lastupdated_date=timezone.now() - datetime.timedelta(hours=2))
+        running = PublishJob.objects.create(user=self.user, filename='running.zip', status=PublishJob.RUNNING)
+        self.assertEqual(1, fail_stale_jobs())
+        self.assertEqual(PublishJob.FAILED, PublishJob.objects.get(pk=stale.id).status)
+        self.assertEqual(PublishJob.RUNNING, PublishJob.objects.get(pk=running.id).status)
+
+    def test_publish_api(self):
+        response = self.client.post('/api/publish/', {'username': 'admin', 'password': 'secret',
+                                                      'tags': 'tag1', 'is_draft': 'True',
+                                                      'course_file': self.course_file()})
+        # run straight away, as OPPIA_PUBLISH_WORKERS is 0
+        self.assertEqual(201, response.status_code)
+        data = json.loads(response.content)
+        self.assertEqual('done', data['status'])
+        self.assertTrue(Course.objects.get(pk=data['course_id']).is_draft)
+
+        api_key = ApiKey.objects.get(user=self.user).key
+        response = self.client.get(data['status_url'], {'username': 'admin', 'api_key': api_key})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(data['course_id'], json.loads(response.content)['course_id'])
+
+        response = self.client.get(data['status_url'], {'username': 'admin', 'api_key': 'wrong'})
+        self.assertEqual(401, response.status_code)
+
+    def test_upload_page(self):
+        UserProfile.objects.get_or_create(user=self.user)
+        self.client.login(username='admin', password='secret')
+        response = self.client.post('/upload/', {'course_file': self.course_file()})
+        job = PublishJob.objects.get(user=self.user)
+        self.assertRedirects(response, '/upload/status/%d/' % job.id, target_status_code=302)
+
+        response = self.client.get('/upload/status/%d/' % job.id)
+        self.assertRedirects(response, '/upload2/%d' % job.course_id, fetch_redirect_response=False)
+
+    def test_upload_page_in_progress(self):
+        job = PublishJob.objects.create(user=self.user, filename='upload-test.zip')
+        self.client.login(username='admin', password='secret')
+        response = self.client.get('/upload/status/%d/' % job.id)
+        self.assertEqual(200, response.status_code)
+        self.assertTemplateUsed(response, 'oppia/upload-status.html')
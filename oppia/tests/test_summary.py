@@ -0,0 +1,130 @@
+# oppia/tests/test_summary.py
+import datetime
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from oppia.models import Course, Tracker, TrackerArchive, Points
+from oppia.summary import cron
+from oppia.summary.models import UserCourseSummary, CourseDailyStats, UserPointsSummary, SettingProperties
+
+
+class SummaryCronTest(TestCase):
+    fixtures = ['user.json', 'oppia.json', 'quiz.json']
+
+    def setUp(self):
+        super(SummaryCronTest, self).setUp()
+        self.user = User.objects.get(username='demo')
+        self.course = Course.objects.get(pk=1)
+
+    def add_tracker(self, digest, type='page', completed=True):
+        tracker = Tracker()
+        tracker.user = self.user
+        tracker.ip = '127.0.0.1'
+        tracker.course = self.course
+        tracker.type = type
+        tracker.digest = digest
+        tracker.completed = completed
+        tracker.save()
+        return tracker
+
+    def assertSummariesMatch(self):
+        for summary in UserCourseSummary.objects.all():
+            trackers = Tracker.objects.filter(user=summary.user, course=summary.course)
+            self.assertEqual(trackers.count(), summary.total_activity)
+            self.assertEqual(trackers.filter(type='download').count(), summary.total_downloads)
+            self.assertEqual(Course.get_activities_completed(summary.course, summary.user), summary.completed_activities)
+            self.assertEqual(Course.get_no_quizzes_completed(summary.course, summary.user), summary.quizzes_passed)
+            self.assertEqual(Course.get_badges(summary.course, summary.user), summary.badges_achieved)
+            self.assertEqual(Course.get_points(summary.course, summary.user) or 0, summary.points)
+
+        for summary in UserPointsSummary.objects.all():
+            self.assertEqual(Points.get_userscore(summary.user), summary.points)
+
+    def test_first_run(self):
+        self.add_tracker('11cc12291f730160c324b727dd2268b612137')
+        cron.run()
+
+        self.assertEqual(Tracker.objects.latest('id').id, SettingProperties.get_property('last_tracker_pk', 0))
+        self.assertTrue(UserCourseSummary.objects.filter(user=self.user, course=self.course).exists())
+        self.assertSummariesMatch()
+
+        daily_total = CourseDailyStats.objects.filter(course=self.course).values_list('total', flat=True)
+        trackers = Tracker.objects.filter(course=self.course, user__is_staff=False).exclude(type__isnull=True)
+        self.assertEqual(trackers.count(), sum(daily_total))
+
+    def test_incremental_run(self):
+        self.add_tracker('11cc12291f730160c324b727dd2268b612137', completed=False)
+        cron.run()
+        summary = UserCourseSummary.objects.get(user=self.user, course=self.course)
+
+        self.add_tracker('11cc12291f730160c324b727dd2268b612137')
+        self.add_tracker('11cc12291f730160c324b727dd2268b612137', type='download', completed=False)
+        cron.run()
+
+        updated = UserCourseSummary.objects.get(pk=summary.pk)
+        self.assertEqual(summary.total_activity + 2, updated.total_activity)
+        self.assertEqual(summary.total_downloads + 1, updated.total_downloads)
+        self.assertSummariesMatch()
+
+    def test_no_reset_after_archive(self):
+        summary = UserCourseSummary.objects.create(user=self.user, course=self.course, total_activity=5)
+        tracker = self.add_tracker('11cc12291f730160c324b727dd2268b612137')
+        TrackerArchive.objects.create(user=self.user, course=self.course, ip='127.0.0.1', month=datetime.date(2015, 1, 1),
+                                      digest='11cc12291f730160c324b727dd2268b612137')
+        cron.run()
+
+        # the existing summaries (including the archived trackers) are kept
+        self.assertEqual(5, UserCourseSummary.objects.get(pk=summary.pk).total_activity)
+        self.assertEqual(0, SettingProperties.get_property('last_tracker_pk', 0))
+
+    def test_no_new_trackers(self):
+        self.add_tracker('11cc12291f730160c324b727dd2268b612137')
+        cron.run()
+        with self.assertNumQueries(4):
+            cron.run()
+
+    def test_shards_match(self):
+        self.add_tracker('11cc12291f730160c324b727dd2268b612137')
+        self.user = User.objects.get(username='admin')
+        self.add_tracker('11cc12291f730160c324b727dd2268b612137', type='search')
+
+        window = (0, Tracker.objects.latest('id').id, 0, Points.objects.latest('id').id)
+        user_ids = cron.affected_users(window)
+        single = cron.summarise(window, user_ids)
+        sharded = cron.merge_results(map(cron.summarise_shard, [(window, user_ids[0::2]), (window, user_ids[1::2])]))
+
+        self.assertEqual(single['daily'], sharded['daily'])
+        self.assertEqual(single['points'], sharded['points'])
+        self.assertEqual(sorted([(s.user_id, s.course_id, s.total_activity) for s in single['summaries']]),
+                         sorted([(s.user_id, s.course_id, s.total_activity) for s in sharded['summaries']]))
+
+    def test_chunks(self):
+        for i in range(5):
+            self.add_tracker('11cc12291f730160c324b727dd2268b612137', completed=(i % 2 == 0))
+        cron.run(chunk_size=2)
+
+        self.assertEqual(Tracker.objects.latest('id').id, SettingProperties.get_property('last_tracker_pk', 0))
+        self.assertSummariesMatch()
+
+    def test_resume_after_failed_chunk(self):
+        for i in range(4):
+            self.add_tracker('11cc12291f730160c324b727dd2268b612137')
+        first_tracker_pk = Tracker.objects.order_by('id')[0].id
+
+        summarise = cron.summarise
+        def fail_after_first_chunk(window, user_ids, workers=1):
+            if window[0] > 0:
+                raise Exception('summary failed')
+            return summarise(window, user_ids, workers)
+
+        cron.summarise = fail_after_first_chunk
+        try:
+            self.assertRaises(Exception, cron.run, chunk_size=first_tracker_pk + 1)
+        finally:
+            cron.summarise = summarise
+        self.assertEqual(first_tracker_pk + 1, SettingProperties.get_property('last_tracker_pk', 0))
+
+        cron.run(chunk_size=first_tracker_pk + 1)
+        self.assertEqual(Tracker.objects.latest('id').id, SettingProperties.get_property('last_tracker_pk', 0))
+        self.assertSummariesMatch()
@@ -0,0 +1,196 @@
+# oppia/tests/test_uploader.py
+import io
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from oppia.course_xml_reader import parse_course_xml
+from oppia.models import Course, Section, Activity, Media
+from oppia.uploader import import_course, save_uploaded_file, UploadError
+
+MODULE_XML = '''<?xml version="1.0" encoding="UTF-8"?>
+<module>
+    <meta>
+        <versionid>20150101120000</versionid>
+        <priority>0</priority>
+        <title lang="en">Upload Test</title>
+        <description lang="en">A course for testing uploads</description>
+        <shortname>upload-test</shortname>
+        <activity type="quiz" order="0" digest="baseline-digest">
+            <title lang="en">Pre-test</title>
+            <content lang="en">{"id": 1}</content>
+        </activity>
+    </meta>
+    <structure>
+        <section order="1">
+            <title lang="en">Section 1</title>
+            <activities>
+                <activity type="page" order="1" digest="page-digest">
+                    <title lang="en">Page 1</title>
+                    <location lang="en">page1.html</location>
+                    <image filename="images/page1.png"/>
+                    <description lang="en">About page 1</description>
+                </activity>
+                <activity type="resource" order="2" digest="resource-digest">
+                    <title lang="en">Resource</title>
+                    <location type="application/pdf">resources/handout.pdf</location>
+                </activity>
+            </activities>
+        </section>
+        <section order="2">
+            <title lang="en">Section 2</title>
+            <activities>
+                <activity type="feedback" order="1" digest="feedback-digest">
+                    <title lang="en">Feedback</title>
+                    <content lang="en">{"id": 2}</content>
+                </activity>
+            </activities>
+        </section>
+    </structure>
+    <media>
+        <file filename="video.m4v" download_url="http://example.com/video.m4v" digest="media-digest" filesize="1000" length="60"/>
+    </media>
+</module>'''
+
+
+class CourseXMLTest(TestCase):
+
+    def test_parse(self):
+        events = list(parse_course_xml(io.BytesIO(MODULE_XML)))
+        self.assertEqual(['meta', 'section', 'section', 'structure', 'media'], [e for e, v in events])
+
+        meta = events[0][1]
+        self.assertEqual(20150101120000, meta['versionid'])
+        self.assertEqual('upload-test', meta['shortname'])
+        self.assertEqual({'en': 'Upload Test'}, json.loads(meta['title']))
+        self.assertEqual(['baseline-digest'], [a['digest'] for a in meta['activities']])
+
+        page, resource = events[1][1]['activities']
+        self.assertEqual({'en': 'page1.html'}, json.loads(page['content']))
+        self.assertEqual('images/page1.png', page['image'])
+        self.assertEqual({'en': 'About page 1'}, json.loads(page['description']))
+        self.assertEqual('resources/handout.pdf', resource['content'])
+        self.assertIsNone(resource['description'])
+        self.assertEqual(2, events[3][1])
+        self.assertEqual([{'filename': 'video.m4v', 'download_url': 'http://example.com/video.m4v',
+                           'digest': 'media-digest', 'filesize': '1000', 'media_length': '60'}], events[4][1])
+
+    def test_meta_after_structure(self):
+        xml = '<module><structure><section order="1"><title lang="en">S</title></section></structure>' \
+              '<meta><shortname>late</shortname></meta></module>'
+        events = list(parse_course_xml(io.BytesIO(xml)))
+        self.assertEqual(['meta', 'section', 'structure', 'media'], [e for e, v in events])
+        self.assertEqual('late', events[0][1]['shortname'])
+
+
+class UploadTest(TestCase):
+    fixtures = ['user.json', 'oppia.json']
+
+    def setUp(self):
+        super(UploadTest, self).setUp()
+        self.dir = tempfile.mkdtemp() + '/'
+        self.settings = override_settings(COURSE_UPLOAD_DIR=self.dir, MEDIA_ROOT=self.dir)
+        self.settings.enable()
+        self.user = User.objects.get(username='admin')
+
+    def tearDown(self):
+        self.settings.disable()
+        shutil.rmtree(self.dir)
+        super(UploadTest, self).tearDown()
+
+    def upload(self, module_xml=MODULE_XML, files=['page1.html']):
+        content = io.BytesIO()
+        zip = zipfile.ZipFile(content, 'w')
+        zip.writestr('upload-test/module.xml', module_xml)
+        for name in files:
+            zip.writestr('upload-test/' + name, '<html></html>')
+        zip.close()
+        f = SimpleUploadedFile('upload-test.zip', content.getvalue())
+        return import_course(save_uploaded_file(f), f.name, self.user)
+
+    def test_upload(self):
+        course = self.upload()
+        self.assertEqual('upload-test', course.shortname)
+        self.assertEqual(20150101120000, course.version)
+        self.assertTrue(course.is_draft)
+
+        sections = Section.objects.filter(course=course).order_by('order')
+        self.assertEqual([0, 1, 2], [s.order for s in sections])
+        self.assertEqual('{"en": "Baseline"}', sections[0].title)
+        self.assertEqual(['baseline-digest', 'page-digest', 'resource-digest', 'feedback-digest'],
+                         list(Activity.objects.filter(section__course=course).order_by('id').values_list('digest', flat=True)))
+        baseline = Activity.objects.get(digest='baseline-digest')
+        self.assertTrue(baseline.baseline)
+        self.assertEqual('{"id": 1}', baseline.content)
+
+        media = Media.objects.get(course=course)
+        self.assertEqual(1000, media.filesize)
+        self.assertEqual(60, media.media_length)
+
+    def test_update(self):
+        course = self.upload()
+        updated = self.upload(MODULE_XML.replace('20150101120000', '20150102120000'))
+        self.assertEqual(course.id, updated.id)
+        self.assertEqual(20150102120000, Course.objects.get(pk=course.id).version)
+        self.assertEqual(4, Activity.objects.filter(section__course=course).count())
+        self.assertEqual(1, Media.objects.filter(course=course).count())
+
+    def test_update_keeps_unchanged_activities(self):
+        course = self.upload()
+        ids = dict(Activity.objects.filter(section__course=course).values_list('digest', 'id'))
+        media_id = Media.objects.get(course=course).id
+
+        # page changed and moved to section 2, resource removed, new activity added
+        module_xml = MODULE_XML.replace('20150101120000', '20150102120000') \
+                               .replace('<title lang="en">Page 1</title>', '<title lang="en">Page One</title>')
+        start = module_xml.index('<activity type="page"')
+        end = module_xml.index('</activities>')
+        moved = module_xml[start:module_xml.index('<activity type="resource"')]
+        module_xml = module_xml[:start] + module_xml[end:]
+        module_xml = module_xml.replace('</activities>\n        </section>\n    </structure>',
+                                        moved + '<activity type="page" order="3" digest="new-digest">'
+                                        '<title lang="en">New</title><location lang="en">new.html</location>'
+                                        '</activity></activities>\n        </section>\n    </structure>')
+        self.upload(module_xml)
+
+        activities = dict((a.digest, a) for a in Activity.objects.filter(section__course=course))
+        self.assertEqual(set(['baseline-digest', 'page-digest', 'feedback-digest', 'new-digest']), set(activities.keys()))
+        for digest in ['baseline-digest', 'page-digest', 'feedback-digest']:
+            self.assertEqual(ids[digest], activities[digest].id)
+        self.assertEqual('{"en": "Page One"}', activities['page-digest'].title)
+        self.assertEqual(2, activities['page-digest'].section.order)
+        self.assertEqual(media_id, Media.objects.get(course=course).id)
+        self.assertEqual(3, Section.objects.filter(course=course).count())
+
+    def test_no_sections_rolled_back(self):
+        course = self.upload()
+        start = MODULE_XML.index('<section order="1">')
+        end = MODULE_XML.index('</structure>')
+        module_xml = MODULE_XML.replace('20150101120000', '20150102120000')
+        module_xml = module_xml[:start] + module_xml[end:]
+        self.assertRaises(UploadError, self.upload, module_xml)
+
+        self.assertEqual(20150101120000, Course.objects.get(pk=course.id).version)
+        self.assertEqual(4, Activity.objects.filter(section__course=course).count())
+
+    def test_preview_extracted(self):
+        self.upload(files=['page1.html', 'images/page1.png', 'resources/handout.pdf'])
+        preview_path = os.path.join(self.dir, 'courses', 'upload-test')
+        self.assertTrue(os.path.isfile(os.path.join(preview_path, 'module.xml')))
+        self.assertTrue(os.path.isfile(os.path.join(preview_path, 'images', 'page1.png')))
+
+        # the old files are replaced, and no temporary directories are left
+        self.upload(MODULE_XML.replace('20150101120000', '20150102120000'), files=['page2.html'])
+        self.assertEqual(['module.xml', 'page2.html'], sorted(os.listdir(preview_path)))
+        self.assertEqual(['upload-test'], os.listdir(os.path.join(self.dir, 'courses')))
+
+    def test_invalid_zip(self):
+        f = SimpleUploadedFile('upload-test.zip', 'not a zip file')
+        self.assertRaises(UploadError, import_course, save_uploaded_file(f), f.name, self.user)
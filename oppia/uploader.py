@@ -1,167 +1,170 @@
 # oppia/uploader.py
-import json
 import shutil
-import xml.dom.minidom
+import tempfile
 import zipfile
-from xml.dom.minidom import Node
+from multiprocessing.pool import ThreadPool
 
 import os
 from django.conf import settings
-from django.contrib import messages
+from django.db import transaction
 from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 
+from oppia.bulk import bulk_update, batches
+from oppia.course_xml_reader import parse_course_xml
+from oppia.digests import invalidate_course
+from oppia.downloads import save_manifest, remove_delta_packages
 from oppia.models import Course, Section, Activity, Media
 
+# the Activity fields that may change between versions of a course
+ACTIVITY_FIELDS = ['section_id', 'order', 'title', 'type', 'baseline', 'image', 'content', 'description']
 
-def handle_uploaded_file(f, extract_path, request, user):
-    zipfilepath = settings.COURSE_UPLOAD_DIR + f.name
+# no of ids to include in each "DELETE ... IN (...)"
+DELETE_BATCH_SIZE = 400
+
+# no of files to extract from the course zip at the same time
+EXTRACT_THREADS = 4
+
+# directory (under COURSE_UPLOAD_DIR) courses are uploaded to while they wait
+# to be published, see oppia/publishing.py
+PENDING_DIR = 'pending'
+
+
+class UploadError(Exception):
+    """
+    Raised when an uploaded course can't be saved, with the (translated)
+    reason to show to the user
+    """
+    pass
+
+
+def save_uploaded_file(f, filename=None):
+    """
+    Saves the uploaded file in the COURSE_UPLOAD_DIR, under its own name
+    unless another (eg PENDING_DIR/...) is given
+    :return: the path the file was saved to
+    """
+    zipfilepath = settings.COURSE_UPLOAD_DIR + (filename or f.name)
+    if not os.path.isdir(os.path.dirname(zipfilepath)):
+        os.makedirs(os.path.dirname(zipfilepath))
     
     with open(zipfilepath, 'wb+') as destination:
         for chunk in f.chunks():
             destination.write(chunk)
-            
-    zip = zipfile.ZipFile(zipfilepath)
-    zip.extractall(path=extract_path)      
+    return zipfilepath
+
+
+def import_course(zipfilepath, filename, user, progress=None):
+    """
+    Saves the course in the zip file, and extracts it for the preview
+    :param zipfilepath: the uploaded course zip file, moved to the filename
+        once the course has been saved
+    :param filename: the course filename (in the COURSE_UPLOAD_DIR)
+    :param user: the user uploading the course
+    :param progress: optional function called with the stage and % done as
+        the course is imported
+    :return: the course, an UploadError is raised if the course is invalid
+    """
+    if progress is None:
+        progress = lambda stage, percent: None
+    
+    progress('parsing', 10)
+    try:
+        zip = zipfile.ZipFile(zipfilepath)
+    except zipfile.BadZipfile:
+        raise UploadError(_("Invalid course zip file"))
+    
+    # the module.xml is read straight from the zip file, the course is only
+    # extracted (for the preview) once it's been saved
+    try:
+        course = save_course(filename, zip, user, progress)
+    finally:
+        zip.close()
+    
+    # only now the course is valid does the file replace any existing one
+    if zipfilepath != settings.COURSE_UPLOAD_DIR + filename:
+        shutil.move(zipfilepath, settings.COURSE_UPLOAD_DIR + filename)
+        zipfilepath = settings.COURSE_UPLOAD_DIR + filename
+    
+    # Extract the final file into the courses area for preview
+    progress('extracting', 70)
+    extract_course(zipfilepath, settings.MEDIA_ROOT + "courses/")
+    
+    # keep the manifest of this version, for delta updates from it later
+    progress('finishing', 90)
+    save_manifest(course)
+    remove_delta_packages(course)
     
+    return course
+
+
+def save_course(filename, zip, user, progress):
     mod_name = ''
-    for dir in os.listdir(extract_path)[:1]:
-        mod_name = dir
+    for name in zip.namelist()[:1]:
+        mod_name = name.split('/')[0]
        
     # check there is at least a sub dir 
     if mod_name == '':
-        messages.info(request, _("Invalid course zip file"))
-        return False
+        raise UploadError(_("Invalid course zip file"))
     
     # check that the 
-    if not os.path.isfile(os.path.join(extract_path, mod_name, "module.xml")):
-        messages.info(request, _("Zip file does not contain a module.xml file"))
-        return False
+    if mod_name + "/module.xml" not in zip.namelist():
+        raise UploadError(_("Zip file does not contain a module.xml file"))
       
-    # parse the module.xml file
-    print extract_path
-    print mod_name
-    
-    doc = xml.dom.minidom.parse(os.path.join(extract_path, mod_name, "module.xml")) 
-    for meta in doc.getElementsByTagName("meta")[:1]:
-        versionid = 0
-        for v in meta.getElementsByTagName("versionid")[:1]:
-            versionid = int(v.firstChild.nodeValue)
-        temp_title = {}
-        for t in meta.childNodes:
-            if t.nodeName == "title":
-                temp_title[t.getAttribute('lang')] = t.firstChild.nodeValue
-        title = json.dumps(temp_title)
-        
-        temp_description = {}
-        for t in meta.childNodes:
-            if t.nodeName == "description":
-                if t.firstChild is not None:
-                    temp_description[t.getAttribute('lang')] = t.firstChild.nodeValue
-                else:
-                    temp_description[t.getAttribute('lang')] = None
-        description = json.dumps(temp_description)
-        
-        shortname = ''
-        for sn in meta.getElementsByTagName("shortname")[:1]:
-            shortname = sn.firstChild.nodeValue
+    # parse the module.xml file, in a single pass - the meta always comes first
+    events = parse_course_xml(zip.open(mod_name + "/module.xml"))
+    event, meta = next(events)
+    if meta is None:
+        raise UploadError(_("Invalid course zip file"))
+    versionid = meta['versionid']
+    title = meta['title']
+    description = meta['description']
+    shortname = meta['shortname']
     
+    progress('importing', 30)
     old_course_filename = None
-    # Find if course already exists
-    try: 
-        
-        print shortname
-        
-        course = Course.objects.get(shortname=shortname)
-        old_course_filename = course.filename
-
-        # check that the current user is allowed to wipe out the other course
-        if course.user != user:
-            messages.info(request, _("Sorry, only the original owner may update this course"))
-            return False
-        
-        # check if course version is older
-        if course.version > versionid:
-            messages.info(request, _("A newer version of this course already exists"))
-            return False
-        # wipe out the old sections/activities/media
-        oldsections = Section.objects.filter(course=course)
-        oldsections.delete()
-        oldmedia = Media.objects.filter(course=course)
-        oldmedia.delete()
-        
-        course.shortname = shortname
-        course.title = title
-        course.description = description
-        course.version = versionid
-        course.user = user
-        course.filename = f.name
-        course.lastupdated_date = timezone.now()
-        course.save()
-    except Course.DoesNotExist:
-        course = Course()
-        course.shortname = shortname
-        course.title = title
-        course.description = description
-        course.version = versionid
-        course.user = user
-        course.filename = f.name
-        course.is_draft = True
-        course.save()
-       
-    # add in any baseline activities
-    for meta in doc.getElementsByTagName("meta")[:1]:
-        if meta.getElementsByTagName("activity").length > 0:
-            section = Section()
-            section.course = course
-            section.title = '{"en": "Baseline"}'
-            section.order = 0
-            section.save()
-            for a in meta.getElementsByTagName("activity"):
-                parse_and_save_activity(section, a, True)
-                    
-    # add all the sections
-    for structure in doc.getElementsByTagName("structure")[:1]:
-        
-        if structure.getElementsByTagName("section").length == 0:
-            messages.info(request, _("There don't appear to be any activities in this upload file."))
-            course.delete()
-            return False
-        
-        for s in structure.getElementsByTagName("section"):
-            temp_title = {}
-            for t in s.childNodes:
-                if t.nodeName == 'title':
-                    temp_title[t.getAttribute('lang')] = t.firstChild.nodeValue
-            title = json.dumps(temp_title)
-            section = Section()
-            section.course = course
-            section.title = title
-            section.order = s.getAttribute("order")
-            section.save()
+    # the course and its structure are all saved in one transaction, so the
+    # course is never seen half updated
+    with transaction.atomic():
+        # Find if course already exists
+        try: 
+            course = Course.objects.get(shortname=shortname)
+            old_course_filename = course.filename
+    
+            # check that the current user is allowed to wipe out the other course
+            if course.user != user:
+                raise UploadError(_("Sorry, only the original owner may update this course"))
             
-            # add all the activities
-            for activities in s.getElementsByTagName("activities")[:1]:
-                for a in activities.getElementsByTagName("activity"):
-                    parse_and_save_activity(section, a, False)
-                    
-    # add all the media
-    for file in doc.lastChild.lastChild.childNodes:
-        if file.nodeName == 'file':
-            media = Media()
-            media.course = course
-            media.filename = file.getAttribute("filename")
-            media.download_url = file.getAttribute("download_url")
-            media.digest = file.getAttribute("digest")
+            # check if course version is older
+            if course.version > versionid:
+                raise UploadError(_("A newer version of this course already exists"))
             
-            # get any optional attributes
-            for attrName, attrValue in file.attributes.items():
-                if attrName == "length":
-                    media.media_length = attrValue
-                if attrName == "filesize":
-                    media.filesize = attrValue
-
-            media.save()
+            course.shortname = shortname
+            course.title = title
+            course.description = description
+            course.version = versionid
+            course.user = user
+            course.filename = filename
+            course.lastupdated_date = timezone.now()
+            course.save()
+        except Course.DoesNotExist:
+            course = Course()
+            course.shortname = shortname
+            course.title = title
+            course.description = description
+            course.version = versionid
+            course.user = user
+            course.filename = filename
+            course.is_draft = True
+            course.save()
+        
+        if not save_course_structure(course, meta['activities'], events):
+            raise UploadError(_("There don't appear to be any activities in this upload file."))
+    
+    # the digest index may still point to the old sections/activities/media
+    digests = list(Activity.objects.filter(section__course=course).values_list('digest', flat=True))
+    digests += list(Media.objects.filter(course=course).values_list('digest', flat=True))
+    invalidate_course(course.id, digests)
     
     if old_course_filename is not None and old_course_filename != course.filename:
         try:
@@ -169,83 +172,168 @@ def handle_uploaded_file(f, extract_path, request, user):
         except OSError:
             pass
     
-    # Extract the final file into the courses area for preview
-    zipfilepath = settings.COURSE_UPLOAD_DIR + f.name
-    
-    with open(zipfilepath, 'wb+') as destination:
-        for chunk in f.chunks():
-            destination.write(chunk)
-            
-    zip = zipfile.ZipFile(zipfilepath)
-    course_preview_path = settings.MEDIA_ROOT + "courses/"
-    zip.extractall(path=course_preview_path)      
-    
-    # remove the temp upload files
-    shutil.rmtree(extract_path, ignore_errors=True)
-        
-    return course       
+    return course
 
 
-def parse_and_save_activity(section, act, is_baseline=False):
+def extract_course(zipfilepath, path, threads=EXTRACT_THREADS):
     """
-    Parses an Activity XML and saves it to the DB
-    :param section: section the activity belongs to
-    :param act: a XML DOM element containing a single activity
-    :param is_baseline: is the activity part of the baseline?
+    Extracts the course zip into the path, first into a temporary directory
+    which then replaces the existing course directory, so the preview never
+    shows a partly extracted course. The files are extracted in parallel
+    :param zipfilepath: the course zip file
+    :param path: where to extract the course to
+    :param threads: no of files to extract at the same time
     :return: None
     """
-    temp_title = {}
-    for t in act.getElementsByTagName("title"):
-        temp_title[t.getAttribute('lang')] = t.firstChild.nodeValue
-    title = json.dumps(temp_title)
-
-    content = ""
-    if act.getAttribute("type") == "page":
-        temp_content = {}
-        for t in act.getElementsByTagName("location"):
-            if t.firstChild and t.getAttribute('lang'):
-                temp_content[t.getAttribute('lang')] = t.firstChild.nodeValue
-        content = json.dumps(temp_content)
-    elif act.getAttribute("type") == "quiz":
-        for c in act.getElementsByTagName("content"):
-            content = c.firstChild.nodeValue
-    elif act.getAttribute("type") == "feedback":
-        for c in act.getElementsByTagName("content"):
-            content = c.firstChild.nodeValue
-    elif act.getAttribute("type") == "resource":
-        for c in act.getElementsByTagName("location"):
-            content = c.firstChild.nodeValue
-    elif act.getAttribute("type") == "url":
-        temp_content = {}
-        for t in act.getElementsByTagName("location"):
-            if t.firstChild and t.getAttribute('lang'):
-                temp_content[t.getAttribute('lang')] = t.firstChild.nodeValue
-        content = json.dumps(temp_content)
-    else:
-        content = None
-    
-    image = None
-    if act.getElementsByTagName("image"):
-        for i in act.getElementsByTagName("image"):
-            image = i.getAttribute('filename') 
-
-    if act.getElementsByTagName("description"):
-        description = {}
-        for d in act.getElementsByTagName("description"):
-            if d.firstChild and d.getAttribute('lang'):
-                description[d.getAttribute('lang')] = d.firstChild.nodeValue
-        description = json.dumps(description)
-    else:
-        description = None
-          
-    activity = Activity()
-    activity.section = section
-    activity.order = act.getAttribute("order")
-    activity.title = title
-    activity.type = act.getAttribute("type")
-    activity.digest = act.getAttribute("digest")
-    activity.baseline = is_baseline
-    activity.image = image
-    activity.content = content
-    activity.description = description
-    activity.save()           
\ No newline at end of file
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    temp_path = tempfile.mkdtemp(prefix='.extract-', dir=path)
+    try:
+        with zipfile.ZipFile(zipfilepath) as zip:
+            members = [m for m in zip.namelist() if not m.endswith('/')]
+            dirs = set()
+            for name in zip.namelist():
+                dirs.add(os.path.dirname(os.path.join(temp_path, name)))
+            for d in sorted(dirs):
+                if not os.path.isdir(d):
+                    os.makedirs(d)
+
+        pool = ThreadPool(threads)
+        try:
+            pool.map(_extract_members, [(zipfilepath, members[i::threads], temp_path) for i in range(threads)])
+        finally:
+            pool.close()
+
+        for name in os.listdir(temp_path):
+            target = os.path.join(path, name)
+            old_path = None
+            if os.path.exists(target):
+                old_path = tempfile.mkdtemp(prefix='.old-', dir=path)
+                os.rename(target, os.path.join(old_path, name))
+            os.rename(os.path.join(temp_path, name), target)
+            if old_path is not None:
+                shutil.rmtree(old_path, ignore_errors=True)
+    finally:
+        shutil.rmtree(temp_path, ignore_errors=True)
+
+
+def _extract_members(args):
+    # each thread reads the zip file with its own file handle
+    zipfilepath, members, path = args
+    with zipfile.ZipFile(zipfilepath) as zip:
+        for m in members:
+            zip.extract(m, path)
+
+
+def save_course_structure(course, baseline_activities, events):
+    """
+    Saves the sections, activities and media of the course, comparing them to
+    the existing ones so that unchanged activities and media (matched by
+    digest) keep their ids, and only the changed rows are updated
+    :param course: the course being uploaded
+    :param baseline_activities: the baseline activity values from the meta
+    :param events: the rest of the events from course_xml_reader.parse_course_xml
+    :return: False if the course structure doesn't have any sections
+    """
+    sections = dict((s.order, s) for s in Section.objects.filter(course=course))
+    activities = {}
+    for a in Activity.objects.filter(section__course=course).order_by('id'):
+        activities.setdefault(a.digest, []).append(a)
+    kept_sections = []
+    updated = []
+
+    def save_section(order, title, section_activities, is_baseline):
+        section = sections.pop(order, None)
+        if section is None:
+            section = Section(course=course, order=order, title=title)
+            section.save()
+        elif section.title != title:
+            section.title = title
+            section.save()
+        kept_sections.append(section.id)
+
+        created = []
+        for values in section_activities:
+            fields = activity_fields(values, is_baseline)
+            existing = activities.get(values['digest'])
+            if existing:
+                activity = existing.pop(0)
+                fields['section_id'] = section.id
+                if set_changed_fields(activity, fields):
+                    updated.append(activity)
+            else:
+                created.append(Activity(section=section, **fields))
+        Activity.objects.bulk_create(created)
+
+    if len(baseline_activities) > 0:
+        save_section(0, '{"en": "Baseline"}', baseline_activities, True)
+
+    for event, value in events:
+        if event == 'section':
+            save_section(int(value['order']), value['title'], value['activities'], False)
+        elif event == 'structure' and value == 0:
+            return False
+        elif event == 'media':
+            save_media(course, value)
+
+    # activities are moved before their old sections are removed
+    bulk_update(Activity, updated, ACTIVITY_FIELDS)
+    removed = [a.id for existing in activities.values() for a in existing]
+    for batch in batches(removed, DELETE_BATCH_SIZE):
+        Activity.objects.filter(id__in=batch).delete()
+    Section.objects.filter(course=course).exclude(id__in=kept_sections).delete()
+    return True
+
+
+def save_media(course, media):
+    existing = {}
+    for m in Media.objects.filter(course=course).order_by('id'):
+        existing.setdefault(m.digest, []).append(m)
+
+    created = []
+    updated = []
+    for values in media:
+        fields = {'filename': values['filename'],
+                  'download_url': values['download_url'],
+                  'digest': values['digest'],
+                  'filesize': _to_int(values.get('filesize')),
+                  'media_length': _to_int(values.get('media_length'))}
+        if existing.get(values['digest']):
+            m = existing[values['digest']].pop(0)
+            if set_changed_fields(m, fields):
+                updated.append(m)
+        else:
+            created.append(Media(course=course, **fields))
+
+    Media.objects.bulk_create(created)
+    bulk_update(Media, updated, ['filename', 'download_url', 'filesize', 'media_length'])
+    Media.objects.filter(id__in=[m.id for ms in existing.values() for m in ms]).delete()
+
+
+def activity_fields(values, is_baseline):
+    """
+    The Activity field values, as read by course_xml_reader.parse_activity
+    """
+    return {'order': int(values['order']),
+            'title': values['title'],
+            'type': values['type'],
+            'digest': values['digest'],
+            'baseline': is_baseline,
+            'image': values['image'],
+            'content': values['content'],
+            'description': values['description']}
+
+
+def set_changed_fields(obj, fields):
+    changed = False
+    for field, value in fields.items():
+        if getattr(obj, field) != value:
+            setattr(obj, field, value)
+            changed = True
+    return changed
+
+
+def _to_int(value):
+    if value is None or value == '':
+        return None
+    return int(value)
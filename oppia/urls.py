@@ -43,6 +43,7 @@ urlpatterns = patterns('',
     
     url(r'^leaderboard/$', 'oppia.views.leaderboard_view', name="oppia_leaderboard"),
     url(r'^upload/$', 'oppia.views.upload_step1', name="oppia_upload"),
+    url(r'^upload/status/(?P<job_id>\d+)/$', 'oppia.views.upload_status', name="oppia_upload_status"),
     url(r'^upload2/(?P<course_id>\d+)$', 'oppia.views.upload_step2', name="oppia_upload2"),
     url(r'^upload2/success/$', TemplateView.as_view(template_name="oppia/upload-success.html"), name="oppia_upload_success"),
     url(r'^course/$', 'oppia.views.courses_list_view', name="oppia_course"),
@@ -71,6 +72,7 @@ urlpatterns = patterns('',
     
     url(r'^api/', include(v1_api.urls)),
     url(r'^api/publish/$', 'oppia.api.publish.publish_view', name="oppia_publish"),
+    url(r'^api/publish/status/(?P<job_id>\d+)/$', 'oppia.api.publish.publish_status_view', name="oppia_publish_status"),
     
     url(r'^content/', include('oppia.content.urls')),
     url(r'^preview/', include('oppia.preview.urls')),
@@ -0,0 +1,109 @@
+'''
+ Reports which index(es) the database uses for each of the main queries run on
+ the tracker table, so that changes in the query plans (eg a query that has
+ started scanning the whole table) can be spotted.
+
+ Note that on a small database the query planner may decide a full scan is
+ quicker than using an index, so this is best run against a copy of a live
+ database.
+
+ For full instructions, see the documentation at
+ https://oppiamobile.readthedocs.org/en/latest/
+'''
+
+import argparse
+import datetime
+import re
+import sys
+
+
+def get_queries():
+    from django.utils import timezone
+    from oppia.models import Tracker, UserActivityCompletion
+
+    # use the values of a recent tracker, so the planner has real values to go on
+    user_id, course_id, digest, uuid = 0, 0, '', ''
+    for t in Tracker.objects.exclude(course__isnull=True).order_by('-id')[:1]:
+        user_id, course_id, digest, uuid = t.user_id, t.course_id, t.digest, t.uuid
+    last_week = timezone.now() - datetime.timedelta(days=7)
+
+    return [
+        ('activities completed', Tracker.objects.filter(user_id=user_id, course_id=course_id, completed=True, digest__in=[digest])),
+        ('course activity', Tracker.objects.filter(course_id=course_id, tracker_date__gte=last_week)),
+        ('digest trackers', Tracker.objects.filter(digest=digest)),
+        ('uuid trackers', Tracker.objects.filter(uuid=uuid)),
+        ('user activity views', Tracker.objects.filter(user_id=user_id, type='page', submitted_date__gte=last_week)),
+        ('summary window', Tracker.objects.filter(pk__gt=0, pk__lte=1000)),
+        ('course progress', UserActivityCompletion.objects.filter(user_id=user_id, course_id=course_id, completed=True)),
+    ]
+
+
+def explain(queryset):
+    from django.db import connection
+
+    sql, params = queryset.query.sql_with_params()
+    if connection.vendor == 'sqlite':
+        sql = 'EXPLAIN QUERY PLAN ' + sql
+    else:
+        sql = 'EXPLAIN ' + sql
+    cursor = connection.cursor()
+    cursor.execute(sql, params)
+    columns = [c[0] for c in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def indexes_used(plan):
+    '''
+    Returns the indexes used and the tables that are scanned without an index
+    '''
+    indexes = []
+    scans = []
+    for row in plan:
+        if 'key' in row:
+            # MySQL
+            if row['key']:
+                indexes.append(row['key'])
+            elif row.get('table'):
+                scans.append(row['table'])
+            continue
+
+        # SQLite has a 'detail' column, PostgreSQL a 'QUERY PLAN' one
+        detail = row.get('detail', row.get('QUERY PLAN', ''))
+        match = re.search(r'USING (?:COVERING )?INDEX (\S+)|Index (?:Only )?Scan using (\S+)', detail)
+        if match:
+            indexes.append(match.group(1) or match.group(2))
+        elif 'USING INTEGER PRIMARY KEY' in detail:
+            indexes.append('PRIMARY')
+        else:
+            match = re.search(r'^SCAN (?:TABLE )?(\S+)|Seq Scan on (\S+)', detail.strip())
+            if match:
+                scans.append(match.group(1) or match.group(2))
+    return indexes, scans
+
+
+def run(verbose=False):
+    print 'Checking the indexes used for the tracker queries...'
+    full_scans = 0
+    for name, queryset in get_queries():
+        plan = explain(queryset)
+        indexes, scans = indexes_used(plan)
+        if scans:
+            full_scans += 1
+            print ('%s: FULL SCAN of %s (indexes used: %s)' % (name, ', '.join(scans), ', '.join(indexes) or 'none'))
+        else:
+            print ('%s: %s' % (name, ', '.join(indexes)))
+        if verbose:
+            for row in plan:
+                print ('    %s' % row)
+
+    print ('%d queries not fully using indexes' % full_scans)
+    return full_scans
+
+if __name__ == "__main__":
+    import django
+    django.setup()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-v", "--verbose", help="show the full query plans", action="store_true")
+    args = parser.parse_args()
+    if run(args.verbose) > 0:
+        sys.exit(1)
@@ -9,18 +9,36 @@ import os
 import time 
 import django.db.models
 from django.conf import settings
-from oppia.models import Course
+from oppia.models import Course, PublishJob
+from oppia.uploader import PENDING_DIR
+
+# uploads saved less than this long (in seconds) ago are left, their job may
+# not have been added yet
+PENDING_UPLOAD_MIN_AGE = 60 * 60
 
 def run():
+    # the files of the courses still waiting to be (or being) published
+    jobs = PublishJob.objects.filter(status__in=[PublishJob.QUEUED, PublishJob.RUNNING])
+    in_use = set(jobs.values_list('filename', flat=True)) | set(jobs.values_list('upload_path', flat=True))
+
     files = os.listdir(settings.COURSE_UPLOAD_DIR)
     for filename in files:
-        if filename.endswith(".zip"):
+        if filename.endswith(".zip") and filename not in in_use:
             # find out if it's a live course file
             courses = Course.objects.filter(filename=filename)
             if courses.count() == 0:
                 #delete the file
                 os.remove(settings.COURSE_UPLOAD_DIR + filename)
                 print "Removed: " + filename
-                
+
+    pending_dir = os.path.join(settings.COURSE_UPLOAD_DIR, PENDING_DIR)
+    if not os.path.isdir(pending_dir):
+        return
+    for filename in os.listdir(pending_dir):
+        path = os.path.join(pending_dir, filename)
+        if PENDING_DIR + '/' + filename not in in_use and os.path.getmtime(path) < time.time() - PENDING_UPLOAD_MIN_AGE:
+            os.remove(path)
+            print "Removed: " + PENDING_DIR + '/' + filename
+
 if __name__ == "__main__":
-    run()  
\ No newline at end of file
+    run()
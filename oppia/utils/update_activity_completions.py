@@ -0,0 +1,38 @@
+'''
+ Rebuilds the UserActivityCompletion table from the Tracker and
+ TrackerArchive tables, eg after upgrading, or if the table is out of step
+ with the trackers
+
+ For full instructions, see the documentation at 
+ https://oppiamobile.readthedocs.org/en/latest/
+'''
+
+import time
+
+# no of users to rebuild the completions for at a time
+BATCH_SIZE = 100
+
+
+def run(): 
+    
+    from oppia.models import Tracker, TrackerArchive, UserActivityCompletion
+    
+    print 'Rebuilding user activity completions...'
+    start = time.time()
+    
+    # the users with live or archived trackers, and any left with completions
+    # but no trackers
+    user_ids = set(UserActivityCompletion.objects.values_list('user', flat=True).distinct())
+    for model in (Tracker, TrackerArchive):
+        user_ids.update(model.objects.exclude(course__isnull=True).values_list('user', flat=True).distinct())
+    user_ids = sorted(user_ids)
+    for i in range(0, len(user_ids), BATCH_SIZE):
+        UserActivityCompletion.rebuild(user_ids[i:i + BATCH_SIZE])
+        print ('%d/%d users' % (min(i + BATCH_SIZE, len(user_ids)), len(user_ids)))
+    
+    print ('completed, took %.2f seconds' % (time.time() - start))
+    
+if __name__ == "__main__":
+    import django
+    django.setup()
+    run()
@@ -1,33 +1,35 @@
 # oppia/views.py
+import copy
 import datetime
 import json
-from wsgiref.util import FileWrapper
 
 import operator
-import os
-import tablib
 from dateutil.relativedelta import relativedelta
+from django.contrib import messages
 from django.core.paginator import Paginator, InvalidPage, EmptyPage
 from django.core.urlresolvers import reverse
-from django.db.models import Count, Sum
+from django.db.models import Count, Prefetch, Sum
 from django.forms.formsets import formset_factory
-from django.http import HttpResponseRedirect
-from django.shortcuts import render,render_to_response
+from django.http import HttpResponseRedirect, StreamingHttpResponse
+from django.shortcuts import render,render_to_response,get_object_or_404
 from django.template import RequestContext
 from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 
+from oppia.downloads import course_etag, file_response
+from oppia.exports import TRACKER_EXPORT_HEADERS, tracker_rows, csv_lines, ndjson_lines
 from oppia.forms import ActivityScheduleForm, CohortForm
 from oppia.forms import UploadCourseStep1Form, UploadCourseStep2Form, ScheduleForm, DateRangeForm, DateRangeIntervalForm
 from oppia.models import ActivitySchedule, Activity, Points
-from oppia.models import Tracker, Tag, CourseTag, Schedule, CourseCohort
+from oppia.models import Tracker, Tag, CourseTag, Schedule, CourseCohort, PublishJob
 from oppia.permissions import *
 from oppia.profile.models import UserProfile
 from oppia.profile.views import get_paginated_users
-from oppia.quiz.models import Quiz, QuizAttempt, QuizAttemptResponse
+from oppia.publishing import add_job
+from oppia.quiz.models import Quiz, QuizAttempt, QuizAttemptResponse, QuizQuestion, preload_maxscores, quizzes_for_digests
+from oppia.quiz.stats import get_quiz_stats
 from oppia.reports.signals import dashboard_accessed
 from oppia.summary.models import UserCourseSummary, CourseDailyStats
-from uploader import handle_uploaded_file
 
 
 def server_view(request):
@@ -221,12 +223,7 @@ def course_download_view(request, course_id):
         course = Course.objects.get(pk=course_id)
     except Course.DoesNotExist:
         raise Http404()
-    file_to_download = course.getAbsPath();
-    wrapper = FileWrapper(file(file_to_download))
-    response = HttpResponse(wrapper, content_type='application/zip')
-    response['Content-Length'] = os.path.getsize(file_to_download)
-    response['Content-Disposition'] = 'attachment; filename="%s"' %(course.filename)
-    return response
+    return file_response(request, course.getAbsPath(), course.filename, course_etag(course), course.lastupdated_date)
 
 def tag_courses_view(request, tag_id):
     courses, response = can_view_courses_list(request)
@@ -245,12 +242,9 @@ def upload_step1(request):
     if request.method == 'POST':
         form = UploadCourseStep1Form(request.POST,request.FILES)
         if form.is_valid(): # All validation rules pass
-            extract_path = os.path.join(settings.COURSE_UPLOAD_DIR, 'temp', str(request.user.id))
-            course = handle_uploaded_file(request.FILES['course_file'], extract_path, request, request.user)
-            if course:
-                return HttpResponseRedirect(reverse('oppia_upload2', args=[course.id])) # Redirect after POST
-            else:
-                os.remove(settings.COURSE_UPLOAD_DIR + request.FILES['course_file'].name)
+            # the course is imported in the background
+            job = add_job(request.user, request.FILES['course_file'])
+            return HttpResponseRedirect(reverse('oppia_upload_status', args=[job.id])) # Redirect after POST
     else:
         form = UploadCourseStep1Form() # An unbound form
 
@@ -259,6 +253,20 @@ def upload_step1(request):
                                'title':_(u'Upload Course - step 1')},
                               context_instance=RequestContext(request))
 
+def upload_status(request, job_id):
+    job = get_object_or_404(PublishJob, pk=job_id, user=request.user)
+    
+    if job.status == PublishJob.DONE:
+        return HttpResponseRedirect(reverse('oppia_upload2', args=[job.course_id]))
+    elif job.status == PublishJob.FAILED:
+        messages.info(request, job.message)
+        return HttpResponseRedirect(reverse('oppia_upload'))
+    
+    return render_to_response('oppia/upload-status.html', 
+                              {'job': job,
+                               'title':_(u'Upload Course - step 1')},
+                              context_instance=RequestContext(request))
+
 def upload_step2(request, course_id, editing=False):
 
     if editing and not can_edit_course(request, course_id):
@@ -452,23 +460,13 @@ def export_tracker_detail(request,course_id):
     if response is not None:
         return response
     
-    headers = ('Date', 'UserId', 'Type', 'Activity Title', 'Section Title', 'Time Taken', 'IP Address', 'User Agent', 'Language')
-    data = []
-    data = tablib.Dataset(*data, headers=headers)
-    trackers = Tracker.objects.filter(course=course).order_by('-tracker_date')
-    for t in trackers:
-        try:
-            data_dict = json.loads(t.data)
-            if 'lang' in data_dict:
-                lang = data_dict['lang']
-            else:
-                lang = ""
-            data.append((t.tracker_date.strftime('%Y-%m-%d %H:%M:%S'), t.user.id, t.type, t.get_activity_title(), t.get_section_title(), t.time_taken, t.ip, t.agent, lang))
-        except ValueError:
-            data.append((t.tracker_date.strftime('%Y-%m-%d %H:%M:%S'), t.user.id, t.type, "", "", t.time_taken, t.ip, t.agent, ""))
-            
-    response = HttpResponse(data.xls, content_type='application/vnd.ms-excel;charset=utf-8')
-    response['Content-Disposition'] = "attachment; filename=export.xls"
+    rows = tracker_rows(course)
+    if request.GET.get('format') == 'json':
+        response = StreamingHttpResponse(ndjson_lines(TRACKER_EXPORT_HEADERS, rows), content_type='application/x-ndjson;charset=utf-8')
+        response['Content-Disposition'] = "attachment; filename=export.json"
+    else:
+        response = StreamingHttpResponse(csv_lines(TRACKER_EXPORT_HEADERS, rows), content_type='text/csv;charset=utf-8')
+        response['Content-Disposition'] = "attachment; filename=export.csv"
 
     return response
     
@@ -933,15 +931,14 @@ def leaderboard_view(request):
 
 def course_quiz(request,course_id):
     course = check_owner(request,course_id)
-    digests = Activity.objects.filter(section__course=course,type='quiz').order_by('section__order').distinct()
+    digests = Activity.objects.filter(section__course=course,type='quiz').select_related('section').order_by('section__order').distinct()
+    digest_quizzes = quizzes_for_digests([d.digest for d in digests])
     quizzes = []
     for d in digests:
-        try:
-            q = Quiz.objects.get(quizprops__name='digest',quizprops__value=d.digest)
+        if d.digest in digest_quizzes:
+            q = copy.copy(digest_quizzes[d.digest])
             q.section_name = d.section.title
             quizzes.append(q)
-        except Quiz.DoesNotExist:
-            pass
     return render_to_response('oppia/course/quizzes.html',
                               {'course': course, 
                                'quizzes':quizzes}, 
@@ -951,7 +948,9 @@ def course_quiz_attempts(request,course_id,quiz_id):
     # get the quiz digests for this course
     course = check_owner(request,course_id)
     quiz = Quiz.objects.get(pk=quiz_id)
-    attempts = QuizAttempt.objects.filter(quiz=quiz).order_by('-attempt_date')
+    attempts = QuizAttempt.objects.filter(quiz=quiz).select_related('user').order_by('-attempt_date') \
+                          .prefetch_related(Prefetch('quizattemptresponse_set', to_attr='responses',
+                                                     queryset=QuizAttemptResponse.objects.select_related('question')))
     
     paginator = Paginator(attempts, 25)
     # Make sure page request is an int. If not, deliver first page.
@@ -963,28 +962,33 @@ def course_quiz_attempts(request,course_id,quiz_id):
     # If page request (9999) is out of range, deliver last page of results.
     try:
         attempts = paginator.page(page)
-        for a in attempts:
-            a.responses = QuizAttemptResponse.objects.filter(quizattempt=a)                
     except (EmptyPage, InvalidPage):
-        tracks = paginator.page(paginator.num_pages)
-    print  len(attempts)
+        attempts = paginator.page(paginator.num_pages)
+    preload_maxscores([r for a in attempts for r in a.responses])
+
+    stats = get_quiz_stats(quiz)
+    questions = []
+    for qq in QuizQuestion.objects.filter(quiz=quiz).select_related('question').order_by('order'):
+        question = qq.question
+        question.stats = stats.get_question(question.id)
+        questions.append(question)
 
     return render_to_response('oppia/course/quiz-attempts.html',
                               {'course': course,
                                'quiz':quiz, 
+                               'stats': stats,
+                               'questions': questions,
                                'page':attempts}, 
                               context_instance=RequestContext(request))
 
 def course_feedback(request,course_id):
     course = check_owner(request,course_id)
     digests = Activity.objects.filter(section__course=course,type='feedback').order_by('section__order').values('digest').distinct()
+    digest_quizzes = quizzes_for_digests([d['digest'] for d in digests])
     feedback = []
     for d in digests:
-        try:
-            q = Quiz.objects.get(quizprops__name='digest',quizprops__value=d['digest'])
-            feedback.append(q)
-        except Quiz.DoesNotExist:
-            pass
+        if d['digest'] in digest_quizzes:
+            feedback.append(digest_quizzes[d['digest']])
         
     return render_to_response('oppia/course/feedback.html',
                               {'course': course,
@@ -995,7 +999,9 @@ def course_feedback_responses(request,course_id,quiz_id):
     #get the quiz digests for this course
     course = check_owner(request,course_id)
     quiz = Quiz.objects.get(pk=quiz_id)
-    attempts = QuizAttempt.objects.filter(quiz=quiz).order_by('-attempt_date')
+    attempts = QuizAttempt.objects.filter(quiz=quiz).select_related('user').order_by('-attempt_date') \
+                          .prefetch_related(Prefetch('quizattemptresponse_set', to_attr='responses',
+                                                     queryset=QuizAttemptResponse.objects.select_related('question')))
     
     paginator = Paginator(attempts, 25)
     # Make sure page request is an int. If not, deliver first page.
@@ -1007,10 +1013,8 @@ def course_feedback_responses(request,course_id,quiz_id):
     # If page request (9999) is out of range, deliver last page of results.
     try:
         attempts = paginator.page(page)
-        for a in attempts:
-            a.responses = QuizAttemptResponse.objects.filter(quizattempt=a)                
     except (EmptyPage, InvalidPage):
-        tracks = paginator.page(paginator.num_pages)
+        attempts = paginator.page(paginator.num_pages)
 
     return render_to_response('oppia/course/feedback-responses.html',
                               {'course': course,